@@ -1,27 +1,24 @@
-import datetime as dt
-import pprint
+import sys
 
-import pandas as pd
-import matplotlib.pyplot as plt
-import boto3
-from boto3.dynamodb.conditions import Key
+from cli import main
 
-from common.utils import convert_decimal_to_float
 
+def load_from_dynamodb(symbol, start, schema=None):
+    """
+    schema: layout of the table, see common.schema, the legacy "stock"
+      table by default
+    """
+    from common.query import TickQuery
 
-today = dt.date.today()
-market_start = dt.datetime(
-    year=today.year, month=today.month, day=today.day-1, hour=9
-).timestamp()
-table = boto3.resource("dynamodb").Table("stock")
-keycondition = KeyConditionExpression=Key("symbol").eq("AAPL") &\
-    Key("timestamp").gte(int(market_start))
-records = table.query(KeyConditionExpression=keycondition)["Items"]
+    return TickQuery(schema=schema).frame(symbol, start)
 
-records = [
-    convert_decimal_to_float(record) for record in records
-]
 
-df = pd.DataFrame(records)
-df.plot(x="timestamp", y="price")
-plt.show()
+def load_from_tickstore(symbol, start, root=None):
+    from common.tickstore import TickStore, TICK_STORE_DIR
+
+    store = TickStore(root or TICK_STORE_DIR)
+    return store.to_frame(symbol, start=int(start))
+
+
+if __name__ == "__main__":
+    main(["analyze", *sys.argv[1:]])
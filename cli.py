@@ -0,0 +1,275 @@
+"""
+Single entry point of the bot
+
+    python cli.py stream AAPL TSLA --sink local
+    python cli.py fetch-history AAPL --format parquet
+    python cli.py order AAPL BUY 1
+    python cli.py analyze --symbol AAPL --source local
+    python cli.py backtest TSLA --from 2016-01-01 --to 2018-12-31
+
+Parsing the arguments only needs the standard library: every command
+imports what it uses (ibapi, boto3, pandas, matplotlib, backtrader)
+when it runs, so placing an order does not pay for the analysis stack
+and no command touches AWS before it talks to DynamoDB. See
+script/bench_startup.py for the startup time of each command.
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+
+
+def _contracts(symbols, primary_exchange=None):
+    from common.trade import create_contract
+
+    contracts = []
+    for symbol in symbols:
+        contract = create_contract(symbol)
+        if primary_exchange:
+            contract.primaryExchange = primary_exchange
+        contracts.append(contract)
+    return contracts
+
+
+def _fake_app(app_cls, **gateway):
+    """
+    app_cls talking to the fake gateway of common.fakeib instead of TWS
+    """
+    from common.fakeib import FakeGateway, FakeIB
+
+    return type(
+        f"Fake{app_cls.__name__}", (FakeIB, app_cls),
+        {"gateway": FakeGateway(**gateway)},
+    )
+
+
+def _schema(args):
+    from common.schema import make_schema
+
+    return make_schema(args.schema, args.table, args.table_shards,
+                       args.ttl_days)
+
+
+def stream_command(args):
+    from common import metrics
+    from common.recorder import recording, replay_stream
+    from common.sink import FanoutSink
+    from common.stream import IBApp, default_sink, stream, tickstore_sink
+
+    if args.sink == "local":
+        sink = tickstore_sink()
+    else:
+        sink = default_sink(args.interval, args.conflation, _schema(args))
+    if args.bus:
+        from common.tickbus import TickBus
+
+        sink = FanoutSink([sink, TickBus(args.bus)])
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    if args.replay:
+        replay_stream(args.replay, sink, args.speed or None)
+        return
+
+    # only a live session needs contracts, and with them ibapi
+    contracts = _contracts(args.symbols, args.primary_exchange)
+    if args.shards:
+        from common.shards import ShardedStream
+
+        client_ids = range(1, args.shards + 1)
+        with ShardedStream(contracts, sink, client_ids=client_ids) as shards:
+            shards.run()
+    else:
+        app_cls = recording(IBApp, args.record) if args.record else IBApp
+        details = [{"contract": contract} for contract in contracts]
+        try:
+            stream(details, sink=sink, log_ticks=not args.quiet_ticks,
+                   app_cls=app_cls)
+        finally:
+            if args.record:
+                app_cls.recorder.close()
+
+
+def fetch_history_command(args):
+    from common.bar_store import HISTORICAL_DATA_DIR
+    from common.historical_data import TestApp, retrieve_historical_data
+
+    os.makedirs(HISTORICAL_DATA_DIR, exist_ok=True)
+    app_cls = _fake_app(TestApp) if args.fake else TestApp
+    for contract in _contracts(args.symbols, args.primary_exchange):
+        retrieve_historical_data(contract, fmt=args.format, app_cls=app_cls)
+
+
+def order_command(args):
+    from common.trade import IBApp, orderExecution
+    from common.utils import setup_log
+
+    logger = setup_log(__name__, "local")
+    app_cls = _fake_app(IBApp) if args.fake else IBApp
+    logger.debug("Starting the process of %s %s stock",
+                 args.action.lower(), args.symbol)
+    orderExecution(args.symbol, args.action, args.quantity, app_cls=app_cls)
+
+
+def analyze_command(args):
+    import matplotlib.pyplot as plt
+
+    from analysis import load_from_dynamodb, load_from_tickstore
+
+    yesterday = dt.date.today() - dt.timedelta(days=1)
+    market_start = dt.datetime.combine(
+        yesterday, dt.time(hour=9)
+    ).timestamp()
+
+    if args.source == "local":
+        df = load_from_tickstore(args.symbol, market_start, args.store_dir)
+    else:
+        df = load_from_dynamodb(args.symbol, market_start, _schema(args))
+
+    df.plot(x="timestamp", y="price")
+    plt.show()
+
+
+def backtest_command(args):
+    import backtrader as bt
+
+    from common.backtesting import SmaCross
+    from common.feeds import local_feed
+
+    cerebro = bt.Cerebro()
+    cerebro.adddata(local_feed(args.symbol, fromdate=args.fromdate,
+                               todate=args.todate))
+    cerebro.addstrategy(SmaCross, pfast=args.fast, pslow=args.slow)
+    cerebro.broker.setcash(args.cash)
+    cerebro.run()
+    print(f"Final portfolio value: {cerebro.broker.getvalue():.2f}")
+
+
+def _date(value):
+    return dt.datetime.strptime(value, "%Y-%m-%d")
+
+
+def _add_schema_arguments(parser):
+    # mirrors common.schema.SCHEMAS and TTL_DAYS
+    parser.add_argument(
+        "--schema", choices=("legacy", "bucketed"), default="legacy",
+        help="DynamoDB layout, bucketed keys ticks by symbol and day",
+    )
+    parser.add_argument("--table", help="DynamoDB table name")
+    parser.add_argument(
+        "--table-shards", type=int, default=1,
+        help="partitions per symbol and day of a bucketed table",
+    )
+    parser.add_argument(
+        "--ttl-days", type=int, default=30,
+        help="days raw ticks are kept in a bucketed table, 0 for ever",
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stream = commands.add_parser("stream", help="stream real time ticks")
+    stream.set_defaults(run=stream_command)
+    stream.add_argument("symbols", nargs="*", default=["AAPL", "TSLA"])
+    stream.add_argument("--primary-exchange", default="NASDAQ")
+    stream.add_argument(
+        "--sink", choices=["dynamodb", "local"], default="dynamodb"
+    )
+    stream.add_argument(
+        "--interval", type=float, default=1.0,
+        help="conflation interval in seconds, 0 to store every tick",
+    )
+    # mirrors common.ingest.MODES, which would import NumPy
+    stream.add_argument("--conflation", choices=("last", "ohlc"),
+                        default="last")
+    _add_schema_arguments(stream)
+    stream.add_argument(
+        "--quiet-ticks", action="store_true", help="do not log every tick"
+    )
+    stream.add_argument(
+        "--bus", metavar="NAME",
+        help="also publish ticks to a shared memory tick bus, see "
+             "common.tickbus",
+    )
+    stream.add_argument(
+        "--shards", type=int, default=0,
+        help="spread the subscriptions over this many connections, "
+             "client ids 1 to N",
+    )
+    stream.add_argument(
+        "--metrics-port", type=int,
+        help="serve Prometheus metrics on this port",
+    )
+    stream.add_argument(
+        "--record", metavar="PATH",
+        help="record the callbacks of the session, see common.recorder",
+    )
+    stream.add_argument(
+        "--replay", metavar="PATH",
+        help="replay a recorded session into the sink instead of "
+             "connecting",
+    )
+    stream.add_argument(
+        "--speed", type=float, default=1.0,
+        help="replay speed, 1 for real time, 0 as fast as possible",
+    )
+
+    history = commands.add_parser(
+        "fetch-history", help="download historical bars"
+    )
+    history.set_defaults(run=fetch_history_command)
+    history.add_argument("symbols", nargs="+")
+    history.add_argument("--primary-exchange", default="NASDAQ")
+    history.add_argument(
+        "--format", choices=["csv", "npz", "parquet"], default="csv"
+    )
+    history.add_argument(
+        "--fake", action="store_true",
+        help="use the fake gateway of common.fakeib instead of TWS",
+    )
+
+    order = commands.add_parser("order", help="place a market order")
+    order.set_defaults(run=order_command)
+    order.add_argument("symbol")
+    order.add_argument("action", choices=["BUY", "SELL"], type=str.upper)
+    order.add_argument("quantity", type=int)
+    order.add_argument(
+        "--fake", action="store_true",
+        help="use the fake gateway of common.fakeib instead of TWS",
+    )
+
+    analyze = commands.add_parser(
+        "analyze", help="plot yesterday's ticks of a symbol"
+    )
+    analyze.set_defaults(run=analyze_command)
+    analyze.add_argument("--symbol", default="AAPL")
+    analyze.add_argument(
+        "--source", choices=["dynamodb", "local"], default="dynamodb"
+    )
+    analyze.add_argument("--store-dir")
+    _add_schema_arguments(analyze)
+
+    backtest = commands.add_parser(
+        "backtest", help="backtest SmaCross on stored bars"
+    )
+    backtest.set_defaults(run=backtest_command)
+    backtest.add_argument("symbol", nargs="?", default="TSLA")
+    backtest.add_argument("--from", dest="fromdate", type=_date,
+                          default=_date("2016-01-01"))
+    backtest.add_argument("--to", dest="todate", type=_date,
+                          default=_date("2018-12-31"))
+    backtest.add_argument("--fast", type=int, default=10)
+    backtest.add_argument("--slow", type=int, default=30)
+    backtest.add_argument("--cash", type=float, default=10000.0)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
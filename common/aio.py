@@ -0,0 +1,358 @@
+import asyncio
+import time
+from threading import Thread
+
+from ibapi.wrapper import EWrapper
+from ibapi.client import EClient
+from ibapi.contract import Contract
+from ibapi.utils import iswrapper
+
+from .events import is_notice, is_order_rejection
+from .router import RequestRouter
+from .session import DONE_STATUSES
+from .trade import orderCreate
+from .utils import setup_log
+
+
+logger = setup_log(__name__, "local")
+
+
+class IBError(Exception):
+
+    def __init__(self, reqId, errorCode, errorString):
+        super().__init__(
+            f"IB returns an error with {reqId} errorcode {errorCode} "
+            f"that says {errorString}"
+        )
+        self.reqId = reqId
+        self.errorCode = errorCode
+        self.errorString = errorString
+
+
+class AsyncWrapper(EWrapper):
+    """
+    EWrapper handing every callback over to an asyncio event loop.
+
+    Callbacks run on the IB reader thread and only schedule the matching
+    handler with call_soon_threadsafe; the handlers, which resolve the
+    futures and queues awaited by callers, all run on the loop thread,
+    so no locking is needed.
+    """
+
+    def __init__(self, loop):
+        EWrapper.__init__(self)
+        self._loop = loop
+        self._ready = loop.create_future()
+        # reqId -> future of a request answered by a list of items
+        self._requests = {}
+        self._items = {}
+        # reqId -> asyncio.Queue of a market data subscription
+        self._streams = {}
+        # orderId -> (ack future, done future)
+        self._orders = {}
+
+    def _call(self, handler, *args):
+        self._loop.call_soon_threadsafe(handler, *args)
+
+    # reader thread side
+
+    @iswrapper
+    def nextValidId(self, orderId: int):
+        self._call(self._on_ready, orderId)
+
+    @iswrapper
+    def error(self, id, errorCode, errorString):
+        self._call(self._on_error, id, errorCode, errorString)
+
+    @iswrapper
+    def contractDetails(self, reqId, contractDetails):
+        self._call(self._on_item, reqId, contractDetails)
+
+    @iswrapper
+    def contractDetailsEnd(self, reqId):
+        self._call(self._on_end, reqId)
+
+    @iswrapper
+    def historicalData(self, reqId, bar):
+        bardata = (bar.date, bar.open, bar.high, bar.low, bar.close,
+                   bar.volume)
+        self._call(self._on_item, reqId, bardata)
+
+    @iswrapper
+    def historicalDataEnd(self, reqId, start: str, end: str):
+        self._call(self._on_end, reqId)
+
+    @iswrapper
+    def tickPrice(self, reqId, tickType, price, attrib):
+        self._call(self._on_tick, reqId, tickType, price, int(time.time()))
+
+    @iswrapper
+    def orderStatus(
+            self, orderId: int, status: str, filled: float,
+            remaining: float, avgFillPrice: float, permId: int,
+            parentId: int, lastFillPrice: float, clientId: int,
+            whyHeld: str, mktCapPrice: float
+    ):
+        self._call(self._on_order_status, orderId, status, filled,
+                   remaining, avgFillPrice)
+
+    # event loop side
+
+    def _on_ready(self, orderId):
+        self.nextOrderId = orderId
+        if not self._ready.done():
+            self._ready.set_result(orderId)
+
+    def _on_error(self, reqId, errorCode, errorString):
+        if is_notice(errorCode):
+            logger.debug("IB notice %s: %s", errorCode, errorString)
+            return
+        error = IBError(reqId, errorCode, errorString)
+        if reqId in self._requests:
+            self._items.pop(reqId, None)
+            future = self._requests.pop(reqId)
+            if not future.done():
+                future.set_exception(error)
+        elif reqId in self._streams:
+            self._streams[reqId].put_nowait(error)
+        elif reqId in self._orders:
+            if not is_order_rejection(errorCode):
+                # the order stays live, wait for its final status
+                logger.debug(str(error))
+                return
+            for future in self._orders.pop(reqId):
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            logger.debug(str(error))
+
+    def _on_item(self, reqId, item):
+        if reqId in self._items:
+            self._items[reqId].append(item)
+
+    def _on_end(self, reqId):
+        future = self._requests.pop(reqId, None)
+        items = self._items.pop(reqId, [])
+        if future is not None and not future.done():
+            future.set_result(items)
+
+    def _on_tick(self, reqId, tickType, price, timestamp):
+        stream = self._streams.get(reqId)
+        if stream is not None and price > 0:
+            stream.put_nowait((tickType, price, timestamp))
+
+    def _on_order_status(self, orderId, status, filled, remaining,
+                         avgFillPrice):
+        futures = self._orders.get(orderId)
+        if futures is None:
+            return
+        ack, done = futures
+        result = {
+            "order_id": orderId,
+            "Status": status,
+            "Filled": filled,
+            "Remaining": remaining,
+            "AvgFillPrice": avgFillPrice,
+        }
+        if not ack.done():
+            ack.set_result(result)
+        if status in DONE_STATUSES:
+            if not done.done():
+                done.set_result(result)
+            del self._orders[orderId]
+
+
+def _retrieve_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class Subscription:
+    """
+    Market data subscription of AsyncIBApp.subscribe, an async iterator
+    of tick dicts and an async context manager cancelling it on exit
+    """
+
+    def __init__(self, app, reqId, contract):
+        self.app = app
+        self.reqId = reqId
+        self.contract = contract
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        stream = self.app._streams.get(self.reqId)
+        if stream is None:
+            raise StopAsyncIteration
+        item = await stream.get()
+        if isinstance(item, IBError):
+            self.close()
+            raise item
+        tickType, price, timestamp = item
+        return {
+            "symbol": self.contract.symbol,
+            "timestamp": timestamp,
+            "price": price,
+            "tick_type": tickType,
+        }
+
+    def close(self):
+        """
+        Cancels the market data line and releases its request id
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.app._streams.pop(self.reqId, None)
+        self.app.router.release(self.reqId)
+        if self.app.isConnected():
+            self.app.cancelMktData(self.reqId)
+
+
+class AsyncIBApp(AsyncWrapper, EClient):
+    """
+    asyncio API over one IB connection, multiplexing any number of
+    outstanding requests:
+
+        app = await AsyncIBApp.create("127.0.0.1", 7497, 2)
+        contract = await app.resolve_contract(contract)
+        bars = await app.historical_bars(contract)
+        async with app.subscribe(contract) as ticks:
+            async for tick in ticks:
+                ...
+        status = await app.place_order(contract, "BUY", 1)
+        app.disconnect()
+    """
+
+    def __init__(self, loop=None):
+        loop = loop or asyncio.get_running_loop()
+        AsyncWrapper.__init__(self, loop)
+        EClient.__init__(self, wrapper=self)
+        self.router = RequestRouter()
+
+    @classmethod
+    async def create(cls, ipaddress, portid, clientid, timeout=10):
+        """
+        Connects, starts the reader thread and waits for nextValidId
+        """
+        app = cls()
+        # connecting blocks on the socket handshake, keep it off the loop
+        await app._loop.run_in_executor(
+            None, app.connect, ipaddress, portid, clientid
+        )
+        thread = Thread(target=app.run, daemon=True)
+        thread.start()
+        setattr(app, "_thread", thread)
+        await asyncio.wait_for(asyncio.shield(app._ready), timeout)
+        return app
+
+    def next_request_id(self):
+        return self.router.allocate()
+
+    def _release(self, reqId):
+        self._requests.pop(reqId, None)
+        self._items.pop(reqId, None)
+        self.router.release(reqId)
+
+    def _request(self, reqId):
+        future = self._loop.create_future()
+        self._requests[reqId] = future
+        self._items[reqId] = []
+        return future
+
+    async def resolve_contract(self, contract: Contract, timeout=10):
+        """
+        From a partially formed contract, returns a fully fledged version
+        """
+        reqId = self.next_request_id()
+        future = self._request(reqId)
+        self.reqContractDetails(reqId, contract)
+        try:
+            details = await asyncio.wait_for(future, timeout)
+        finally:
+            self._release(reqId)
+
+        if not details:
+            logger.debug("Failed to get additional contract details")
+            return contract
+        if len(details) > 1:
+            logger.debug("got multiple contracts using first one")
+        return details[0].contract
+
+    async def historical_bars(
+            self,
+            contract: Contract,
+            durationStr="1 Y",
+            barSizeSetting="1 day",
+            endDateTime="",
+            whatToShow="TRADES",
+            timeout=60,
+    ):
+        """
+        Returns bars as (date, open, high, low, close, volume) tuples,
+        like TestClient.get_IB_historical_data
+        """
+        reqId = self.next_request_id()
+        future = self._request(reqId)
+        self.reqHistoricalData(
+            reqId, contract, endDateTime, durationStr, barSizeSetting,
+            whatToShow, 1, 1, False, [],
+        )
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.cancelHistoricalData(reqId)
+            raise
+        finally:
+            self._release(reqId)
+
+    def subscribe(self, contract: Contract, genericTickList=""):
+        """
+        Streams market data for a contract, yielding tick dicts shaped
+        like the ones IBWrapper.tickPrice hands to its sink:
+
+            async with app.subscribe(contract) as ticks:
+                async for tick in ticks:
+                    ...
+
+        The subscription is cancelled when the async with block exits,
+        whether the loop finished, broke out or raised.
+        """
+        reqId = self.next_request_id()
+        self._streams[reqId] = asyncio.Queue()
+        self.reqMktData(reqId, contract, genericTickList, False, False, [])
+        return Subscription(self, reqId, contract)
+
+    async def place_order(self, contract: Contract, action, quantity,
+                          order=None, wait_for_fill=False, timeout=30):
+        """
+        Places an order and returns its first status, or its final
+        status (Filled, Cancelled...) with wait_for_fill
+        """
+        order = order or orderCreate(action, quantity)
+        orderId = self.nextOrderId
+        self.nextOrderId += 1
+
+        ack = self._loop.create_future()
+        done = self._loop.create_future()
+        # only one of the two is awaited, retrieve the other's error so
+        # asyncio does not report it as never retrieved
+        for future in (ack, done):
+            future.add_done_callback(_retrieve_exception)
+        self._orders[orderId] = (ack, done)
+        self.placeOrder(orderId, contract, order)
+        try:
+            return await asyncio.wait_for(
+                done if wait_for_fill else ack, timeout
+            )
+        finally:
+            # left behind when the awaited status never came
+            self._orders.pop(orderId, None)
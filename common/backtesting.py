@@ -1,6 +1,8 @@
 from datetime import datetime
 import backtrader as bt
 
+from common.feeds import local_feed
+
 # Create a subclass of Strategy to define the indicators and logic
 
 class SmaCross(bt.Strategy):
@@ -16,7 +18,6 @@ class SmaCross(bt.Strategy):
         self.crossover = bt.ind.CrossOver(sma1, sma2)  # crossover signal
 
     def next(self):
-        print(self.position)
         if not self.position:  # not in the market
             if self.crossover > 0:  # if fast crosses slow to the upside
                 self.buy()  # enter long
@@ -25,15 +26,16 @@ class SmaCross(bt.Strategy):
             self.close()  # close long position
 
 
-cerebro = bt.Cerebro()  # create a "Cerebro" engine instance
+if __name__ == "__main__":
+    cerebro = bt.Cerebro()  # create a "Cerebro" engine instance
 
-# Create a data feed
-data = bt.feeds.YahooFinanceData(dataname='TSLA',
-                                 fromdate=datetime(2016, 1, 1),
-                                 todate=datetime(2018, 12, 31))
+    # Create a data feed from the bars stored by historical_data
+    data = local_feed('TSLA',
+                      fromdate=datetime(2016, 1, 1),
+                      todate=datetime(2018, 12, 31))
 
-cerebro.adddata(data)  # Add the data feed
+    cerebro.adddata(data)  # Add the data feed
 
-cerebro.addstrategy(SmaCross)  # Add the trading strategy
-cerebro.run()  # run it all
-# cerebro.plot()  # and plot it with a single command
+    cerebro.addstrategy(SmaCross)  # Add the trading strategy
+    cerebro.run()  # run it all
+    # cerebro.plot()  # and plot it with a single command
@@ -0,0 +1,251 @@
+import csv
+import datetime
+import json
+import math
+import os
+import tempfile
+
+from ibapi.contract import Contract
+
+from .historical_data import TestApp
+from .utils import setup_log
+
+
+CACHE_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+    "historical_data",
+    "cache",
+)
+MANIFEST = "manifest.json"
+FIELDNAMES = ["Date", "Open", "High", "Low", "Close", "Volume"]
+
+logger = setup_log(__name__, "local")
+
+
+def bar_day(bar_date):
+    """
+    Date of a bar as returned by IB with formatDate=1, either
+    "YYYYMMDD" or "YYYYMMDD  HH:MM:SS"
+    """
+    return datetime.datetime.strptime(str(bar_date)[:8], "%Y%m%d").date()
+
+
+def duration_for(start, end):
+    """
+    Smallest IB durationStr covering the days from start to end
+    """
+    days = (end - start).days + 1
+    if days <= 365:
+        return f"{days} D"
+    return f"{math.ceil(days / 365)} Y"
+
+
+def merge_ranges(ranges):
+    """
+    Merges overlapping or adjacent (start, end) date ranges
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + datetime.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def atomic_write(path, write):
+    """
+    Calls write(fout) on a temporary file next to path and moves it in
+    place, so readers see either the old or the new file
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as fout:
+            write(fout)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class BarCache:
+    """
+    Per symbol and bar size cache of historical bars.
+
+    Bars are kept in one CSV file per symbol/bar size, and a manifest
+    records which date ranges have already been fetched, so that a
+    refresh only asks IB for the missing days.
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.manifest_path = os.path.join(root, MANIFEST)
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as fin:
+                self.manifest = json.load(fin)
+
+    @staticmethod
+    def _key(symbol, barSizeSetting):
+        return f"{symbol}|{barSizeSetting}"
+
+    def path(self, symbol, barSizeSetting):
+        bar_size = barSizeSetting.replace(" ", "")
+        return os.path.join(self.root, f"{symbol}_{bar_size}.csv")
+
+    def covered(self, symbol, barSizeSetting):
+        return [
+            (datetime.date.fromisoformat(start),
+             datetime.date.fromisoformat(end))
+            for start, end in self.manifest.get(
+                self._key(symbol, barSizeSetting), [])
+        ]
+
+    def missing(self, symbol, barSizeSetting, start, end):
+        """
+        Returns the (start, end) date ranges between start and end that
+        are not in the cache yet
+        """
+        gaps = []
+        cursor = start
+        covered = self.covered(symbol, barSizeSetting)
+        for covered_start, covered_end in covered:
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                gaps.append(
+                    (cursor, covered_start - datetime.timedelta(days=1))
+                )
+            cursor = covered_end + datetime.timedelta(days=1)
+        if cursor <= end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def read(self, symbol, barSizeSetting):
+        """
+        Returns the cached bars as tuples of strings, sorted by date
+        """
+        path = self.path(symbol, barSizeSetting)
+        if not os.path.exists(path):
+            return []
+        with open(path, newline="") as fin:
+            reader = csv.reader(fin)
+            next(reader, None)
+            return [tuple(row) for row in reader]
+
+    def store(self, symbol, barSizeSetting, bars, start, end):
+        """
+        Merges freshly fetched bars into the cache and marks start to
+        end as covered
+
+        New bars are appended when they all come after the cached ones,
+        otherwise the file is rewritten sorted and de-duplicated by date.
+        A day is only marked covered once it is over, so today's bar,
+        which is still moving, is fetched again on the next refresh.
+        """
+        path = self.path(symbol, barSizeSetting)
+        cached = self.read(symbol, barSizeSetting)
+        bars = sorted(
+            {str(bar[0]): bar for bar in bars}.values(),
+            key=lambda bar: str(bar[0]),
+        )
+
+        if bars and (not cached or str(bars[0][0]) > cached[-1][0]):
+            write_header = not os.path.exists(path)
+            with open(path, "a", newline="") as fout:
+                writer = csv.writer(fout)
+                if write_header:
+                    writer.writerow(FIELDNAMES)
+                writer.writerows(bars)
+        elif bars:
+            merged = {row[0]: row for row in cached}
+            merged.update((str(bar[0]), bar) for bar in bars)
+
+            def write(fout):
+                writer = csv.writer(fout)
+                writer.writerow(FIELDNAMES)
+                writer.writerows(merged[date] for date in sorted(merged))
+
+            atomic_write(path, write)
+
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        end = min(end, yesterday)
+        if start <= end:
+            ranges = self.covered(symbol, barSizeSetting) + [(start, end)]
+            self.manifest[self._key(symbol, barSizeSetting)] = [
+                [range_start.isoformat(), range_end.isoformat()]
+                for range_start, range_end in merge_ranges(ranges)
+            ]
+            self._save_manifest()
+
+    def _save_manifest(self):
+        atomic_write(
+            self.manifest_path,
+            lambda fout: json.dump(self.manifest, fout, indent=2),
+        )
+
+    def update(
+            self,
+            app,
+            contract: Contract,
+            start=None,
+            end=None,
+            barSizeSetting="1 day",
+    ):
+        """
+        Fetches the bars of the missing date ranges between start and
+        end (the last year up to today by default) and stores them
+
+        Params:
+            app: a connected TestApp
+            contract: a resolved contract
+
+        Return
+            number of bars fetched
+        """
+        end = end or datetime.date.today()
+        start = start or end - datetime.timedelta(days=365)
+
+        fetched = 0
+        for gap_start, gap_end in self.missing(
+                contract.symbol, barSizeSetting, start, end):
+            logger.debug(
+                "Fetching %s %s bars from %s to %s", contract.symbol,
+                barSizeSetting, gap_start, gap_end,
+            )
+            bars = app.get_IB_historical_data(
+                contract,
+                durationStr=duration_for(gap_start, gap_end),
+                barSizeSetting=barSizeSetting,
+                endDateTime=f"{gap_end:%Y%m%d} 23:59:59",
+            )
+
+            bars = [
+                bar for bar in bars
+                if gap_start <= bar_day(bar[0]) <= gap_end
+            ]
+            self.store(contract.symbol, barSizeSetting, bars,
+                       gap_start, gap_end)
+            fetched += len(bars)
+
+        return fetched
+
+
+def refresh_historical_data(contract: Contract, start=None, end=None,
+                            barSizeSetting="1 day", cache=None):
+    """
+    Cached counterpart of retrieve_historical_data: only the bars
+    missing from the cache are requested from the server
+    """
+    cache = cache or BarCache()
+    app = TestApp("127.0.0.1", 7497, 1)
+    try:
+        resolved_ibcontract = app.resolve_ib_contract(contract)
+        return cache.update(app, resolved_ibcontract, start, end,
+                            barSizeSetting)
+    finally:
+        app.disconnect()
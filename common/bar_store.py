@@ -0,0 +1,195 @@
+import csv
+import datetime
+import importlib.util
+import os
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from .utils import setup_log
+
+
+# parquet support is optional, pyarrow is imported when first needed
+HAS_PARQUET = importlib.util.find_spec("pyarrow") is not None
+ROOT_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+HISTORICAL_DATA_DIR = os.path.join(ROOT_DIR, "historical_data")
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+BAR_COLUMNS = {
+    "date": np.dtype("int64"),
+    "open": np.dtype("float64"),
+    "high": np.dtype("float64"),
+    "low": np.dtype("float64"),
+    "close": np.dtype("float64"),
+    "volume": np.dtype("int64"),
+}
+CSV_FIELDNAMES = ["Date", "Open", "High", "Low", "Close", "Volume"]
+FORMATS = {".csv": "csv", ".npz": "npz", ".parquet": "parquet"}
+ROW_GROUP_SIZE = 64 * 1024
+
+logger = setup_log(__name__, "local")
+
+
+def parse_ib_date(value):
+    """
+    Converts a bar date as sent by IB to epoch seconds
+
+    Handles "YYYYMMDD", "YYYYMMDD  HH:MM:SS" with an optional trailing
+    time zone name (naive dates are taken as UTC) and epoch seconds as
+    sent with formatDate=2.
+    """
+    value = str(value).strip()
+    if value.isdigit() and len(value) != 8:
+        return int(value)
+
+    parts = value.split()
+    timezone = datetime.timezone.utc
+    if len(parts) > 2:
+        timezone = ZoneInfo(parts[2])
+    if len(parts) > 1:
+        moment = datetime.datetime.strptime(
+            f"{parts[0]} {parts[1]}", "%Y%m%d %H:%M:%S")
+    else:
+        moment = datetime.datetime.strptime(parts[0], "%Y%m%d")
+    return int(moment.replace(tzinfo=timezone).timestamp())
+
+
+def bars_to_columns(bars):
+    """
+    Turns bar tuples (date, open, high, low, close, volume) into typed
+    column arrays, parsing the dates once
+    """
+    count = len(bars)
+    rows = list(zip(*bars)) if count else [()] * len(BAR_COLUMNS)
+    columns = {}
+    for (name, dtype), values in zip(BAR_COLUMNS.items(), rows):
+        if name == "date":
+            values = (parse_ib_date(value) for value in values)
+        elif dtype.kind == "i":
+            values = (int(value) for value in values)
+        else:
+            values = (float(value) for value in values)
+        columns[name] = np.fromiter(values, dtype=dtype, count=count)
+    return columns
+
+
+def bar_format(path):
+    extension = os.path.splitext(path)[1]
+    try:
+        return FORMATS[extension]
+    except KeyError:
+        raise ValueError(f"Unknown bar file format: {path}")
+
+
+def find_bars(symbol, directories=(HISTORICAL_DATA_DIR, DATA_DIR)):
+    """
+    Path of the stored bars of a symbol, binary formats first
+
+    Return
+        the first existing file, or None
+    """
+    preferred = [".npz", ".csv"]
+    if HAS_PARQUET:
+        preferred.insert(0, ".parquet")
+    for directory in directories:
+        for extension in preferred:
+            path = os.path.join(directory, f"{symbol}{extension}")
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def _parquet():
+    """
+    Return
+        the pyarrow and pyarrow.parquet modules
+    """
+    if not HAS_PARQUET:
+        raise ImportError("pyarrow is required for the parquet bar format")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    return pa, pq
+
+
+def write_bars(path, bars):
+    """
+    Writes bar tuples as returned by get_IB_historical_data, the format
+    being chosen from the file extension (.csv, .npz or .parquet).
+
+    CSV keeps the text layout of write_to_csv, the binary formats store
+    typed columns with dates as int64 epoch seconds.
+    """
+    fmt = bar_format(path)
+    if fmt == "csv":
+        with open(path, "w", newline="") as fout:
+            writer = csv.writer(fout)
+            writer.writerow(CSV_FIELDNAMES)
+            writer.writerows(bars)
+        return
+
+    columns = bars_to_columns(bars)
+    order = np.argsort(columns["date"], kind="stable")
+    columns = {name: column[order] for name, column in columns.items()}
+
+    if fmt == "npz":
+        np.savez_compressed(path, **columns)
+    else:
+        pa, pq = _parquet()
+        pq.write_table(
+            pa.table(columns), path,
+            compression="zstd", row_group_size=ROW_GROUP_SIZE,
+        )
+
+
+def _read_csv(path):
+    with open(path, newline="") as fin:
+        reader = csv.reader(fin)
+        next(reader, None)
+        return bars_to_columns([tuple(row) for row in reader])
+
+
+def _slice(dates, start, end):
+    lo, hi = 0, len(dates)
+    if start is not None:
+        lo = np.searchsorted(dates, start, side="left")
+    if end is not None:
+        hi = np.searchsorted(dates, end, side="right")
+    return slice(lo, hi)
+
+
+def read_bars(path, columns=None, start=None, end=None):
+    """
+    Reads bars back as a dict of NumPy arrays
+
+    Params:
+        columns: names from BAR_COLUMNS to load, all of them by default
+        start, end: epoch seconds bounding the dates (inclusive)
+
+    Only the requested columns are decompressed from npz files, and
+    parquet row groups outside the date range are skipped.
+    """
+    columns = list(columns or BAR_COLUMNS)
+    fmt = bar_format(path)
+
+    if fmt == "parquet":
+        _, pq = _parquet()
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", start))
+        if end is not None:
+            filters.append(("date", "<=", end))
+        table = pq.read_table(
+            path, columns=columns, filters=filters or None
+        )
+        return {
+            name: table.column(name).to_numpy() for name in columns
+        }
+
+    if fmt == "npz":
+        with np.load(path) as data:
+            window = _slice(data["date"], start, end)
+            return {name: data[name][window] for name in columns}
+
+    data = _read_csv(path)
+    window = _slice(data["date"], start, end)
+    return {name: data[name][window] for name in columns}
@@ -0,0 +1,277 @@
+import time
+from array import array
+from threading import Event, Lock, Thread
+
+import numpy as np
+
+from .utils import setup_log
+
+
+INTERVALS = {"1s": 1, "5s": 5, "1m": 60, "5m": 300, "15m": 900, "1h": 3600}
+CAPACITY = 4096
+# the timer closes bars this long after their end, for ticks stamped
+# just before the boundary to get in
+GRACE = 0.05
+# IB tick types carrying trade prices: LAST and DELAYED_LAST
+LAST_TICK_TYPES = (4, 68)
+FIELDS = ("start", "open", "high", "low", "close", "volume", "ticks")
+INTEGER_FIELDS = ("start", "volume", "ticks")
+
+logger = setup_log(__name__, "local")
+
+
+def _typecode(field):
+    return "q" if field in INTEGER_FIELDS else "d"
+
+
+class BarBuffer:
+    """
+    Ring of preallocated bar columns for one symbol.
+
+    Every field is a flat array.array, so updating a bar does not
+    allocate, and columns() exposes the same memory as NumPy arrays.
+    The slot at the write position holds the bar being built.
+    """
+
+    __slots__ = ("symbol", "capacity", "start", "open", "high", "low",
+                 "close", "volume", "ticks", "length", "position", "live")
+
+    def __init__(self, symbol, capacity=CAPACITY):
+        self.symbol = symbol
+        self.capacity = capacity
+        for field in FIELDS:
+            setattr(
+                self, field, array(_typecode(field), bytes(8 * capacity))
+            )
+        # number of completed bars kept and slot of the current bar
+        self.length = 0
+        self.position = 0
+        self.live = False
+
+    def columns(self, count=None):
+        """
+        Completed bars, oldest first, as a dict of NumPy arrays. These
+        are views on the buffer unless the ring has wrapped.
+        """
+        count = self.length if count is None else min(count, self.length)
+        end = self.position
+        begin = end - count
+        data = {}
+        for field in FIELDS:
+            column = np.frombuffer(
+                getattr(self, field), dtype=_typecode(field)
+            )
+            if begin >= 0:
+                data[field] = column[begin:end]
+            else:
+                data[field] = np.concatenate(
+                    (column[begin:], column[:end])
+                )
+        return data
+
+
+class Bar:
+    """
+    Read-only view of one slot of a BarBuffer, valid until the ring
+    wraps around onto it
+    """
+
+    __slots__ = ("_buffer", "_index")
+
+    def __init__(self, buffer, index):
+        self._buffer = buffer
+        self._index = index
+
+    @property
+    def symbol(self):
+        return self._buffer.symbol
+
+    @property
+    def start(self):
+        return self._buffer.start[self._index]
+
+    @property
+    def open(self):
+        return self._buffer.open[self._index]
+
+    @property
+    def high(self):
+        return self._buffer.high[self._index]
+
+    @property
+    def low(self):
+        return self._buffer.low[self._index]
+
+    @property
+    def close(self):
+        return self._buffer.close[self._index]
+
+    @property
+    def volume(self):
+        return self._buffer.volume[self._index]
+
+    @property
+    def ticks(self):
+        return self._buffer.ticks[self._index]
+
+    def to_tuple(self):
+        """
+        Copies the bar out of the buffer, in the same order as the bars
+        returned by get_IB_historical_data plus the start time
+        """
+        return (self.start, self.open, self.high, self.low, self.close,
+                self.volume)
+
+    def __repr__(self):
+        return (
+            f"Bar({self.symbol} {self.start} O={self.open} H={self.high} "
+            f"L={self.low} C={self.close} V={self.volume})"
+        )
+
+
+class BarAggregator:
+    """
+    Builds OHLCV bars from the tick stream into per-symbol BarBuffers.
+
+    It follows the sink interface of common.sink, so it can be handed
+    to common.stream.stream or combined with other sinks in a
+    FanoutSink. Every completed bar is passed to on_bar as a Bar view.
+
+    Without a timer a bar is completed by the first tick of a later
+    interval, or by flush(). With timer=True a daemon thread calls
+    flush() grace seconds after every wall-clock boundary, so the bars
+    of quiet symbols close on time; on_bar is then called from that
+    thread too. A tick arriving after its bar was closed is counted in
+    late and left out.
+
+    Params:
+        interval: bar length in seconds, or a key of INTERVALS
+        capacity: number of bar slots per symbol, the bar being built
+            included
+        on_bar: callable taking a completed Bar
+        tick_types: tick types treated as trades
+        timer: close bars on wall-clock boundaries, see start_timer
+    """
+
+    def __init__(self, interval=60, capacity=CAPACITY, on_bar=None,
+                 tick_types=LAST_TICK_TYPES, timer=False, grace=GRACE):
+        self.interval = INTERVALS.get(interval, interval)
+        self.capacity = capacity
+        self.on_bar = on_bar
+        self.tick_types = set(tick_types)
+        self.buffers = {}
+        self.late = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._timer = None
+        if timer:
+            self.start_timer(grace)
+
+    def start_timer(self, grace=GRACE):
+        """
+        Calls flush() from a daemon thread grace seconds after every
+        interval boundary, until close()
+        """
+
+        def run():
+            while True:
+                now = time.time()
+                boundary = now - now % self.interval + self.interval
+                if self._stop.wait(boundary + grace - now):
+                    return
+                self.flush()
+
+        thread = Thread(target=run, name="bar-timer", daemon=True)
+        thread.start()
+        self._timer = thread
+
+    def put(self, tick):
+        if tick.get("tick_type") not in self.tick_types:
+            return True
+        with self._lock:
+            return self._put(tick)
+
+    def _put(self, tick):
+        buffer = self.buffers.get(tick["symbol"])
+        if buffer is None:
+            buffer = self.buffers[tick["symbol"]] = BarBuffer(
+                tick["symbol"], self.capacity
+            )
+
+        price = float(tick["price"])
+        size = tick.get("size", 0)
+        timestamp = tick["timestamp"]
+        start = int(timestamp - timestamp % self.interval)
+        index = buffer.position
+
+        if buffer.live and start < buffer.start[index] or \
+                not buffer.live and buffer.length and \
+                start <= buffer.start[index - 1]:
+            # its bar is already closed
+            self.late += 1
+            return True
+
+        if buffer.live and buffer.start[index] != start:
+            self._complete(buffer)
+            index = buffer.position
+
+        if not buffer.live:
+            buffer.live = True
+            buffer.start[index] = start
+            buffer.open[index] = buffer.high[index] = price
+            buffer.low[index] = buffer.close[index] = price
+            buffer.volume[index] = size
+            buffer.ticks[index] = 1
+            return True
+
+        if price > buffer.high[index]:
+            buffer.high[index] = price
+        elif price < buffer.low[index]:
+            buffer.low[index] = price
+        buffer.close[index] = price
+        buffer.volume[index] += size
+        buffer.ticks[index] += 1
+        return True
+
+    def _complete(self, buffer):
+        index = buffer.position
+        buffer.live = False
+        buffer.position = (index + 1) % buffer.capacity
+        # one slot is always left for the bar being built
+        if buffer.length < buffer.capacity - 1:
+            buffer.length += 1
+        if self.on_bar is not None:
+            self.on_bar(Bar(buffer, index))
+
+    def flush(self, now=None):
+        """
+        Completes the bars whose interval is over, for symbols that
+        have not ticked since
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for buffer in self.buffers.values():
+                if buffer.live and \
+                        buffer.start[buffer.position] + self.interval <= now:
+                    self._complete(buffer)
+
+    def bars(self, symbol, count=None):
+        """
+        Last count completed bars of a symbol as a dict of columns
+        """
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            return {
+                field: np.empty(0, dtype=_typecode(field))
+                for field in FIELDS
+            }
+        return buffer.columns(count)
+
+    def close(self, timeout=None):
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join(timeout)
+        with self._lock:
+            for buffer in self.buffers.values():
+                if buffer.live:
+                    self._complete(buffer)
@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+import numpy as np
+
+
+# DynamoDB numbers come back as Decimal and floats are refused on
+# writes, these convert whole columns at once instead of item by item
+
+
+def parse_numbers(strings, dtype):
+    """
+    Parses a list of DynamoDB number strings into an array of dtype in
+    one call. Integer dtypes keep every digit and refuse fractional
+    values rather than truncating them, so sort keys, which are
+    fractional seconds (common.ingest.SortKeys), have to be read as
+    float64.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iub":
+        return np.array(strings).astype(dtype)
+    return np.array(strings, dtype=np.float64).astype(dtype, copy=False)
+
+
+def items_to_columns(items, dtypes):
+    """
+    Converts a list of DynamoDB items into one NumPy array per field
+
+    Params:
+        items: list of dicts as returned by a table resource, numbers
+            being Decimal
+        dtypes: dict of field to dtype, fields missing from an item
+            are read as 0 (or "" for string dtypes), see parse_numbers
+
+    Return
+        dict of field to array
+    """
+    columns = {}
+    for field, dtype in dtypes.items():
+        dtype = np.dtype(dtype)
+        if dtype.kind in "USO":
+            columns[field] = np.array(
+                [item.get(field, "") for item in items], dtype=dtype
+            )
+        else:
+            columns[field] = parse_numbers(
+                [str(item.get(field, 0)) for item in items], dtype
+            )
+    return columns
+
+
+def to_decimals(values):
+    """
+    Converts an array or list of numbers to a list of Decimal, floats
+    keeping their shortest repr like Decimal(str(value)) would.
+
+    Building a Decimal is what costs, and prices repeat a lot within a
+    batch, so each distinct value is converted only once.
+    """
+    values = np.asarray(values)
+    uniques, inverse = np.unique(values, return_inverse=True)
+    if values.dtype.kind in "iub":
+        decimals = [Decimal(value) for value in uniques.tolist()]
+    else:
+        decimals = list(map(Decimal, map(repr, uniques.tolist())))
+    return [decimals[index] for index in inverse.ravel().tolist()]
+
+
+def columns_to_items(columns):
+    """
+    Reverse of items_to_columns: builds the list of items to write from
+    a dict of field to array, floats becoming Decimal
+    """
+    fields = list(columns)
+    converted = []
+    for field in fields:
+        values = np.asarray(columns[field])
+        if values.dtype.kind in "fiub":
+            converted.append(to_decimals(values))
+        else:
+            converted.append(values.tolist())
+    return [dict(zip(fields, row)) for row in zip(*converted)]
+
+
+def encode_item(item):
+    """
+    Makes an item writable to DynamoDB, replacing its float values by
+    Decimal. Items hold a handful of fields, copying each one costs as
+    much as converting it, so unlike columns there is nothing to gain
+    from converting a batch of items at once (script/bench_codec.py).
+    """
+    return {
+        field: Decimal(repr(value)) if type(value) is float else value
+        for field, value in item.items()
+    }
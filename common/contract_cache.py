@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from ibapi.contract import Contract
+
+from .utils import setup_log
+
+
+CACHE_PATH = os.path.join(
+    os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+    "contracts.sqlite",
+)
+# contract details rarely change, refresh them weekly
+DEFAULT_TTL = 7 * 24 * 3600
+PREFETCH_WORKERS = 8
+
+logger = setup_log(__name__, "local")
+
+
+def contract_key(contract: Contract):
+    return "|".join(
+        str(getattr(contract, field, "") or "")
+        for field in ("symbol", "secType", "exchange", "currency")
+    )
+
+
+def contract_to_dict(contract: Contract):
+    """
+    Plain attributes of a contract, leaving out combo legs and other
+    nested objects
+    """
+    return {
+        name: value for name, value in vars(contract).items()
+        if isinstance(value, (str, int, float, bool))
+    }
+
+
+def contract_from_dict(data):
+    contract = Contract()
+    for name, value in data.items():
+        setattr(contract, name, value)
+    return contract
+
+
+class ContractCache:
+    """
+    Resolved contracts keyed by symbol/secType/exchange/currency.
+
+    Entries are persisted in a SQLite file and loaded into memory when
+    the cache is opened, so a contract is looked up on the server at
+    most once per ttl seconds across runs.
+
+    Params:
+        path: SQLite file, ":memory:" for a cache that is not persisted
+        ttl: seconds after which an entry is resolved again
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS contracts ("
+            "key TEXT PRIMARY KEY, contract TEXT, resolved_at REAL)"
+        )
+        self._memory = {
+            key: (json.loads(contract), resolved_at)
+            for key, contract, resolved_at in self._db.execute(
+                "SELECT key, contract, resolved_at FROM contracts "
+                "WHERE resolved_at > ?", (time.time() - ttl,)
+            )
+        }
+
+    def get(self, contract: Contract):
+        """
+        Return
+            the cached resolved contract, or None if missing or expired
+        """
+        entry = self._memory.get(contract_key(contract))
+        if entry is None or entry[1] <= time.time() - self.ttl:
+            return None
+        return contract_from_dict(entry[0])
+
+    def put(self, contract: Contract, resolved: Contract):
+        key = contract_key(contract)
+        data = contract_to_dict(resolved)
+        resolved_at = time.time()
+        with self._lock:
+            self._memory[key] = (data, resolved_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO contracts VALUES (?, ?, ?)",
+                (key, json.dumps(data), resolved_at),
+            )
+            self._db.commit()
+
+    def resolve(self, app, contract: Contract):
+        """
+        Cached counterpart of app.resolve_ib_contract(contract)
+        """
+        resolved = self.get(contract)
+        if resolved is not None:
+            return resolved
+
+        resolved = app.resolve_ib_contract(contract)
+        # resolve_ib_contract hands back the input when the lookup fails
+        if resolved is not contract and getattr(resolved, "conId", 0):
+            self.put(contract, resolved)
+        return resolved
+
+    def prefetch(self, app, contracts, max_workers=PREFETCH_WORKERS):
+        """
+        Resolves every contract of a universe missing from the cache,
+        several at a time over the app's connection
+
+        Return
+            number of contracts looked up on the server
+        """
+        missing = [
+            contract for contract in contracts if self.get(contract) is None
+        ]
+        if not missing:
+            return 0
+        logger.debug("Resolving %d contracts", len(missing))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda contract: self.resolve(app, contract),
+                          missing))
+        return len(missing)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,185 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+
+from .bar_store import HISTORICAL_DATA_DIR
+from .historical_data import TestApp, write_to_csv
+from .utils import setup_log
+
+
+# IB allows at most 50 historical data requests open at the same time
+MAX_IN_FLIGHT = 50
+# (requests, seconds): bars of 30 seconds or less are paced at 60
+# requests per 10 minutes, larger bars only by the overall message rate
+# of the API
+SMALL_BAR_PACING = (60, 600)
+LARGE_BAR_PACING = (10, 1)
+SMALL_BAR_SIZES = {
+    "1 secs", "5 secs", "10 secs", "15 secs", "30 secs",
+}
+
+logger = setup_log(__name__, "local")
+
+
+class SlidingWindow:
+    """
+    Paces requests so that no window of the given seconds holds more
+    than limit of them, which is how IB counts its pacing violations.
+    """
+
+    def __init__(self, limit, window, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        self._sleep = sleep
+        # times of the requests of the current window, oldest first
+        self._times = deque()
+        self._lock = Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request fits in the window and records it
+        """
+        while True:
+            with self._lock:
+                now = self._clock()
+                while self._times and self._times[0] <= now - self.window:
+                    self._times.popleft()
+                if len(self._times) < self.limit:
+                    self._times.append(now)
+                    return
+                wait = self._times[0] + self.window - now
+            self._sleep(wait)
+
+
+def pacing_for(barSizeSetting):
+    """
+    Returns the (requests, seconds) SlidingWindow settings IB tolerates
+    for a bar size
+    """
+    if barSizeSetting in SMALL_BAR_SIZES:
+        return SMALL_BAR_PACING
+    return LARGE_BAR_PACING
+
+
+def csv_writer(contract, bars):
+    # a fresh checkout has no historical_data directory
+    os.makedirs(HISTORICAL_DATA_DIR, exist_ok=True)
+    write_to_csv(f"{contract.symbol}.csv", bars)
+
+
+class BulkDownloader:
+    """
+    Downloads historical bars for many contracts over one connection.
+
+    Every contract lookup and every historical request gets its own
+    request ID from the app's RequestRouter, up to max_in_flight
+    contracts are worked on at the same time and new historical requests
+    are paced by a SlidingWindow. Each result is handed to writer as soon
+    as it completes.
+
+    Params:
+        app: a connected TestApp, or anything exposing the same
+            resolve_ib_contract and get_IB_historical_data methods (e.g.
+            a fake EClient in tests)
+        writer: callable taking (contract, bars)
+        max_in_flight: number of contracts processed concurrently
+        bucket: limiter pacing the historical requests, anything with
+            an acquire method. Defaults to a SlidingWindow with the IB
+            limits for barSizeSetting
+        contract_cache: ContractCache the whole universe is resolved
+            into before downloading, so known contracts are not looked up
+            again
+    """
+
+    def __init__(
+            self,
+            app,
+            writer=csv_writer,
+            durationStr="1 Y",
+            barSizeSetting="1 day",
+            max_in_flight=MAX_IN_FLIGHT,
+            bucket=None,
+            contract_cache=None,
+    ):
+        self.app = app
+        self.writer = writer
+        self.durationStr = durationStr
+        self.barSizeSetting = barSizeSetting
+        self.max_in_flight = max_in_flight
+        if bucket is None:
+            bucket = SlidingWindow(*pacing_for(barSizeSetting))
+        self.bucket = bucket
+        self.contract_cache = contract_cache
+
+    def fetch(self, contract):
+        """
+        Resolves a contract, downloads its bars and writes them
+
+        Return
+            number of bars written
+        """
+        if self.contract_cache is None:
+            resolved = self.app.resolve_ib_contract(contract)
+        else:
+            resolved = self.contract_cache.resolve(self.app, contract)
+
+        self.bucket.acquire()
+        bars = self.app.get_IB_historical_data(
+            resolved,
+            durationStr=self.durationStr,
+            barSizeSetting=self.barSizeSetting,
+        )
+
+        self.writer(contract, bars)
+        return len(bars)
+
+    def run(self, contracts):
+        """
+        Downloads every contract
+
+        Return
+            dict of symbol to number of bars written, or to the
+            exception raised for that contract
+        """
+        results = {}
+        contracts = list(contracts)
+        if self.contract_cache is not None:
+            self.contract_cache.prefetch(
+                self.app, contracts, max_workers=self.max_in_flight
+            )
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {
+                pool.submit(self.fetch, contract): contract
+                for contract in contracts
+            }
+            for future in as_completed(futures):
+                symbol = futures[future].symbol
+                try:
+                    results[symbol] = future.result()
+                except Exception as error:
+                    logger.exception("Failed to download %s", symbol)
+                    results[symbol] = error
+                else:
+                    logger.debug(
+                        "Wrote %s bars for %s", results[symbol], symbol
+                    )
+        return results
+
+
+def retrieve_universe(contracts, max_in_flight=MAX_IN_FLIGHT, **kwargs):
+    """
+    Bulk counterpart of retrieve_historical_data, sharing one connection
+    for the whole list of contracts
+    """
+    app = TestApp("127.0.0.1", 7497, 1)
+    try:
+        downloader = BulkDownloader(
+            app, max_in_flight=max_in_flight, **kwargs
+        )
+        return downloader.run(contracts)
+    finally:
+        app.disconnect()
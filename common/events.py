@@ -0,0 +1,75 @@
+import threading
+
+
+# Codes 2100-2199 are notices such as "market data farm connection is
+# OK", sent with a request id without the request having failed
+NOTICE_CODES = range(2100, 2200)
+
+
+# Codes ending an order: duplicate id (103), price not on the tick
+# grid (110), no security definition (200), rejected (201), cancelled
+# (202) and security not tradable (203). Other codes sent with an
+# order id, e.g. 399 "order will not be placed until the market opens"
+# or 10167 "displaying delayed market data", leave the order live.
+ORDER_REJECT_CODES = {103, 110, 200, 201, 202, 203}
+
+
+def is_notice(errorCode):
+    return errorCode in NOTICE_CODES
+
+
+def is_order_rejection(errorCode):
+    return errorCode in ORDER_REJECT_CODES
+
+
+class RequestEvents:
+    """
+    One readiness event per request id, set from the EWrapper callbacks
+    when the server answers or reports an error for that request, so
+    that callers wait exactly as long as the server takes.
+
+    expect() has to be called before sending the request, so that an
+    answer arriving before wait() is not lost.
+    """
+
+    def __init__(self):
+        self._events = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def expect(self, reqId):
+        with self._lock:
+            self._errors.pop(reqId, None)
+            event = self._events[reqId] = threading.Event()
+        return event
+
+    def set(self, reqId):
+        event = self._events.get(reqId)
+        if event is not None:
+            event.set()
+
+    def fail(self, reqId, message):
+        with self._lock:
+            if reqId not in self._events:
+                return
+            self._errors[reqId] = message
+        self._events[reqId].set()
+
+    def wait(self, reqId, timeout):
+        """
+        Waits for the answer to a request
+
+        Params:
+            timeout: upper bound on the wait in seconds
+
+        Return
+            (answered, error message or None)
+        """
+        event = self._events.get(reqId)
+        if event is None:
+            return False, None
+        answered = event.wait(timeout)
+        with self._lock:
+            self._events.pop(reqId, None)
+            error = self._errors.pop(reqId, None)
+        return answered, error
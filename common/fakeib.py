@@ -0,0 +1,230 @@
+import copy
+import heapq
+import itertools
+import random
+import time
+import zlib
+from threading import Condition
+
+from ibapi.common import BarData, TickAttrib
+from ibapi.contract import ContractDetails
+
+from .utils import setup_log
+
+
+# tick types the fake stream cycles through: BID, ASK, LAST
+TICK_TYPES = (1, 2, 4)
+# size tick types following them: BID_SIZE, ASK_SIZE, LAST_SIZE
+SIZE_TICK_TYPES = {1: 0, 2: 3, 4: 5}
+DAY = 24 * 3600
+
+logger = setup_log(__name__, "local")
+
+
+class FakeGateway:
+    """
+    What a FakeIB connection answers and how fast
+
+    Params:
+        tick_rate: ticks per second of every market data subscription,
+            None to send them as fast as the reader thread handles them
+        ticks: number of ticks per subscription, None for no end
+        bars: number of bars answering a historical data request
+        bar_delay: seconds before the bars of a request are sent
+        ack_delay: seconds from placeOrder to the Submitted status
+        fill_delay: seconds from placeOrder to the Filled status
+        price: first price of every random walk
+        seed: seed of the random walks
+    """
+
+    def __init__(self, tick_rate=1000.0, ticks=None, bars=250,
+                 bar_delay=0.0, ack_delay=0.0, fill_delay=0.0,
+                 price=100.0, seed=0):
+        self.tick_rate = tick_rate
+        self.ticks = ticks
+        self.bars = bars
+        self.bar_delay = bar_delay
+        self.ack_delay = ack_delay
+        self.fill_delay = fill_delay
+        self.price = price
+        self.seed = seed
+
+
+class FakeIB:
+    """
+    Injectable stand-in for the socket side of EClient.
+
+    Mixed in before any app of this project, it replaces connect, run
+    and the request methods, and answers them by calling the app's own
+    EWrapper callbacks from the thread running run(), as the IB reader
+    thread would:
+
+        class FakeStreamApp(FakeIB, IBApp):
+            gateway = FakeGateway(tick_rate=None, ticks=100000)
+
+        app = FakeStreamApp("127.0.0.1", 7497, 0, sink=sink)
+
+    Callbacks are scheduled on a timer heap, so rates and delays of the
+    gateway are honoured without one thread per request.
+    """
+
+    gateway = FakeGateway()
+
+    def connect(self, host, port, clientId):
+        self.host = host
+        self.port = port
+        self.clientId = clientId
+        self._fake_heap = []
+        self._fake_sequence = itertools.count()
+        self._fake_condition = Condition()
+        self._fake_connected = True
+        self._fake_streams = set()
+        self._fake_random = random.Random(self.gateway.seed)
+        self._fake_orders = set()
+        self._fake_schedule(0, self.nextValidId, 1)
+
+    def isConnected(self):
+        return getattr(self, "_fake_connected", False)
+
+    def disconnect(self):
+        if not self.isConnected():
+            return
+        with self._fake_condition:
+            self._fake_connected = False
+            self._fake_condition.notify()
+
+    def run(self):
+        while True:
+            with self._fake_condition:
+                while self._fake_connected:
+                    if self._fake_heap:
+                        wait = self._fake_heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._fake_condition.wait(wait)
+                if not self._fake_connected:
+                    return
+                _, _, function, args = heapq.heappop(self._fake_heap)
+            function(*args)
+
+    def _fake_schedule(self, delay, function, *args):
+        with self._fake_condition:
+            heapq.heappush(
+                self._fake_heap,
+                (time.monotonic() + delay, next(self._fake_sequence),
+                 function, args),
+            )
+            self._fake_condition.notify()
+
+    # market data
+
+    def reqMarketDataType(self, marketDataType):
+        pass
+
+    def reqMktData(self, reqId, contract, genericTickList, snapshot,
+                   regulatorySnapshot, mktDataOptions):
+        self._fake_streams.add(reqId)
+        self._fake_schedule(0, self.marketDataType, reqId, 3)
+        remaining = self.gateway.ticks
+        self._fake_schedule(0, self._fake_tick, reqId, self.gateway.price,
+                            remaining)
+
+    def cancelMktData(self, reqId):
+        self._fake_streams.discard(reqId)
+
+    def _fake_tick(self, reqId, price, remaining):
+        # without a rate, ticks go out in bursts between which other
+        # callbacks get their turn
+        burst = 1 if self.gateway.tick_rate else 1000
+        attrib = TickAttrib()
+        for _ in range(burst):
+            if reqId not in self._fake_streams or remaining == 0:
+                return
+            price = round(
+                max(price + self._fake_random.gauss(0, 0.05), 0.01), 2
+            )
+            tick_type = TICK_TYPES[self._fake_random.randrange(3)]
+            self.tickPrice(reqId, tick_type, price, attrib)
+            # like the decoder, every price comes with its size
+            self.tickSize(reqId, SIZE_TICK_TYPES[tick_type],
+                          self._fake_random.randrange(1, 10) * 100)
+            if remaining is not None:
+                remaining -= 1
+        delay = 1 / self.gateway.tick_rate if self.gateway.tick_rate else 0
+        self._fake_schedule(delay, self._fake_tick, reqId, price, remaining)
+
+    # contracts and historical data
+
+    def reqContractDetails(self, reqId, contract):
+        details = ContractDetails()
+        details.contract = copy.copy(contract)
+        if not contract.conId:
+            details.contract.conId = zlib.crc32(contract.symbol.encode())
+        self._fake_schedule(0, self.contractDetails, reqId, details)
+        self._fake_schedule(0, self.contractDetailsEnd, reqId)
+
+    def reqHistoricalData(self, reqId, contract, endDateTime, durationStr,
+                          barSizeSetting, whatToShow, useRTH, formatDate,
+                          keepUpToDate, chartOptions):
+        self._fake_schedule(
+            self.gateway.bar_delay, self._fake_bars, reqId
+        )
+
+    def cancelHistoricalData(self, reqId):
+        pass
+
+    def _fake_bars(self, reqId):
+        count = self.gateway.bars
+        first = int(time.time()) // DAY * DAY - count * DAY
+        price = self.gateway.price
+        for index in range(count):
+            bar = BarData()
+            bar.date = time.strftime(
+                "%Y%m%d", time.gmtime(first + index * DAY)
+            )
+            bar.open = price
+            price = round(
+                max(price + self._fake_random.gauss(0, 1), 0.01), 2
+            )
+            bar.high = max(bar.open, price) + 0.5
+            bar.low = max(min(bar.open, price) - 0.5, 0.01)
+            bar.close = price
+            bar.volume = self._fake_random.randrange(1000, 100000)
+            self.historicalData(reqId, bar)
+        self.historicalDataEnd(reqId, "", "")
+
+    # orders
+
+    def reqCurrentTime(self):
+        self._fake_schedule(0, self.currentTime, int(time.time()))
+
+    def placeOrder(self, orderId, contract, order):
+        quantity = order.totalQuantity
+        self._fake_orders.add(orderId)
+        self._fake_schedule(
+            self.gateway.ack_delay, self._fake_status, orderId,
+            "Submitted", 0, quantity, 0.0,
+        )
+        self._fake_schedule(
+            max(self.gateway.fill_delay, self.gateway.ack_delay),
+            self._fake_status, orderId, "Filled", quantity, 0,
+            self.gateway.price,
+        )
+
+    def cancelOrder(self, orderId, *args):
+        self._fake_schedule(
+            0, self._fake_status, orderId, "Cancelled", 0, 0, 0.0
+        )
+
+    def _fake_status(self, orderId, status, filled, remaining,
+                     avgFillPrice):
+        if orderId not in self._fake_orders:
+            return
+        if status in ("Filled", "Cancelled"):
+            self._fake_orders.discard(orderId)
+        self.orderStatus(
+            orderId, status, filled, remaining, avgFillPrice, 0, 0,
+            avgFillPrice, self.clientId, "", 0.0,
+        )
@@ -0,0 +1,77 @@
+import datetime
+import os
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from .bar_store import find_bars, read_bars
+from .utils import setup_log
+
+
+logger = setup_log(__name__, "local")
+
+# path -> (mtime, column arrays)
+_bars_cache = {}
+
+
+def load_bars_cached(path):
+    """
+    read_bars with an in-process cache keyed by the file modification
+    time, so a file is parsed again only after it has been rewritten
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _bars_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        logger.debug("Loading bars from %s", path)
+        cached = _bars_cache[path] = (mtime, read_bars(path))
+    return cached[1]
+
+
+def _epoch(moment):
+    if moment is None:
+        return None
+    if isinstance(moment, datetime.datetime) and moment.tzinfo is None:
+        # bar dates are stored as UTC, see bar_store.parse_ib_date
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(pd.Timestamp(moment).timestamp())
+
+
+class IBBarData(bt.feeds.PandasData):
+    """
+    PandasData over the bars stored by common.historical_data, which
+    have no open interest column
+    """
+    params = (("openinterest", None),)
+
+
+def local_feed(symbol, fromdate=None, todate=None, path=None):
+    """
+    Backtrader feed reading the locally stored IB bars of a symbol
+    instead of downloading them, the drop-in replacement of
+    bt.feeds.YahooFinanceData(dataname=symbol, fromdate=..., todate=...)
+
+    Params:
+        path: bar file to use, by default the one found by
+            bar_store.find_bars (parquet or npz before csv)
+    """
+    path = path or find_bars(symbol)
+    if path is None:
+        raise FileNotFoundError(f"No stored bars for {symbol}")
+
+    bars = load_bars_cached(path)
+    dates = bars["date"]
+    start, stop = 0, len(dates)
+    if fromdate is not None:
+        start = np.searchsorted(dates, _epoch(fromdate), side="left")
+    if todate is not None:
+        stop = np.searchsorted(dates, _epoch(todate), side="right")
+
+    frame = pd.DataFrame(
+        {
+            name: bars[name][start:stop]
+            for name in ("open", "high", "low", "close", "volume")
+        },
+        index=pd.to_datetime(dates[start:stop], unit="s"),
+    )
+    return IBBarData(dataname=frame, name=symbol)
@@ -1,8 +1,8 @@
 import queue
 import os
-import time
 import datetime
 import csv
+import time
 
 from ibapi.wrapper import EWrapper
 from ibapi.client import EClient
@@ -10,17 +10,27 @@ from ibapi.contract import Contract
 from ibapi.utils import iswrapper
 from threading import Thread
 
+from common import metrics
+from common.bar_store import HISTORICAL_DATA_DIR, bar_format, write_bars
+from common.events import is_notice
+from common.router import RequestRouter
 from common.utils import setup_log
 
 
-DEFAULT_HISTORIC_DATA_ID = 50
-DEFAULT_GET_CONTRACT_ID = 43
-FINISHED = None
-STARTED = None
-TIME_OUT = None
+FINISHED = object()
+STARTED = object()
+TIME_OUT = object()
 
 logger = setup_log(__name__, "local")
 
+contract_details_seconds = metrics.histogram(
+    "contract_details_seconds", "Duration of resolve_ib_contract requests"
+)
+historical_request_seconds = metrics.histogram(
+    "historical_request_seconds",
+    "Duration of get_IB_historical_data requests",
+)
+
 
 class finishableQueue:
 
@@ -68,8 +78,7 @@ class finishableQueue:
 
 class TestWrapper(EWrapper):
     def __init__(self):
-        self._my_contract_details = {}
-        self._my_historic_data_dict = {}
+        self.router = RequestRouter()
         self._my_errors = queue.Queue()
 
     def init_error(self):
@@ -94,57 +103,71 @@ class TestWrapper(EWrapper):
         errormsg = "IB error id {} errorcode {} string {}".format(
             id, errorCode, errorString
         )
-        self._my_errors.put(errormsg)
+        # errors of a pending request go to its waiter, the shared queue
+        # only keeps notices and connection level errors
+        if is_notice(errorCode) or not self.router.fail(id, errormsg):
+            self._my_errors.put(errormsg)
 
     @iswrapper
     def contractDetails(self, reqId, contractDetails):
-
-        if reqId not in self._my_contract_details.keys():
-            self.init_contractdetails(reqId)
-
-        self._my_contract_details[reqId].put(contractDetails)
+        contract_details_queue = self.router.target(reqId)
+        if contract_details_queue is not None:
+            contract_details_queue.put(contractDetails)
 
     @iswrapper
     def contractDetailsEnd(self, reqId):
-        if reqId not in self._my_contract_details.keys():
-            self.init_contractdetails(reqId)
-
-        self._my_contract_details[reqId].put(FINISHED)
+        contract_details_queue = self.router.target(reqId)
+        if contract_details_queue is not None:
+            contract_details_queue.put(FINISHED)
 
     @iswrapper
     def historicalData(self, tickerid, bar):
         bardata = (bar.date, bar.open, bar.high, bar.low, bar.close,
                    bar.volume)
 
-        historic_data_dict = self._my_historic_data_dict
-
         # Add on to the current data
-        if tickerid not in historic_data_dict.keys():
-            self.init_historicprices(tickerid)
-
-        historic_data_dict[tickerid].put(bardata)
+        historic_data_queue = self.router.target(tickerid)
+        if historic_data_queue is not None:
+            historic_data_queue.put(bardata)
 
     @iswrapper
     def historicalDataEnd(self, tickerid, start: str, end: str):
-        if tickerid not in self._my_historic_data_dict.keys():
-            self.init_historicprices(tickerid)
-
-        self._my_historic_data_dict[tickerid].put(FINISHED)
-
-    def init_contractdetails(self, reqId):
+        historic_data_queue = self.router.target(tickerid)
+        if historic_data_queue is not None:
+            historic_data_queue.put(FINISHED)
+
+    def _init_request_queue(self, reqId):
+        request_queue = queue.Queue()
+        # a failed request will not send its end marker, finish the
+        # waiting queue now instead of letting it time out
+        on_error = lambda message: request_queue.put(FINISHED)  # noqa: E731
+        if reqId is None:
+            reqId = self.router.allocate(request_queue, on_error)
+        else:
+            self.router.register(reqId, request_queue, on_error)
+        return reqId, request_queue
+
+    def init_contractdetails(self, reqId=None):
         """
         get contract details code
-        """
-        contract_details_queue = self._my_contract_details[
-            reqId] = queue.Queue()
 
-        return contract_details_queue
+        Return
+            (request id, queue receiving the contract details)
+        """
+        return self._init_request_queue(reqId)
 
-    def init_historicprices(self, tickerid):
-        historic_data_queue = self._my_historic_data_dict[
-            tickerid] = queue.Queue()
+    def init_historicprices(self, tickerid=None):
+        """
+        Return
+            (request id, queue receiving the bars)
+        """
+        return self._init_request_queue(tickerid)
 
-        return historic_data_queue
+    def clear_request(self, reqId):
+        """
+        Drops the routing of a finished request
+        """
+        self.router.release(reqId)
 
 
 class TestClient(EClient):
@@ -152,25 +175,36 @@ class TestClient(EClient):
     def __init__(self, wrapper):
         EClient.__init__(self, wrapper)
 
-    def resolve_ib_contract(self, ibcontract, reqId=DEFAULT_GET_CONTRACT_ID):
+    def _print_errors(self, reqId):
+        for error in self.wrapper.router.errors(reqId):
+            print(error)
+
+        while self.wrapper.is_error():
+            print(self.get_error())
+
+    def resolve_ib_contract(self, ibcontract, reqId=None):
         """
         From a partially formed contract, returns a fully fledged version
+        reqId is allocated by the wrapper's router unless given
         :returns fully resolved IB contract
         """
-        contract_details_queue = finishableQueue(
-            self.init_contractdetails(reqId))
+        reqId, details_queue = self.wrapper.init_contractdetails(reqId)
+        contract_details_queue = finishableQueue(details_queue)
 
         print("Getting full contract details from the server... ")
 
-        self.reqContractDetails(reqId, ibcontract)
+        try:
+            with contract_details_seconds.time():
+                self.reqContractDetails(reqId, ibcontract)
 
-        # Run until we get a valid contract(s) or get bored waiting
-        MAX_WAIT_SECONDS = 10
-        new_contract_details = contract_details_queue.get(
-            timeout=MAX_WAIT_SECONDS)
+                # Run until we get a valid contract(s) or get bored waiting
+                MAX_WAIT_SECONDS = 10
+                new_contract_details = contract_details_queue.get(
+                    timeout=MAX_WAIT_SECONDS)
 
-        while self.wrapper.is_error():
-            print(self.get_error())
+            self._print_errors(reqId)
+        finally:
+            self.wrapper.clear_request(reqId)
 
         if contract_details_queue.timed_out():
             print("Exceeded maximum wait for wrapper to confirm finished")
@@ -194,37 +228,48 @@ class TestClient(EClient):
             ibcontract,
             durationStr="1 Y",
             barSizeSetting="1 day",
-            tickerid=DEFAULT_HISTORIC_DATA_ID
+            tickerid=None,
+            endDateTime=None,
     ):
         """
-        Returns historical prices for a contract, up to today
+        Returns historical prices for a contract, up to endDateTime
+        (today by default)
         ibcontract is a Contract
+        tickerid is allocated by the wrapper's router unless given
         :returns list of prices in 4 tuples: Open high low close volume
         """
-        historic_data_queue = finishableQueue(
-            self.init_historicprices(tickerid))
+        tickerid, bars_queue = self.wrapper.init_historicprices(tickerid)
+        historic_data_queue = finishableQueue(bars_queue)
 
         # Request some historical data. Native method in EClient
-        today = datetime.datetime.today().strftime("%Y%m%d %H:%M:%S %Z")
-        self.reqHistoricalData(
-            tickerid,        # tickerId,
-            ibcontract,      # contract,
-            today,           # endDateTime,
-            durationStr,     # durationStr,
-            barSizeSetting,  # barSizeSetting,
-            "TRADES",        # whatToShow,
-            1,               # useRTH,
-            1,               # formatDate
-            False,           # KeepUpToDate <<==== added for api 9.73.2
-            []               # chartoptions not used
-        )
-
-        MAX_WAIT_SECONDS = 10
-        print("Getting historical data from the server...")
-        historic_data = historic_data_queue.get(timeout=MAX_WAIT_SECONDS)
-
-        while self.wrapper.is_error():
-            print(self.get_error())
+        if endDateTime is None:
+            endDateTime = datetime.datetime.today().strftime(
+                "%Y%m%d %H:%M:%S %Z")
+        try:
+            started = time.perf_counter_ns()
+            self.reqHistoricalData(
+                tickerid,        # tickerId,
+                ibcontract,      # contract,
+                endDateTime,     # endDateTime,
+                durationStr,     # durationStr,
+                barSizeSetting,  # barSizeSetting,
+                "TRADES",        # whatToShow,
+                1,               # useRTH,
+                1,               # formatDate
+                False,           # KeepUpToDate <<==== added for api 9.73.2
+                []               # chartoptions not used
+            )
+
+            MAX_WAIT_SECONDS = 10
+            print("Getting historical data from the server...")
+            historic_data = historic_data_queue.get(timeout=MAX_WAIT_SECONDS)
+            historical_request_seconds.record_ns(
+                time.perf_counter_ns() - started
+            )
+
+            self._print_errors(tickerid)
+        finally:
+            self.wrapper.clear_request(tickerid)
 
         if historic_data_queue.timed_out():
             print("Exceeded maximum wait for wrapper to confirm finished")
@@ -249,11 +294,7 @@ class TestApp(TestWrapper, TestClient):
 
 
 def write_to_csv(filename, data: list):
-    csv_file_path = os.path.join(
-        os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
-        "historical_data",
-        filename,
-    )
+    csv_file_path = os.path.join(HISTORICAL_DATA_DIR, filename)
     fieldnames = ["Date", "Open", "High", "Low", "Close", "Volume"]
     with open(csv_file_path, "w") as fout:
         writer = csv.DictWriter(fout, fieldnames=fieldnames)
@@ -262,15 +303,29 @@ def write_to_csv(filename, data: list):
             writer.writerow(dict(zip(fieldnames, record)))
 
 
-def retrieve_historical_data(contract: Contract, filename=None):
-    filename = f"{contract.symbol}.csv" if not filename else filename
-
-    app = TestApp("127.0.0.1", 7497, 1)
-
-    resolved_ibcontract = app.resolve_ib_contract(contract)
+def retrieve_historical_data(contract: Contract, filename=None, fmt="csv",
+                             contract_cache=None, app_cls=TestApp):
+    """
+    fmt: "csv", "npz" or "parquet", used when no filename is given.
+      The binary formats store typed columns, see common.bar_store.
+    contract_cache: ContractCache skipping the contract details lookup
+      when the contract was resolved before.
+    app_cls: the app class to connect with, e.g. one mixing in
+      common.fakeib.FakeIB to run without a server.
+    """
+    filename = f"{contract.symbol}.{fmt}" if not filename else filename
+
+    app = app_cls("127.0.0.1", 7497, 1)
+
+    if contract_cache is None:
+        resolved_ibcontract = app.resolve_ib_contract(contract)
+    else:
+        resolved_ibcontract = contract_cache.resolve(app, contract)
     historic_data = app.get_IB_historical_data(resolved_ibcontract)
 
-    write_to_csv(filename, historic_data)
-    time.sleep(3)
+    if bar_format(filename) == "csv":
+        write_to_csv(filename, historic_data)
+    else:
+        write_bars(os.path.join(HISTORICAL_DATA_DIR, filename), historic_data)
 
     app.disconnect()
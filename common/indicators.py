@@ -0,0 +1,187 @@
+from .bars import BarAggregator, LAST_TICK_TYPES
+from .utils import setup_log
+
+
+# running sums are recomputed from the window this often to bound
+# floating point drift
+RESYNC_EVERY = 100000
+
+logger = setup_log(__name__, "local")
+
+
+class RollingSMA:
+    """
+    Simple moving average updated in O(1): the window lives in a ring
+    buffer and its sum is kept up to date as values enter and leave.
+    """
+
+    __slots__ = ("period", "_window", "_index", "_count", "_sum",
+                 "_updates", "value")
+
+    def __init__(self, period):
+        self.period = period
+        self._window = [0.0] * period
+        self._index = 0
+        self._count = 0
+        self._sum = 0.0
+        self._updates = 0
+        self.value = None
+
+    def update(self, price):
+        """
+        Adds a value and returns the average, None until the window is
+        full
+        """
+        self._sum += price - self._window[self._index]
+        self._window[self._index] = price
+        self._index = (self._index + 1) % self.period
+        if self._count < self.period:
+            self._count += 1
+
+        self._updates += 1
+        if self._updates % RESYNC_EVERY == 0:
+            self._sum = sum(self._window)
+
+        if self._count == self.period:
+            self.value = self._sum / self.period
+        return self.value
+
+
+class EMA:
+    """
+    Exponential moving average seeded with the simple average of its
+    first period values, like backtrader's EMA
+    """
+
+    __slots__ = ("period", "alpha", "_seed", "value")
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self._seed = RollingSMA(period)
+        self.value = None
+
+    def update(self, price):
+        if self.value is None:
+            self.value = self._seed.update(price)
+        else:
+            self.value += self.alpha * (price - self.value)
+        return self.value
+
+
+class CrossOver:
+    """
+    Crossover of two lines matching backtrader's CrossOver: +1 when the
+    first crosses the second upwards, -1 downwards, 0 otherwise
+    """
+
+    __slots__ = ("_last_nonzero", "value")
+
+    def __init__(self):
+        self._last_nonzero = None
+        self.value = 0
+
+    def update(self, line0, line1):
+        if line0 is None or line1 is None:
+            self.value = 0
+            return self.value
+
+        difference = line0 - line1
+        previous = self._last_nonzero
+        if previous is None:
+            self.value = 0
+        elif previous < 0 and difference > 0:
+            self.value = 1
+        elif previous > 0 and difference < 0:
+            self.value = -1
+        else:
+            self.value = 0
+
+        if difference or previous is None:
+            self._last_nonzero = difference
+        return self.value
+
+
+class SmaCrossSignal:
+    """
+    Live counterpart of backtesting.SmaCross: fast and slow SMAs of the
+    bar closes and their crossover
+    """
+
+    __slots__ = ("fast", "slow", "cross")
+
+    def __init__(self, pfast=10, pslow=30):
+        self.fast = RollingSMA(pfast)
+        self.slow = RollingSMA(pslow)
+        self.cross = CrossOver()
+
+    def update(self, close):
+        return self.cross.update(
+            self.fast.update(close), self.slow.update(close)
+        )
+
+
+class IndicatorEngine:
+    """
+    Runs SmaCrossSignal per symbol on the bars built from live ticks by
+    a BarAggregator.
+
+    The engine follows the sink interface (put/close) of common.sink so
+    it can be given to common.stream.stream, alone or next to a storage
+    sink through FanoutSink. Work per tick is constant. Bars are closed
+    on wall-clock boundaries by the aggregator's timer, so a signal is
+    emitted right after its bar ends even when the symbol stays quiet,
+    and on_signal may be called from the timer thread.
+
+    Params:
+        interval: bar length in seconds, or a key of bars.INTERVALS
+        pfast, pslow: periods of the moving averages
+        on_signal: callable taking (symbol, signal, timestamp, close)
+            for every non-zero crossover
+        tick_types: tick types treated as trades
+        timer: close bars on a timer, False to close them with the
+            next tick or flush() only (e.g. when replaying ticks)
+    """
+
+    def __init__(self, interval=60, pfast=10, pslow=30, on_signal=None,
+                 tick_types=LAST_TICK_TYPES, timer=True):
+        self.pfast = pfast
+        self.pslow = pslow
+        self.on_signal = on_signal or self._log_signal
+        self.signals = {}
+        self.bars = BarAggregator(
+            interval, on_bar=self._on_bar, tick_types=tick_types,
+            timer=timer,
+        )
+
+    @staticmethod
+    def _log_signal(symbol, signal, timestamp, close):
+        logger.debug(
+            "%s crossover %+d at %s (close %s)", symbol, signal,
+            timestamp, close,
+        )
+
+    def put(self, tick):
+        return self.bars.put(tick)
+
+    def flush(self, now=None):
+        """
+        Closes the bars that ended before now, see BarAggregator.flush
+        """
+        self.bars.flush(now)
+
+    def _on_bar(self, bar):
+        signals = self.signals.get(bar.symbol)
+        if signals is None:
+            signals = self.signals[bar.symbol] = SmaCrossSignal(
+                self.pfast, self.pslow
+            )
+        close = bar.close
+        signal = signals.update(close)
+        if signal:
+            self.on_signal(
+                bar.symbol, signal, bar.start + self.bars.interval, close
+            )
+
+    def close(self, timeout=None):
+        self.bars.close(timeout)
@@ -0,0 +1,199 @@
+import time
+from decimal import Decimal
+from threading import Lock
+
+from .utils import setup_log
+
+
+MODES = ("last", "ohlc")
+NANOSECONDS = 10 ** 9
+
+logger = setup_log(__name__, "local")
+
+
+class SortKeys:
+    """
+    Collision-free sort keys for the items of one writer.
+
+    A key is the nanosecond receive time of a tick as a Decimal number of
+    seconds, so existing range conditions on whole seconds keep working.
+    Keys of one symbol are strictly increasing: a tick arriving in the
+    same nanosecond as the previous one of its symbol is moved forward
+    by one nanosecond.
+    """
+
+    def __init__(self):
+        self._last = {}
+
+    def next(self, symbol, ns):
+        last = self._last.get(symbol)
+        if last is not None and ns <= last:
+            ns = last + 1
+        self._last[symbol] = ns
+        return Decimal(ns).scaleb(-9)
+
+
+class Conflation:
+
+    __slots__ = ("ns", "open", "high", "low", "close", "count", "size",
+                 "volume")
+
+    def __init__(self, ns, price, size=None):
+        self.ns = ns
+        self.open = self.high = self.low = self.close = price
+        self.count = 1
+        # only trades carry a size
+        self.size = self.volume = size
+
+    def update(self, ns, price, size=None):
+        self.ns = ns
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+        self.count += 1
+        self.size = size
+        if size is not None:
+            self.volume = (self.volume or 0) + size
+
+
+class IngestPipeline:
+    """
+    Sink conflating ticks before they are stored.
+
+    Ticks are grouped by (symbol, tick_type), so bid, ask and last
+    prices never overwrite each other, and within every interval each
+    group is reduced to one item: its last price, or with mode="ohlc"
+    the open/high/low/close of the interval (price then holds the
+    close). Trades keep their size, the last one in "last" mode or the
+    summed volume of the interval in "ohlc" mode.
+
+    A tick repeating the price and size of the previous one of its group
+    within the same interval (the same second when conflation is off) is
+    a redelivery and is dropped, whatever its receive time. An unchanged
+    price in a later interval is still stored, since it records that
+    the price held; drop_repeats=True drops items equal to the previous
+    one of their group instead.
+
+    Every item gets a unique sort key from SortKeys and a count of the
+    ticks it stands for, and is handed to the downstream sink, usually a
+    BufferedSink.
+
+    Intervals are aligned on the clock and closed by the first tick of
+    the next one, or by close().
+
+    Params:
+        downstream: sink the items are put into
+        interval: conflation interval in seconds, 0 to keep every tick
+        mode: "last" or "ohlc"
+        drop_repeats: also drop items repeating the previous values of
+            their group in later intervals
+    """
+
+    def __init__(self, downstream, interval=1.0, mode="last",
+                 drop_repeats=False):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+        self.downstream = downstream
+        self.interval_ns = int(interval * NANOSECONDS)
+        self.mode = mode
+        self.drop_repeats = drop_repeats
+        self.keys = SortKeys()
+
+        self.received = 0
+        self.emitted = 0
+        self.duplicates = 0
+
+        self._window = None
+        self._pending = {}
+        self._previous = {}
+        self._last_ticks = {}
+        self._lock = Lock()
+
+    def put(self, tick):
+        ns = tick.get("ns") or time.time_ns()
+        group = (tick["symbol"], tick.get("tick_type", 0))
+        price = tick["price"]
+        size = tick.get("size")
+        if self.interval_ns:
+            window = ns // self.interval_ns
+        else:
+            window = tick.get("timestamp", ns // NANOSECONDS)
+        with self._lock:
+            self.received += 1
+            content = (window, price, size)
+            if self._last_ticks.get(group) == content:
+                self.duplicates += 1
+                return True
+            self._last_ticks[group] = content
+
+            if not self.interval_ns:
+                self._emit(group, Conflation(ns, price, size))
+                return True
+
+            if window != self._window:
+                self._flush()
+                self._window = window
+            pending = self._pending.get(group)
+            if pending is None:
+                self._pending[group] = Conflation(ns, price, size)
+            else:
+                pending.update(ns, price, size)
+        return True
+
+    def flush(self):
+        """
+        Emits the interval in progress without waiting for it to end
+        """
+        with self._lock:
+            self._flush()
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "emitted": self.emitted,
+            "duplicates": self.duplicates,
+        }
+
+    def close(self, timeout=None):
+        self.flush()
+        logger.debug("Ingest pipeline closed: %s", self.stats())
+        self.downstream.close(timeout)
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        for group, conflation in pending.items():
+            self._emit(group, conflation)
+
+    def _emit(self, group, conflation):
+        ohlc = self.mode == "ohlc" and self.interval_ns
+        if self.drop_repeats:
+            if ohlc:
+                values = (conflation.open, conflation.high, conflation.low,
+                          conflation.close, conflation.volume)
+            else:
+                values = (conflation.close, conflation.size)
+            if self._previous.get(group) == values:
+                self.duplicates += 1
+                return
+            self._previous[group] = values
+
+        symbol, tick_type = group
+        item = {
+            "symbol": symbol,
+            "timestamp": self.keys.next(symbol, conflation.ns),
+            "tick_type": tick_type,
+            "price": conflation.close,
+            "count": conflation.count,
+        }
+        if ohlc:
+            item["open"] = conflation.open
+            item["high"] = conflation.high
+            item["low"] = conflation.low
+            if conflation.volume is not None:
+                item["volume"] = conflation.volume
+        elif conflation.size is not None:
+            item["size"] = conflation.size
+        self.emitted += 1
+        self.downstream.put(item)
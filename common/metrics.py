@@ -0,0 +1,291 @@
+import time
+from threading import Event, Lock, Thread
+
+from .utils import setup_log
+
+
+# values are bucketed like an HDR histogram: exact below 32, then 16
+# linear sub-buckets per power of two, i.e. within 6.25% of the value
+SUB_BUCKETS = 16
+MAX_SHIFT = 40
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+METRICS_PORT = 9108
+
+logger = setup_log(__name__, "local")
+
+
+def bucket_index(value):
+    shift = max(value.bit_length() - 5, 0)
+    if shift > MAX_SHIFT:
+        shift = MAX_SHIFT
+        value = (2 * SUB_BUCKETS - 1) << shift
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def bucket_bounds(index):
+    """
+    Return
+        (lowest, highest) integer value falling in a bucket
+    """
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    lowest = (index - shift * SUB_BUCKETS) << shift
+    return lowest, lowest + (1 << shift) - 1
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """
+    Counter incremented without a lock, so it is meant to have a single
+    writing thread, e.g. the IB reader thread
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help="", labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    """
+    Gauge either set by its owner or read from function when collected
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help="", labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        value = self.value if self.function is None else self.function()
+        yield self.name, self.labels, value
+
+
+class Histogram:
+    """
+    Log-linear histogram of non-negative values, cheap enough to record
+    into from the hot paths: one index computation and one increment.
+
+    Durations are recorded in nanoseconds with record_ns, or timed with
+
+        with histogram.time():
+            ...
+
+    and reported in seconds (scale 1e-9). Plain values such as batch
+    sizes use record and scale 1.
+    """
+
+    kind = "summary"
+
+    def __init__(self, name, help="", labels=(), scale=1e-9):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.scale = scale
+        self.counts = [0] * ((MAX_SHIFT + 2) * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._lock = Lock()
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        index = bucket_index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    record_ns = record
+
+    def time(self):
+        return _Timer(self)
+
+    def percentile(self, quantile):
+        """
+        Return
+            upper bound of the bucket holding the quantile, scaled
+        """
+        if not self.count:
+            return 0.0
+        rank = quantile * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                highest = bucket_bounds(index)[1]
+                return min(highest, self.max) * self.scale
+        return self.max * self.scale
+
+    def samples(self):
+        for quantile in QUANTILES:
+            labels = self.labels + (("quantile", str(quantile)),)
+            yield self.name, labels, self.percentile(quantile)
+        yield f"{self.name}_sum", self.labels, self.total * self.scale
+        yield f"{self.name}_count", self.labels, self.count
+
+
+class _Timer:
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.start)
+
+
+class Registry:
+    """
+    Named metrics of the process, rendered in the Prometheus text
+    format. Asking for an existing name and labels returns the metric
+    already registered.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        labels = tuple(sorted((labels or {}).items()))
+        key = (name, labels)
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(
+                    name, help, labels, **kwargs
+                )
+        return metric
+
+    def counter(self, name, help="", labels=None):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", labels=None, function=None):
+        gauge = self._get(Gauge, name, help, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help="", labels=None, scale=1e-9):
+        return self._get(Histogram, name, help, labels, scale=scale)
+
+    def unregister(self, name, labels=None):
+        labels = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            self._metrics.pop((name, labels), None)
+
+    def render(self):
+        lines = []
+        described = set()
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        for (name, _), metric in metrics:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+            for sample, labels, value in metric.samples():
+                if isinstance(value, float):
+                    value = f"{value:.9g}"
+                lines.append(f"{sample}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help="", labels=None):
+    return REGISTRY.counter(name, help, labels)
+
+
+def gauge(name, help="", labels=None, function=None):
+    return REGISTRY.gauge(name, help, labels, function)
+
+
+def histogram(name, help="", labels=None, scale=1e-9):
+    return REGISTRY.histogram(name, help, labels, scale)
+
+
+def serve(port=METRICS_PORT, host="127.0.0.1", registry=REGISTRY):
+    """
+    Serves the metrics on http://host:port/metrics from a daemon thread
+
+    Return
+        the HTTP server, shut it down with server.shutdown()
+    """
+    # imported here, http.server costs more than the rest of the module
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = Thread(target=server.serve_forever, name="metrics",
+                    daemon=True)
+    thread.start()
+    logger.debug("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
+
+
+def dump_periodically(path, interval=10.0, registry=REGISTRY):
+    """
+    Rewrites path with the rendered metrics every interval seconds from
+    a daemon thread
+
+    Return
+        Event stopping the dumps once set
+    """
+    stop = Event()
+
+    def run():
+        while not stop.wait(interval):
+            with open(path, "w") as fout:
+                fout.write(registry.render())
+
+    Thread(target=run, name="metrics-dump", daemon=True).start()
+    return stop
@@ -0,0 +1,321 @@
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from .bar_store import BAR_COLUMNS, find_bars
+from .feeds import load_bars_cached
+from .utils import setup_log
+
+
+CASH = 10000.0
+# direction of each metric returned by run_backtest
+HIGHER_IS_BETTER = {
+    "pnl": True,
+    "sharpe": True,
+    "max_drawdown": False,
+    "trades": True,
+}
+
+logger = setup_log(__name__, "local")
+
+# set in every worker process by _init_worker
+_worker_memory = None
+_worker_bars = None
+
+
+class SharedBars:
+    """
+    Copies the bar columns of several symbols into one shared memory
+    block, so that worker processes map them instead of receiving a
+    pickled copy with every task.
+
+    Params:
+        bars: dict of symbol to a dict of column arrays (BAR_COLUMNS)
+    """
+
+    def __init__(self, bars):
+        layout = {}
+        offset = 0
+        arrays = []
+        for symbol, columns in bars.items():
+            for name, dtype in BAR_COLUMNS.items():
+                array = np.ascontiguousarray(columns[name], dtype=dtype)
+                layout[(symbol, name)] = (offset, len(array), dtype.str)
+                arrays.append((offset, array))
+                offset += array.nbytes
+
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=max(offset, 1)
+        )
+        for start, array in arrays:
+            self.memory.buf[start:start + array.nbytes] = array.tobytes()
+        self.spec = (self.memory.name, layout)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+def attach_bars(spec):
+    """
+    Maps the arrays published by SharedBars without copying them
+
+    Return
+        (SharedMemory, dict of symbol to dict of column arrays), the
+        memory must be kept alive as long as the arrays are used
+    """
+    name, layout = spec
+    memory = shared_memory.SharedMemory(name=name)
+    bars = {}
+    for (symbol, column), (offset, length, dtype) in layout.items():
+        bars.setdefault(symbol, {})[column] = np.ndarray(
+            (length,), dtype=dtype, buffer=memory.buf, offset=offset
+        )
+    return memory, bars
+
+
+def _init_worker(spec):
+    global _worker_memory, _worker_bars
+    _worker_memory, _worker_bars = attach_bars(spec)
+
+
+def load_symbol(symbol):
+    """
+    Loads the locally stored bars of a symbol, see bar_store.find_bars
+    """
+    path = find_bars(symbol)
+    if path is None:
+        raise FileNotFoundError(f"No stored bars for {symbol}")
+    return load_bars_cached(path)
+
+
+def expand_grid(param_grid):
+    """
+    {"pfast": [5, 10], "pslow": [30]} ->
+        [{"pfast": 5, "pslow": 30}, {"pfast": 10, "pslow": 30}]
+    """
+    names = list(param_grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*param_grid.values())
+    ]
+
+
+def walk_forward_windows(length, train, test, step=None):
+    """
+    Rolling (train, test) index windows over length bars, each as a
+    (start, stop) pair. The windows move forward by step bars, test
+    bars by default.
+    """
+    step = step or test
+    windows = []
+    start = 0
+    while start + train + test <= length:
+        windows.append(
+            ((start, start + train), (start + train, start + train + test))
+        )
+        start += step
+    return windows
+
+
+def run_backtest(strategy_cls, bars, params, window=None, cash=CASH):
+    """
+    Runs one backtest through Cerebro on bar arrays
+
+    Params:
+        window: (start, stop) index range of the bars to use
+
+    Return
+        dict with pnl, sharpe, max_drawdown and trades
+    """
+    start, stop = window or (0, len(bars["date"]))
+    frame = pd.DataFrame(
+        {
+            name: bars[name][start:stop]
+            for name in ("open", "high", "low", "close", "volume")
+        },
+        index=pd.to_datetime(bars["date"][start:stop], unit="s"),
+    )
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(bt.feeds.PandasData(dataname=frame, openinterest=None))
+    cerebro.addstrategy(strategy_cls, **params)
+    cerebro.broker.setcash(cash)
+    cerebro.addanalyzer(
+        bt.analyzers.SharpeRatio, _name="sharpe",
+        timeframe=bt.TimeFrame.Days, annualize=True,
+    )
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trades")
+    strategy = cerebro.run()[0]
+
+    sharpe = strategy.analyzers.sharpe.get_analysis().get("sharperatio")
+    drawdown = strategy.analyzers.drawdown.get_analysis()
+    trades = strategy.analyzers.trades.get_analysis()
+    return {
+        "pnl": cerebro.broker.getvalue() - cash,
+        "sharpe": math.nan if sharpe is None else sharpe,
+        "max_drawdown": drawdown.max.drawdown,
+        "trades": trades.get("total", {}).get("total", 0),
+    }
+
+
+def _task(strategy_cls, symbol, params, window, cash):
+    result = run_backtest(
+        strategy_cls, _worker_bars[symbol], params, window, cash
+    )
+    return {"symbol": symbol, **params, **result}
+
+
+class Optimizer:
+    """
+    Fans backtests of a strategy out over a process pool.
+
+    The bars of every symbol are loaded once in the parent and shared
+    with the workers through shared memory. Use as a context manager so
+    the pool and the shared block are released.
+
+    Params:
+        strategy_cls: backtrader strategy, e.g. SmaCross
+        symbols: symbols to backtest
+        loader: callable returning the bar arrays of a symbol
+        max_workers: size of the pool, the number of cores by default
+    """
+
+    def __init__(self, strategy_cls, symbols, loader=load_symbol,
+                 max_workers=None, cash=CASH):
+        self.strategy_cls = strategy_cls
+        self.cash = cash
+        self.bars = {symbol: loader(symbol) for symbol in symbols}
+        self.shared = SharedBars(self.bars)
+        self.pool = ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(self.shared.spec,),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown()
+        self.shared.close()
+
+    def _map(self, jobs):
+        futures = [
+            self.pool.submit(
+                _task, self.strategy_cls, symbol, params, window, self.cash
+            )
+            for symbol, params, window in jobs
+        ]
+        return [future.result() for future in futures]
+
+    def grid(self, param_grid, window=None, metric="sharpe",
+             minimize=None):
+        """
+        Backtests every parameter set on every symbol
+
+        Params:
+            minimize: whether lower values of metric are better, looked
+                up in HIGHER_IS_BETTER by default
+
+        Return
+            DataFrame of results ranked by metric, best first
+        """
+        jobs = [
+            (symbol, params, window)
+            for symbol in self.bars
+            for params in expand_grid(param_grid)
+        ]
+        return rank(pd.DataFrame(self._map(jobs)), metric, minimize)
+
+    def walk_forward(self, param_grid, train, test, step=None,
+                     metric="sharpe", minimize=None):
+        """
+        For every walk-forward window and symbol, picks the best
+        parameters on the train bars and backtests them on the test bars
+
+        Params:
+            minimize: whether lower values of metric are better, looked
+                up in HIGHER_IS_BETTER by default
+
+        Return
+            DataFrame with one row per (fold, symbol) holding the chosen
+            parameters, the in-sample metric and the out-of-sample
+            results, ranked by the out-of-sample metric
+        """
+        minimize = _minimize(metric, minimize)
+        grid = expand_grid(param_grid)
+        folds = [
+            (symbol, fold, train_window, test_window)
+            for symbol, bars in self.bars.items()
+            for fold, (train_window, test_window) in enumerate(
+                walk_forward_windows(len(bars["date"]), train, test, step)
+            )
+        ]
+
+        # all in-sample runs first, then all out-of-sample runs, so the
+        # pool stays busy across folds and symbols
+        in_sample = self._map([
+            (symbol, params, train_window)
+            for symbol, _, train_window, _ in folds
+            for params in grid
+        ])
+        chosen = []
+        for index in range(len(folds)):
+            runs = in_sample[index * len(grid):(index + 1) * len(grid)]
+            chosen.append(max(
+                zip(grid, runs),
+                key=lambda run: _score(run[1][metric], minimize),
+            ))
+        out_of_sample = self._map([
+            (symbol, params, test_window)
+            for (symbol, _, _, test_window), (params, _) in zip(folds, chosen)
+        ])
+
+        rows = []
+        for (symbol, fold, _, test_window), (_, best), result in zip(
+                folds, chosen, out_of_sample):
+            rows.append({
+                "fold": fold,
+                "test_start": int(self.bars[symbol]["date"][test_window[0]]),
+                "in_sample_" + metric: best[metric],
+                **result,
+            })
+        return rank(pd.DataFrame(rows), metric, minimize)
+
+
+def _minimize(metric, minimize=None):
+    if minimize is None:
+        return not HIGHER_IS_BETTER.get(metric, True)
+    return minimize
+
+
+def _score(value, minimize=False):
+    """
+    Sort key of a metric value, higher is better, missing values last
+    """
+    if value is None or math.isnan(value):
+        return -math.inf
+    return -value if minimize else value
+
+
+def rank(results, metric, minimize=None):
+    """
+    Sorts results best first by metric, see HIGHER_IS_BETTER
+    """
+    results = results.sort_values(
+        metric, ascending=_minimize(metric, minimize), na_position="last",
+        ignore_index=True,
+    )
+    results.insert(0, "rank", range(1, len(results) + 1))
+    return results
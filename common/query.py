@@ -0,0 +1,246 @@
+import datetime as dt
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import numpy as np
+
+from .codec import parse_numbers
+from .schema import LegacySchema
+from .utils import setup_log
+
+
+QUERY_CACHE_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(os.path.dirname(__file__))),
+    "query_cache",
+)
+DAY = 24 * 3600
+# one query per hour of ticks, each paginated on its own
+SLICE_SECONDS = 3600
+MAX_WORKERS = 16
+
+# attributes read from the table and the columns they decode into
+FIELDS = {
+    "timestamp": np.dtype("<f8"),
+    "price": np.dtype("<f8"),
+    "tick_type": np.dtype("<i4"),
+}
+
+logger = setup_log(__name__, "local")
+
+
+def day_start(timestamp):
+    """
+    Start of the UTC day holding timestamp, in epoch seconds
+    """
+    return int(timestamp) // DAY * DAY
+
+
+def empty_columns():
+    return {field: np.empty(0, dtype) for field, dtype in FIELDS.items()}
+
+
+def decode_items(items):
+    """
+    Columns of low-level client items, parsing the number strings of
+    each attribute in one call instead of building Decimals per item
+    """
+    return {
+        field: parse_numbers(
+            [item[field]["N"] if field in item else "0" for item in items],
+            dtype,
+        )
+        for field, dtype in FIELDS.items()
+    }
+
+
+def concat_columns(parts):
+    parts = [part for part in parts if len(part["timestamp"])]
+    if not parts:
+        return empty_columns()
+    return {
+        field: np.concatenate([part[field] for part in parts])
+        for field in FIELDS
+    }
+
+
+def trim_columns(columns, start=None, end=None):
+    """
+    Keeps the rows with start <= timestamp < end, timestamps sorted
+    """
+    timestamps = columns["timestamp"]
+    lo = 0 if start is None else np.searchsorted(timestamps, start, "left")
+    hi = len(timestamps) if end is None else \
+        np.searchsorted(timestamps, end, "left")
+    return {field: values[lo:hi] for field, values in columns.items()}
+
+
+class TickQuery:
+    """
+    Reads ticks of a DynamoDB tick table into NumPy columns.
+
+    A time range is split in slices of slice_seconds that are queried
+    in parallel, each following LastEvaluatedKey until its last page,
+    and only the attributes in FIELDS are projected. Complete days are
+    cached per (table, symbol, UTC day) as .npz files under cache_dir,
+    so reading them again costs no query at all.
+
+        query = TickQuery()
+        frame = query.frame("AAPL", start, end)
+
+    Params:
+        table_name: defaults to the table of schema
+        schema: table layout, see common.schema. With a BucketedSchema
+            every slice queries the day partitions (and their shards)
+            it covers and merges them.
+        client: boto3 DynamoDB client, which unlike table resources is
+            safe to share between threads
+        cache_dir: directory of the day cache, None to disable it
+    """
+
+    def __init__(self, table_name=None, client=None,
+                 cache_dir=QUERY_CACHE_DIR, slice_seconds=SLICE_SECONDS,
+                 max_workers=MAX_WORKERS, schema=None):
+        self.schema = schema if schema is not None else \
+            LegacySchema(table_name or "stock")
+        self.table_name = table_name or self.schema.table_name
+        self._client = client
+        self._client_lock = Lock()
+        self.cache_dir = cache_dir
+        self.slice_seconds = slice_seconds
+        self.max_workers = max_workers
+
+    @property
+    def client(self):
+        # created on first use, days read from the cache need no AWS
+        with self._client_lock:
+            if self._client is None:
+                import boto3
+                self._client = boto3.client("dynamodb")
+        return self._client
+
+    def _cache_path(self, symbol, day):
+        date = dt.datetime.fromtimestamp(day, dt.timezone.utc).date()
+        return os.path.join(
+            self.cache_dir, self.table_name, symbol, f"{date}.npz"
+        )
+
+    def _read_cache(self, symbol, day):
+        if self.cache_dir is None:
+            return None
+        path = self._cache_path(symbol, day)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {field: data[field] for field in FIELDS}
+
+    def _write_cache(self, symbol, day, columns):
+        path = self._cache_path(symbol, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, path)
+
+    def query_partition(self, partition, start, end):
+        """
+        Every tick of a partition with start <= timestamp <= end, one
+        query followed page by page
+        """
+        kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression":
+                "#pk = :pk AND #ts BETWEEN :start AND :end",
+            # timestamp is a reserved word
+            "ProjectionExpression": "#ts, price, tick_type",
+            "ExpressionAttributeNames": {
+                "#pk": self.schema.partition_attribute,
+                "#ts": self.schema.sort_attribute,
+            },
+            "ExpressionAttributeValues": {
+                ":pk": {"S": partition},
+                ":start": {"N": str(start)},
+                ":end": {"N": str(end)},
+            },
+        }
+        pages = []
+        while True:
+            response = self.client.query(**kwargs)
+            pages.append(decode_items(response["Items"]))
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                break
+            kwargs["ExclusiveStartKey"] = last_key
+        return concat_columns(pages)
+
+    def query_slice(self, symbol, start, end):
+        """
+        Every tick of symbol with start <= timestamp < end, from each
+        partition of the schema holding part of the range
+        """
+        first = day_start(start)
+        # end is excluded, a slice ending at midnight stays in its day
+        last = day_start(end) if end > day_start(end) else \
+            day_start(end) - DAY
+        partitions = dict.fromkeys(
+            partition
+            for day in range(first, max(first, last) + 1, DAY)
+            for partition in self.schema.partitions(symbol, day)
+        )
+        columns = concat_columns([
+            self.query_partition(partition, start, end)
+            for partition in partitions
+        ])
+        if len(partitions) > 1:
+            order = np.argsort(columns["timestamp"], kind="stable")
+            columns = {
+                field: values[order] for field, values in columns.items()
+            }
+        # BETWEEN includes end, which belongs to the next slice
+        return trim_columns(columns, end=end)
+
+    def columns(self, symbol, start, end=None):
+        """
+        Ticks of symbol with start <= timestamp < end as NumPy columns
+        sorted by timestamp
+
+        end: defaults to now
+        """
+        now = dt.datetime.now(dt.timezone.utc).timestamp()
+        end = now if end is None else end
+        days = range(day_start(start), int(end), DAY)
+
+        cached = {day: self._read_cache(symbol, day) for day in days}
+        missing = [day for day in days if cached[day] is None]
+        slices = [
+            (day, lo, min(lo + self.slice_seconds, day + DAY))
+            for day in missing
+            for lo in range(day, day + DAY, self.slice_seconds)
+            # nothing to read past now
+            if lo < now
+        ]
+        if slices:
+            logger.debug("Querying %d slices of %s", len(slices), symbol)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(
+                lambda s: self.query_slice(symbol, s[1], s[2]), slices
+            ))
+
+        for day in missing:
+            cached[day] = concat_columns([
+                result for (slice_day, _, _), result in zip(slices, results)
+                if slice_day == day
+            ])
+            # today is still being written to
+            if self.cache_dir is not None and day + DAY <= now:
+                self._write_cache(symbol, day, cached[day])
+
+        columns = concat_columns([cached[day] for day in days])
+        return trim_columns(columns, start, end)
+
+    def frame(self, symbol, start, end=None):
+        """
+        Same as columns but wrapped in a DataFrame without copying
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.columns(symbol, start, end), copy=False)
@@ -0,0 +1,352 @@
+import json
+import mmap
+import struct
+import time
+from threading import Lock
+
+from ibapi.common import BarData, TickAttrib
+from ibapi.contract import ContractDetails
+from ibapi.wrapper import EWrapper
+
+from .contract_cache import contract_from_dict, contract_to_dict
+from .stream import IBWrapper
+from .utils import setup_log
+
+
+MAGIC = b"IBREC1\n"
+# receive time in ns, kind, payload length
+RECORD = struct.Struct("<qBI")
+STRING_LENGTH = struct.Struct("<H")
+
+logger = setup_log(__name__, "local")
+
+
+class Kind:
+    """
+    Binary layout of one callback or request: fixed size fields packed
+    together, then the strings, each prefixed by its length.
+
+    fields: one character per argument, "i" int32, "q" int64,
+      "d" double, "s" string
+    """
+
+    def __init__(self, code, name, fields):
+        self.code = code
+        self.name = name
+        self.fields = fields
+        self.fixed = struct.Struct("<" + fields.replace("s", ""))
+        self.strings = [
+            position for position, field in enumerate(fields)
+            if field == "s"
+        ]
+
+    def encode(self, args):
+        if not self.strings:
+            return self.fixed.pack(*args)
+        fixed = [
+            value for position, value in enumerate(args)
+            if position not in self.strings
+        ]
+        parts = [self.fixed.pack(*fixed)]
+        for position in self.strings:
+            data = str(args[position]).encode()
+            parts.append(STRING_LENGTH.pack(len(data)))
+            parts.append(data)
+        return b"".join(parts)
+
+    def decode(self, payload):
+        fixed = list(self.fixed.unpack_from(payload))
+        if not self.strings:
+            return fixed
+        offset = self.fixed.size
+        args = []
+        for field in self.fields:
+            if field != "s":
+                args.append(fixed.pop(0))
+                continue
+            (length,) = STRING_LENGTH.unpack_from(payload, offset)
+            offset += STRING_LENGTH.size
+            args.append(payload[offset:offset + length].decode())
+            offset += length
+        return args
+
+
+KINDS = [
+    Kind(1, "tickPrice", "iidi"),
+    Kind(2, "historicalData", "isddddd"),
+    Kind(3, "historicalDataEnd", "iss"),
+    Kind(4, "orderStatus", "isdddqidisd"),
+    Kind(5, "error", "iis"),
+    Kind(6, "nextValidId", "i"),
+    Kind(7, "marketDataType", "ii"),
+    Kind(8, "contractDetails", "is"),
+    Kind(9, "contractDetailsEnd", "i"),
+    Kind(13, "tickSize", "iid"),
+    # requests, so that a replay can route the answers
+    Kind(10, "reqMktData", "is"),
+    Kind(11, "reqHistoricalData", "is"),
+    Kind(12, "reqContractDetails", "is"),
+]
+KINDS_BY_NAME = {kind.name: kind for kind in KINDS}
+KINDS_BY_CODE = {kind.code: kind for kind in KINDS}
+REQUESTS = {"reqMktData", "reqHistoricalData", "reqContractDetails"}
+
+
+def _attrib_mask(attrib):
+    return (
+        bool(getattr(attrib, "canAutoExecute", False))
+        | bool(getattr(attrib, "pastLimit", False)) << 1
+        | bool(getattr(attrib, "preOpen", False)) << 2
+    )
+
+
+def _attrib_from_mask(mask):
+    attrib = TickAttrib()
+    attrib.canAutoExecute = bool(mask & 1)
+    attrib.pastLimit = bool(mask & 2)
+    attrib.preOpen = bool(mask & 4)
+    return attrib
+
+
+class Recorder:
+    """
+    Appends callbacks to a binary log, each stamped with its receive
+    time in nanoseconds. A tick takes 33 bytes, the 13 byte header and
+    a 20 byte tickPrice payload, plus 29 bytes for the tickSize of a
+    trade.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._file.write(MAGIC)
+        self._lock = Lock()
+
+    def write(self, name, *args, ns=None):
+        kind = KINDS_BY_NAME[name]
+        payload = kind.encode(args)
+        header = RECORD.pack(ns or time.time_ns(), kind.code, len(payload))
+        with self._lock:
+            self._file.write(header)
+            self._file.write(payload)
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        logger.debug("Recorded %d messages to %s", self.records, self.path)
+
+
+class Recording:
+    """
+    Mixin recording the callbacks of an app, and the requests their
+    answers belong to, before handling them as usual:
+
+        app_cls = recording(IBApp, "session.ibrec")
+        stream(details, app_cls=app_cls)
+        app_cls.recorder.close()
+    """
+
+    recorder = None
+
+    def _record(self, name, *args):
+        if self.recorder is not None:
+            self.recorder.write(name, *args)
+
+    def tickPrice(self, reqId, tickType, price, attrib):
+        self._record("tickPrice", reqId, tickType, price,
+                     _attrib_mask(attrib))
+        super().tickPrice(reqId, tickType, price, attrib)
+
+    def tickSize(self, reqId, tickType, size):
+        self._record("tickSize", reqId, tickType, float(size))
+        super().tickSize(reqId, tickType, size)
+
+    def historicalData(self, reqId, bar):
+        self._record("historicalData", reqId, bar.date, bar.open, bar.high,
+                     bar.low, bar.close, float(bar.volume))
+        super().historicalData(reqId, bar)
+
+    def historicalDataEnd(self, reqId, start, end):
+        self._record("historicalDataEnd", reqId, start, end)
+        super().historicalDataEnd(reqId, start, end)
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice,
+                    permId, parentId, lastFillPrice, clientId, whyHeld,
+                    mktCapPrice):
+        self._record("orderStatus", orderId, status, float(filled),
+                     float(remaining), avgFillPrice, permId, parentId,
+                     lastFillPrice, clientId, whyHeld, mktCapPrice)
+        super().orderStatus(orderId, status, filled, remaining,
+                            avgFillPrice, permId, parentId, lastFillPrice,
+                            clientId, whyHeld, mktCapPrice)
+
+    def error(self, id, errorCode, errorString, *args):
+        self._record("error", id, errorCode, errorString)
+        super().error(id, errorCode, errorString, *args)
+
+    def nextValidId(self, orderId):
+        self._record("nextValidId", orderId)
+        super().nextValidId(orderId)
+
+    def marketDataType(self, reqId, marketDataType):
+        self._record("marketDataType", reqId, marketDataType)
+        super().marketDataType(reqId, marketDataType)
+
+    def contractDetails(self, reqId, contractDetails):
+        self._record("contractDetails", reqId,
+                     json.dumps(contract_to_dict(contractDetails.contract)))
+        super().contractDetails(reqId, contractDetails)
+
+    def contractDetailsEnd(self, reqId):
+        self._record("contractDetailsEnd", reqId)
+        super().contractDetailsEnd(reqId)
+
+    def reqMktData(self, reqId, contract, *args):
+        self._record("reqMktData", reqId, contract.symbol)
+        super().reqMktData(reqId, contract, *args)
+
+    def reqHistoricalData(self, reqId, contract, *args):
+        self._record("reqHistoricalData", reqId, contract.symbol)
+        super().reqHistoricalData(reqId, contract, *args)
+
+    def reqContractDetails(self, reqId, contract):
+        self._record("reqContractDetails", reqId, contract.symbol)
+        super().reqContractDetails(reqId, contract)
+
+
+def recording(app_cls, path):
+    """
+    Subclass of app_cls recording to path, see Recording
+    """
+    return type(
+        f"Recording{app_cls.__name__}", (Recording, app_cls),
+        {"recorder": Recorder(path)},
+    )
+
+
+class Replayer:
+    """
+    Plays a recording back into a wrapper, calling the same callbacks
+    in the same order with the same arguments.
+
+    speed: 1 for real time, N for N times faster, None to go as fast as
+      the wrapper allows
+
+    While replaying, wrapper.clock returns the recorded receive time,
+    so ticks stored from a replay carry the timestamps of the session.
+    Recorded requests are routed again: market data ids to their symbol
+    in wrapper.router, historical and contract details ids to a queue of
+    a TestWrapper, kept in requests.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fin:
+            if fin.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an IB recording")
+        self.requests = {}
+        self._now = 0
+
+    def __iter__(self):
+        """
+        Yields (ns, callback name, arguments) of every record
+
+        The file is memory mapped, so a long session is paged in as it
+        is replayed rather than read up front.
+        """
+        with open(self.path, "rb") as fin, \
+                mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = len(MAGIC)
+            while offset < len(data):
+                ns, code, length = RECORD.unpack_from(data, offset)
+                offset += RECORD.size
+                kind = KINDS_BY_CODE[code]
+                yield ns, kind.name, kind.decode(
+                    data[offset:offset + length]
+                )
+                offset += length
+
+    def _route(self, wrapper, name, reqId, symbol):
+        if name == "reqMktData":
+            router = getattr(wrapper, "router", None)
+            if router is not None:
+                router.register(reqId, symbol)
+        elif name == "reqHistoricalData" and \
+                hasattr(wrapper, "init_historicprices"):
+            self.requests[reqId] = wrapper.init_historicprices(reqId)[1]
+        elif name == "reqContractDetails" and \
+                hasattr(wrapper, "init_contractdetails"):
+            self.requests[reqId] = wrapper.init_contractdetails(reqId)[1]
+
+    @staticmethod
+    def _arguments(name, args):
+        if name == "tickPrice":
+            args[3] = _attrib_from_mask(args[3])
+        elif name == "historicalData":
+            bar = BarData()
+            (bar.date, bar.open, bar.high, bar.low, bar.close,
+             bar.volume) = args[1:]
+            args = [args[0], bar]
+        elif name == "contractDetails":
+            details = ContractDetails()
+            details.contract = contract_from_dict(json.loads(args[1]))
+            args = [args[0], details]
+        return args
+
+    def replay(self, wrapper, speed=None):
+        """
+        Return
+            number of callbacks replayed
+        """
+        count = 0
+        start = time.perf_counter_ns()
+        first = None
+        wrapper.clock = lambda: self._now
+        try:
+            for ns, name, args in self:
+                if first is None:
+                    first = ns
+                if speed:
+                    due = start + (ns - first) / speed
+                    wait = due - time.perf_counter_ns()
+                    if wait > 0:
+                        time.sleep(wait / 1e9)
+                self._now = ns
+                if name in REQUESTS:
+                    self._route(wrapper, name, *args)
+                    continue
+                getattr(wrapper, name)(*self._arguments(name, args))
+                count += 1
+        finally:
+            del wrapper.clock
+        return count
+
+
+class ReplayWrapper(IBWrapper):
+    """
+    Stream wrapper without a connection, handing replayed ticks to a
+    sink the way IBApp does
+    """
+
+    def __init__(self, sink, log_ticks=False):
+        EWrapper.__init__(self)
+        self.init_error()
+        self.init_events()
+        self.sink = sink
+        self.log_ticks = log_ticks
+
+
+def replay_stream(path, sink, speed=None):
+    """
+    Replays the ticks of a recorded stream into sink, then closes it
+
+    Return
+        number of callbacks replayed
+    """
+    try:
+        return Replayer(path).replay(ReplayWrapper(sink), speed)
+    finally:
+        sink.close()
@@ -0,0 +1,95 @@
+import itertools
+from threading import Lock
+
+from .utils import setup_log
+
+
+# IB reports errors for requests and for orders with the same id field,
+# so request ids are taken from a range order ids do not reach
+FIRST_REQUEST_ID = 10000000
+
+logger = setup_log(__name__, "local")
+
+
+class Route:
+
+    __slots__ = ("reqId", "target", "on_error", "errors")
+
+    def __init__(self, reqId, target, on_error):
+        self.reqId = reqId
+        self.target = target
+        self.on_error = on_error
+        self.errors = []
+
+
+class RequestRouter:
+    """
+    Allocates request ids and maps each to whatever consumes its
+    callbacks (a queue, a symbol, a handler object...).
+
+    Errors are routed by request id to the request they belong to, and
+    ids are released when the request completes or is cancelled, so one
+    connection can serve historical, market data and order traffic at
+    the same time without leaking queues or mixing up errors.
+    """
+
+    def __init__(self, first_id=FIRST_REQUEST_ID):
+        self._ids = itertools.count(first_id)
+        self._routes = {}
+        self._lock = Lock()
+
+    def allocate(self, target=None, on_error=None):
+        """
+        Returns a new request id routed to target
+
+        Params:
+            on_error: callable taking the error message, called from the
+                reader thread when IB reports an error for the request
+        """
+        with self._lock:
+            reqId = next(self._ids)
+            self._routes[reqId] = Route(reqId, target, on_error)
+        return reqId
+
+    def register(self, reqId, target=None, on_error=None):
+        """
+        Routes a request id chosen by the caller
+        """
+        with self._lock:
+            if reqId in self._routes:
+                logger.debug("Request id %s is already in use", reqId)
+            self._routes[reqId] = Route(reqId, target, on_error)
+        return reqId
+
+    def target(self, reqId):
+        route = self._routes.get(reqId)
+        return None if route is None else route.target
+
+    def errors(self, reqId):
+        route = self._routes.get(reqId)
+        return [] if route is None else list(route.errors)
+
+    def fail(self, reqId, message):
+        """
+        Hands an error to the request it belongs to
+
+        Return
+            False if no active request has that id
+        """
+        route = self._routes.get(reqId)
+        if route is None:
+            return False
+        route.errors.append(message)
+        if route.on_error is not None:
+            route.on_error(message)
+        return True
+
+    def release(self, reqId):
+        with self._lock:
+            return self._routes.pop(reqId, None)
+
+    def active(self):
+        return list(self._routes)
+
+    def __contains__(self, reqId):
+        return reqId in self._routes
@@ -0,0 +1,174 @@
+import datetime as dt
+import zlib
+from decimal import Decimal
+
+from .utils import setup_log
+
+
+DAY = 24 * 3600
+TTL_ATTRIBUTE = "expires_at"
+TTL_DAYS = 30
+
+logger = setup_log(__name__, "local")
+
+
+def day_key(timestamp):
+    """
+    UTC date of an epoch timestamp, "YYYY-MM-DD"
+    """
+    day = int(timestamp) // DAY * DAY
+    return dt.datetime.fromtimestamp(day, dt.timezone.utc).strftime(
+        "%Y-%m-%d"
+    )
+
+
+class LegacySchema:
+    """
+    Layout of the original "stock" table: one partition per symbol,
+    sorted by timestamp. Every tick of a busy symbol lands on the same
+    partition, see BucketedSchema.
+
+    Schemas tell the writer (common.sink.DynamoDBWriter) which keys to
+    add to an item and the reader (common.query.TickQuery) which
+    partitions hold a day of ticks, so neither the ticks of
+    IBWrapper.tickPrice nor the columns read back depend on the layout.
+    """
+
+    partition_attribute = "symbol"
+    sort_attribute = "timestamp"
+
+    def __init__(self, table_name="stock"):
+        self.table_name = table_name
+
+    @property
+    def key_attributes(self):
+        return [self.partition_attribute, self.sort_attribute]
+
+    def prepare(self, items):
+        """
+        Items as stored, with their key and other derived attributes
+        """
+        return items
+
+    def partitions(self, symbol, day):
+        """
+        Partition key values holding the ticks of symbol on a day
+        """
+        return [symbol]
+
+    def table_definition(self):
+        """
+        Keyword arguments of create_table for this layout
+        """
+        return {
+            "TableName": self.table_name,
+            "AttributeDefinitions": [
+                {"AttributeName": self.partition_attribute,
+                 "AttributeType": "S"},
+                {"AttributeName": self.sort_attribute,
+                 "AttributeType": "N"},
+            ],
+            "KeySchema": [
+                {"AttributeName": self.partition_attribute,
+                 "KeyType": "HASH"},
+                {"AttributeName": self.sort_attribute, "KeyType": "RANGE"},
+            ],
+            "BillingMode": "PAY_PER_REQUEST",
+        }
+
+    def create_table(self, dynamodb, **kwargs):
+        """
+        Creates the table and waits until it exists
+
+        dynamodb: boto3 DynamoDB service resource
+        kwargs: extra create_table arguments, e.g. Tags
+        """
+        table = dynamodb.create_table(**self.table_definition(), **kwargs)
+        table.wait_until_exists()
+        return table
+
+
+class BucketedSchema(LegacySchema):
+    """
+    Time bucketed layout: the partition key "pk" is "SYMBOL#YYYY-MM-DD",
+    one partition per symbol and UTC day, so a partition stops growing
+    at midnight and a day is read without going through older ones.
+
+    With shards > 1 the ticks of a day are further spread over
+    "SYMBOL#YYYY-MM-DD#0" to "#<shards - 1>" by a hash of their sort
+    key, which keeps rewriting an item idempotent. Reads query every
+    shard of a day and merge them.
+
+    Items keep their symbol attribute and get an expires_at attribute,
+    epoch seconds ttl_days after the tick, for the table's TTL to
+    delete raw ticks. ttl_days=None keeps them forever.
+    """
+
+    partition_attribute = "pk"
+
+    def __init__(self, table_name="stock_ticks", shards=1,
+                 ttl_days=TTL_DAYS):
+        super().__init__(table_name)
+        self.shards = shards
+        self.ttl_days = ttl_days
+
+    def partition_key(self, symbol, timestamp):
+        key = f"{symbol}#{day_key(timestamp)}"
+        if self.shards > 1:
+            # hashed in ns, DynamoDB may drop trailing zeros of a number
+            ns = int(Decimal(str(timestamp)).scaleb(9))
+            key = f"{key}#{zlib.crc32(str(ns).encode()) % self.shards}"
+        return key
+
+    def expires_at(self, timestamp):
+        return int(timestamp) + self.ttl_days * DAY
+
+    def prepare(self, items):
+        prepared = []
+        for item in items:
+            timestamp = item[self.sort_attribute]
+            item = dict(item)
+            item[self.partition_attribute] = self.partition_key(
+                item["symbol"], timestamp
+            )
+            if self.ttl_days is not None:
+                item[TTL_ATTRIBUTE] = self.expires_at(timestamp)
+            prepared.append(item)
+        return prepared
+
+    def partitions(self, symbol, day):
+        key = f"{symbol}#{day_key(day)}"
+        if self.shards == 1:
+            return [key]
+        return [f"{key}#{shard}" for shard in range(self.shards)]
+
+    def create_table(self, dynamodb, **kwargs):
+        table = super().create_table(dynamodb, **kwargs)
+        if self.ttl_days is not None:
+            dynamodb.meta.client.update_time_to_live(
+                TableName=self.table_name,
+                TimeToLiveSpecification={
+                    "Enabled": True, "AttributeName": TTL_ATTRIBUTE,
+                },
+            )
+        logger.debug("Created bucketed table %s with %d shards",
+                     self.table_name, self.shards)
+        return table
+
+
+SCHEMAS = ("legacy", "bucketed")
+
+
+def make_schema(name="legacy", table_name=None, shards=1,
+                ttl_days=TTL_DAYS):
+    """
+    Schema from command line style options
+
+    ttl_days: 0 or None to keep raw ticks forever
+    """
+    if name == "legacy":
+        return LegacySchema(table_name or "stock")
+    if name == "bucketed":
+        return BucketedSchema(table_name or "stock_ticks", shards,
+                              ttl_days or None)
+    raise ValueError(f"schema must be one of {SCHEMAS}, not {name!r}")
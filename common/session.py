@@ -0,0 +1,253 @@
+import time
+from threading import Event, Lock
+
+from ibapi.utils import iswrapper
+
+from .events import is_order_rejection
+from .trade import (
+    IBApp, create_contract, orderCreate, order_ack_seconds,
+    order_fill_seconds,
+)
+from .utils import setup_log
+
+
+# statuses after which IB sends no further update for an order
+DONE_STATUSES = {"Filled", "Cancelled", "ApiCancelled", "Inactive"}
+
+logger = setup_log(__name__, "local")
+
+
+class OrderHandle:
+    """
+    Tracks one order placed through a TradingSession, updated from the
+    orderStatus and error callbacks
+
+    Attributes:
+        status: last status reported by IB
+        filled, remaining, avg_fill_price: from the last orderStatus
+        error: error message if IB rejected or cancelled the order
+        warnings: other messages IB sent about the order, which leave
+            it live
+    """
+
+    def __init__(self, orderId, symbol, action, quantity):
+        self.orderId = orderId
+        self.symbol = symbol
+        self.action = action
+        self.quantity = quantity
+        self.status = None
+        self.filled = 0
+        self.remaining = quantity
+        self.avg_fill_price = 0.0
+        self.error = None
+        self.warnings = []
+
+        self.submitted_at = time.perf_counter()
+        self.acked_at = None
+        self.filled_at = None
+        self._acked = Event()
+        self._done = Event()
+
+    def _update(self, status, filled, remaining, avgFillPrice):
+        now = time.perf_counter()
+        self.status = status
+        self.filled = filled
+        self.remaining = remaining
+        self.avg_fill_price = avgFillPrice
+        if self.acked_at is None:
+            self.acked_at = now
+            self._acked.set()
+            order_ack_seconds.record_ns((now - self.submitted_at) * 1e9)
+        if status == "Filled" and self.filled_at is None:
+            self.filled_at = now
+            order_fill_seconds.record_ns((now - self.submitted_at) * 1e9)
+        if status in DONE_STATUSES:
+            self._done.set()
+
+    def _fail(self, message):
+        self.error = message
+        self._acked.set()
+        self._done.set()
+
+    def wait_ack(self, timeout=None):
+        """
+        Waits for the first status of the order
+
+        Return
+            False on timeout
+        """
+        return self._acked.wait(timeout)
+
+    def wait(self, timeout=None):
+        """
+        Waits until the order is filled, cancelled or rejected
+
+        Return
+            False on timeout
+        """
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def ack_latency(self):
+        """
+        Seconds from submission to the first orderStatus, None until then
+        """
+        if self.acked_at is None:
+            return None
+        return self.acked_at - self.submitted_at
+
+    @property
+    def fill_latency(self):
+        """
+        Seconds from submission to the Filled status, None until then
+        """
+        if self.filled_at is None:
+            return None
+        return self.filled_at - self.submitted_at
+
+    def __repr__(self):
+        return (
+            f"OrderHandle({self.orderId} {self.action} {self.quantity} "
+            f"{self.symbol} status={self.status} error={self.error})"
+        )
+
+
+class TradingApp(IBApp):
+    """
+    IBApp routing orderStatus and order errors to the OrderHandle of
+    each order.
+
+    Only rejection codes (ORDER_REJECT_CODES) fail a handle; any other
+    message about an order is kept in its warnings and the handle waits
+    for a final orderStatus. Errors are logged rather than queued, as
+    nothing reads the queue of a session that stays up all day.
+    """
+
+    def __init__(self, ipaddress, portid, clientid):
+        self.handles = {}
+        IBApp.__init__(self, ipaddress, portid, clientid)
+
+    @iswrapper
+    def error(self, id, errorCode, errorString):
+        message = f"errorcode {errorCode} that says {errorString}"
+        logger.debug("IB returns an error with %s %s", id, message)
+        handle = self.handles.get(id)
+        if handle is None:
+            return
+        if is_order_rejection(errorCode):
+            del self.handles[id]
+            handle._fail(message)
+        else:
+            handle.warnings.append(message)
+
+    @iswrapper
+    def orderStatus(
+            self, orderId: int, status: str, filled: float,
+            remaining: float, avgFillPrice: float, permId: int,
+            parentId: int, lastFillPrice: float, clientId: int,
+            whyHeld: str, mktCapPrice: float
+    ):
+        super().orderStatus(
+            orderId, status, filled, remaining, avgFillPrice, permId,
+            parentId, lastFillPrice, clientId, whyHeld, mktCapPrice,
+        )
+        handle = self.handles.get(orderId)
+        if handle is None:
+            return
+        handle._update(status, filled, remaining, avgFillPrice)
+        if handle.done:
+            del self.handles[orderId]
+
+
+class TradingSession:
+    """
+    Long-lived trading connection.
+
+    Order IDs are allocated locally starting from nextValidId, so any
+    number of orders can be placed concurrently over the one connection,
+    each returning an OrderHandle to wait on.
+
+        with TradingSession() as session:
+            handles = [
+                session.place_order(symbol, "BUY", 1)
+                for symbol in ("AAPL", "TSLA")
+            ]
+            for handle in handles:
+                handle.wait(timeout=10)
+            print(session.latencies())
+    """
+
+    def __init__(self, ipaddress="127.0.0.1", portid=7497, clientid=0,
+                 timeout=10, app_cls=TradingApp):
+        logger.debug("Connecting to the server...")
+        self.app = app_cls(ipaddress, portid, clientid)
+        if not self.app.wait_until_ready(timeout):
+            self.app.disconnect()
+            raise ConnectionError("No nextValidId received from the server")
+
+        self.orders = {}
+        self._next_order_id = self.app.nextOrderId
+        self._lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def next_order_id(self):
+        with self._lock:
+            orderId = self._next_order_id
+            self._next_order_id += 1
+        return orderId
+
+    def place_order(self, symbol, action, quantity, contract=None,
+                    order=None):
+        """
+        Sends an order without waiting for the server
+
+        Params:
+            contract, order: prebuilt objects, by default a SMART routed
+                US stock and a market order (create_contract/orderCreate)
+
+        Return
+            OrderHandle of the order
+        """
+        contract = contract or create_contract(symbol)
+        order = order or orderCreate(action, quantity)
+
+        orderId = self.next_order_id()
+        handle = OrderHandle(orderId, symbol, action, quantity)
+        self.orders[orderId] = handle
+        self.app.handles[orderId] = handle
+        self.app.placeOrder(orderId, contract, order)
+        return handle
+
+    def cancel_order(self, handle):
+        self.app.cancelOrder(handle.orderId)
+
+    def latencies(self):
+        """
+        Submit-to-ack and submit-to-fill latencies of every order placed
+        in this session, in milliseconds
+        """
+        return [
+            {
+                "order_id": handle.orderId,
+                "symbol": handle.symbol,
+                "status": handle.status,
+                "ack_ms": None if handle.ack_latency is None
+                else handle.ack_latency * 1000,
+                "fill_ms": None if handle.fill_latency is None
+                else handle.fill_latency * 1000,
+            }
+            for handle in self.orders.values()
+        ]
+
+    def close(self):
+        logger.debug("Disconnecting from the server...")
+        self.app.disconnect()
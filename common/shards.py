@@ -0,0 +1,290 @@
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+from .stream import IBApp
+from .tickbus import CAPACITY, TickBusReader, TickBus
+from .utils import setup_log
+
+
+CLIENT_IDS = (1, 2, 3, 4)
+# how long the merge holds ticks back waiting for slower shards
+LATENESS = 0.05
+POLL_INTERVAL = 0.005
+
+logger = setup_log(__name__, "local")
+
+
+def _shard_main(index, bus_name, client_id, ipaddress, portid, app_cls,
+                capacity, commands, status):
+    """
+    Body of a shard process: one connection publishing the ticks of its
+    subscriptions to its own tick bus
+    """
+    bus = TickBus(bus_name, capacity)
+    app = app_cls(ipaddress, portid, client_id, sink=bus, log_ticks=False)
+    try:
+        if not app.wait_until_ready(timeout=10):
+            status.put(("dropped", index))
+            return
+        status.put(("ready", index))
+        while True:
+            try:
+                command, contracts = commands.get(timeout=0.5)
+            except queue.Empty:
+                if not app.isConnected():
+                    status.put(("dropped", index))
+                    return
+                continue
+            if command == "stop":
+                return
+            for contract in contracts:
+                app.stream(contract, wait=False)
+    finally:
+        app.disconnect()
+        bus.close()
+
+
+class Shard:
+
+    def __init__(self, index, client_id, process, commands, bus_name):
+        self.index = index
+        self.client_id = client_id
+        self.process = process
+        self.commands = commands
+        self.bus_name = bus_name
+        self.reader = None
+        self.contracts = []
+        self.alive = False
+
+
+class ShardedStream:
+    """
+    Spreads market data subscriptions over several IB connections, one
+    process per client id, and merges their ticks into one stream
+    ordered by receive time.
+
+    Every shard publishes to its own TickBus, which this process reads
+    in bulk. Ticks are held back for lateness seconds so that those of
+    slower shards can be merged in order, then handed to the sink. When
+    a shard loses its connection its subscriptions are moved to the
+    remaining shards.
+
+        with ShardedStream(contracts, sink, client_ids=range(1, 9)) as s:
+            s.run()
+
+    Params:
+        contracts: Contracts to subscribe to
+        sink: where the merged ticks go, any object with put and close
+        client_ids: one shard per client id
+        app_cls: app class of the shards, see common.stream.IBApp
+        capacity: slots of each shard's tick bus
+    """
+
+    def __init__(self, contracts, sink, client_ids=CLIENT_IDS,
+                 ipaddress="127.0.0.1", portid=7497, app_cls=IBApp,
+                 capacity=CAPACITY, lateness=LATENESS):
+        self.contracts = list(contracts)
+        self.sink = sink
+        self.lateness_ns = int(lateness * 1e9)
+        self.shards = []
+        self.rebalances = 0
+        self._status = multiprocessing.Queue()
+        self._pending = []
+        self._closed = False
+
+        prefix = f"ib_shard_{os.getpid()}"
+        for index, client_id in enumerate(client_ids):
+            commands = multiprocessing.Queue()
+            bus_name = f"{prefix}_{index}"
+            process = multiprocessing.Process(
+                target=_shard_main,
+                args=(index, bus_name, client_id, ipaddress, portid,
+                      app_cls, capacity, commands, self._status),
+                name=f"ib-shard-{client_id}",
+                daemon=True,
+            )
+            process.start()
+            self.shards.append(
+                Shard(index, client_id, process, commands, bus_name)
+            )
+        self._start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start(self, timeout=15):
+        deadline = time.monotonic() + timeout
+        waiting = len(self.shards)
+        while waiting and time.monotonic() < deadline:
+            try:
+                state, index = self._status.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            waiting -= 1
+            shard = self.shards[index]
+            if state == "ready":
+                shard.reader = TickBusReader(shard.bus_name)
+                shard.alive = True
+            else:
+                logger.debug("Shard %s failed to connect", shard.client_id)
+
+        live = self.live_shards()
+        if not live:
+            self.close()
+            raise ConnectionError("No shard could connect to the server")
+        for position, contract in enumerate(self.contracts):
+            live[position % len(live)].contracts.append(contract)
+        for shard in live:
+            shard.commands.put(("subscribe", shard.contracts))
+        logger.debug(
+            "Subscribed %d contracts over %d shards",
+            len(self.contracts), len(live),
+        )
+
+    def live_shards(self):
+        return [shard for shard in self.shards if shard.alive]
+
+    def assignments(self):
+        """
+        Return
+            dict of client id to the symbols its shard streams
+        """
+        return {
+            shard.client_id: [contract.symbol for contract in shard.contracts]
+            for shard in self.live_shards()
+        }
+
+    def _release(self, shard):
+        """
+        Reads what is left on a shard's bus and detaches from it
+        """
+        self._pending.append(shard.reader.read())
+        if shard.process.exitcode not in (None, 0):
+            # killed before it could remove its bus
+            try:
+                shard.reader.memory.unlink()
+            except FileNotFoundError:
+                pass
+        shard.reader.close()
+        shard.reader = None
+
+    def _drop(self, shard):
+        shard.alive = False
+        self._release(shard)
+
+        orphans, shard.contracts = shard.contracts, []
+        live = self.live_shards()
+        logger.debug(
+            "Shard %s dropped, moving %d contracts to %d shards",
+            shard.client_id, len(orphans), len(live),
+        )
+        if not live:
+            return
+        moved = {}
+        for contract in orphans:
+            target = min(live, key=lambda other: len(other.contracts))
+            target.contracts.append(contract)
+            moved.setdefault(target.index, []).append(contract)
+        for index, contracts in moved.items():
+            self.shards[index].commands.put(("subscribe", contracts))
+        self.rebalances += 1
+
+    def _check_shards(self):
+        while True:
+            try:
+                state, index = self._status.get_nowait()
+            except queue.Empty:
+                break
+            shard = self.shards[index]
+            if state == "dropped" and shard.alive:
+                self._drop(shard)
+        for shard in self.live_shards():
+            if not shard.process.is_alive():
+                self._drop(shard)
+
+    def poll(self):
+        """
+        Reads every shard and hands the ticks that are old enough to be
+        in order to the sink
+
+        Return
+            number of ticks handed over
+        """
+        self._check_shards()
+        for shard in self.live_shards():
+            self._pending.append(shard.reader.read())
+        return self._merge()
+
+    def _merge(self, final=False):
+        pending = [slots for slots in self._pending if len(slots)]
+        if not pending:
+            self._pending = []
+            return 0
+        slots = np.concatenate(pending)
+        slots = slots[np.argsort(slots["ns"], kind="stable")]
+        if final:
+            ready, self._pending = slots, []
+        else:
+            cutoff = time.time_ns() - self.lateness_ns
+            split = np.searchsorted(slots["ns"], cutoff, side="right")
+            ready, self._pending = slots[:split], [slots[split:]]
+
+        for symbol, ns, price, size, tick_type in zip(
+                ready["symbol"].tolist(), ready["ns"].tolist(),
+                ready["price"].tolist(), ready["size"].tolist(),
+                ready["tick_type"].tolist(),
+        ):
+            self.sink.put({
+                "symbol": symbol.decode(),
+                "timestamp": ns // 1000000000,
+                "ns": ns,
+                "price": price,
+                "size": size,
+                "tick_type": tick_type,
+            })
+        return len(ready)
+
+    def lost(self):
+        """
+        Ticks the merge fell too far behind to read, per client id
+        """
+        return {
+            shard.client_id: shard.reader.lost
+            for shard in self.live_shards()
+        }
+
+    def run(self, duration=None, poll_interval=POLL_INTERVAL):
+        """
+        Merges the shards' ticks into the sink until duration seconds
+        have passed (forever by default) or every shard dropped
+        """
+        deadline = None if duration is None else \
+            time.monotonic() + duration
+        while self.live_shards():
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if not self.poll():
+                time.sleep(poll_interval)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for shard in self.shards:
+            if shard.process.is_alive():
+                shard.commands.put(("stop", None))
+        for shard in self.shards:
+            shard.process.join(timeout=5)
+            # the mapping outlives the shard, read what it left
+            if shard.reader is not None:
+                self._release(shard)
+            shard.alive = False
+        self._merge(final=True)
+        self.sink.close()
@@ -0,0 +1,226 @@
+import queue
+import time
+from threading import Thread
+
+from . import metrics
+from .codec import encode_item
+from .utils import setup_log
+
+
+# DynamoDB BatchWriteItem accepts at most 25 put requests per call
+BATCH_SIZE = 25
+FLUSH_INTERVAL = 1.0
+MAX_QUEUE_SIZE = 10000
+STOP = object()
+
+logger = setup_log(__name__, "local")
+
+
+class BufferedSink:
+    """
+    Buffers ticks in a bounded in-memory queue and hands them to a
+    writer in batches from a background thread, so that the IB callback
+    thread never waits on storage.
+
+    A batch is flushed as soon as it holds batch_size ticks or
+    flush_interval seconds after the previous flush, whichever comes
+    first. When the queue is full new ticks are dropped and counted
+    instead of blocking the caller.
+
+    Params:
+        writer: callable taking a list of ticks and persisting them
+        batch_size: number of ticks per write
+        flush_interval: maximum number of seconds a tick stays buffered
+        maxsize: capacity of the queue
+        name: label of the sink's metrics in common.metrics
+    """
+
+    def __init__(
+            self,
+            writer,
+            batch_size=BATCH_SIZE,
+            flush_interval=FLUSH_INTERVAL,
+            maxsize=MAX_QUEUE_SIZE,
+            name="ticks",
+    ):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # backpressure counters
+        self.accepted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._closed = False
+
+        labels = {"sink": name}
+        self._latency = metrics.histogram(
+            "sink_tick_to_write_seconds",
+            "Time from put of the oldest tick of a batch until its write "
+            "completed",
+            labels,
+        )
+        self._batch_sizes = metrics.histogram(
+            "sink_batch_size", "Ticks per write", labels, scale=1
+        )
+        self._write_latency = metrics.histogram(
+            "sink_write_seconds", "Duration of a write", labels
+        )
+        metrics.gauge("sink_queue_depth", "Ticks waiting to be written",
+                      labels, function=self.qsize)
+        metrics.gauge("sink_dropped", "Ticks dropped on a full queue",
+                      labels, function=lambda: self.dropped)
+        metrics.gauge("sink_failed", "Ticks lost to failed writes",
+                      labels, function=lambda: self.failed)
+
+        thread = Thread(target=self._run, name="tick-sink", daemon=True)
+        thread.start()
+        setattr(self, "_thread", thread)
+
+    def put(self, tick):
+        """
+        Enqueues a tick without blocking
+
+        Return
+            True if the tick was accepted, False if it was dropped
+        """
+        if self._closed:
+            self.dropped += 1
+            return False
+        try:
+            # put time, for the tick to write latency
+            self._queue.put_nowait((time.perf_counter_ns(), tick))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "queued": self.qsize(),
+        }
+
+    def close(self, timeout=None):
+        """
+        Stops accepting ticks and waits until everything already queued
+        has been written
+
+        Params:
+            timeout: how long to wait for the drain before giving up
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.debug("Tick sink did not drain within %s seconds", timeout)
+        logger.debug("Tick sink closed: %s", self.stats())
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is STOP:
+                self._flush(batch)
+                return
+
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or \
+                    time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter_ns()
+        try:
+            self.writer([tick for _, tick in batch])
+        except Exception:
+            logger.exception("Failed to write %d ticks", len(batch))
+            self.failed += len(batch)
+            return
+        done = time.perf_counter_ns()
+        self.written += len(batch)
+        self.batches += 1
+
+        self._write_latency.record(done - start)
+        self._batch_sizes.record(len(batch))
+        # one sample per batch keeps the flusher off the GIL, the oldest
+        # tick being the one that waited longest
+        self._latency.record(done - batch[0][0])
+
+
+class DynamoDBWriter:
+    """
+    Writes a batch of items to a DynamoDB table with batch_writer,
+    which groups them into BatchWriteItem calls of up to 25 items and
+    retries unprocessed ones. Float values are converted to Decimal
+    with common.codec.encode_item.
+
+    Params:
+        table: boto3 DynamoDB Table resource
+        overwrite_by_pkeys: primary key attributes used to de-duplicate
+            items within a batch, the last one wins. Defaults to the
+            key of schema.
+        schema: table layout from common.schema adding the keys of the
+            items, e.g. the day buckets of BucketedSchema
+    """
+
+    def __init__(self, table, overwrite_by_pkeys=None, schema=None):
+        self.table = table
+        if overwrite_by_pkeys is None and schema is not None:
+            overwrite_by_pkeys = schema.key_attributes
+        self.overwrite_by_pkeys = overwrite_by_pkeys
+        self.schema = schema
+
+    def __call__(self, items):
+        if self.schema is not None:
+            items = self.schema.prepare(items)
+        with self.table.batch_writer(
+                overwrite_by_pkeys=self.overwrite_by_pkeys) as batch:
+            for item in items:
+                batch.put_item(Item=encode_item(item))
+
+
+class FanoutSink:
+    """
+    Hands every tick to several sinks, e.g. storage and a live
+    indicator engine
+    """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def put(self, tick):
+        accepted = True
+        for sink in self.sinks:
+            accepted = sink.put(tick) and accepted
+        return accepted
+
+    def close(self, timeout=None):
+        for sink in self.sinks:
+            sink.close(timeout)
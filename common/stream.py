@@ -1,29 +1,47 @@
 import queue
 import time
-from threading import Thread
-from decimal import Decimal
+from threading import Event, Thread
 
-import boto3
 from ibapi.wrapper import EWrapper
 from ibapi.client import EClient
 from ibapi.contract import Contract
 from ibapi.utils import iswrapper
 
 
+from . import metrics
+from .events import RequestEvents, is_notice
+from .ingest import IngestPipeline
+from .router import RequestRouter
+from .schema import LegacySchema
+from .sink import BufferedSink, DynamoDBWriter
+from .tickstore import TickStore, TICK_STORE_DIR
 from .utils import setup_log
 
 
 table_name = "stock"
 partition_key = "symbol"
 sort_key = "timestamp"
-mapping = None
 
-table = boto3.resource("dynamodb").Table(table_name)
+# trade prices (LAST, DELAYED_LAST) and the size tick type IB sends
+# right after each of them, in the same message
+TRADE_SIZE_TYPES = {4: 5, 68: 71}
+
 logger = setup_log(__name__, "local")
+# table name -> boto3 Table resource
+_tables = {}
+
+ticks_received = metrics.counter(
+    "ticks_received_total", "tickPrice callbacks of subscriptions"
+)
 
 
 class IBWrapper(EWrapper):
 
+    # log every tick at DEBUG level
+    log_ticks = True
+    # receive time of the ticks, replaced when replaying a recording
+    clock = staticmethod(time.time_ns)
+
     @iswrapper
     def error(self, id, errorCode, errorString):
         # Overrides the native method
@@ -31,19 +49,63 @@ class IBWrapper(EWrapper):
             f"IB returns an error with {id} errorcode {errorCode} "
             f"that says {errorString}"
         )
-        self.my_errors_queue.put(errormessage)
+        if is_notice(errorCode):
+            self.my_errors_queue.put(errormessage)
+            return
+        self.request_events.fail(id, errormessage)
+        if not self.router.fail(id, errormessage):
+            self.my_errors_queue.put(errormessage)
+
+    @iswrapper
+    def nextValidId(self, orderId: int):
+        # first message the server sends once the connection is up
+        super().nextValidId(orderId)
+        self.connection_ready.set()
+
+    @iswrapper
+    def marketDataType(self, reqId, marketDataType):
+        # sent in answer to every reqMktData, before its first tick
+        self.request_events.set(reqId)
 
     @iswrapper
     def tickPrice(self, reqId, tickType, price, attrib):
-        symbol = mapping[reqId]
-        logger.debug("The current ask price for %s is: %s", symbol, price)
+        self.request_events.set(reqId)
+        symbol = self.router.target(reqId)
+        if symbol is None:
+            return
+        ticks_received.inc()
+        if self.log_ticks:
+            logger.debug("The current ask price for %s is: %s", symbol, price)
+        pending = self.pending_trades.pop(reqId, None)
+        if pending is not None:
+            # its size never came, keep the trade anyway
+            self.sink.put(pending)
         if price > 0:
+            ns = self.clock()
             data = {
                 partition_key: symbol,
-                sort_key: int(time.time()),
-                "price": Decimal(str(price)),
+                sort_key: ns // 1000000000,
+                "ns": ns,
+                # converted to Decimal in batches by the DynamoDB writer
+                "price": price,
+                "tick_type": tickType,
             }
-            table.put_item(Item=data)
+            if tickType in TRADE_SIZE_TYPES:
+                # held until tickSize gives the traded size
+                self.pending_trades[reqId] = data
+                return
+            self.sink.put(data)
+
+    @iswrapper
+    def tickSize(self, reqId, tickType, size):
+        pending = self.pending_trades.get(reqId)
+        if pending is None or \
+                TRADE_SIZE_TYPES[pending["tick_type"]] != tickType:
+            # sizes of bids and asks, or size updates without a trade
+            return
+        del self.pending_trades[reqId]
+        pending["size"] = int(size)
+        self.sink.put(pending)
 
     def init_error(self):
         error_queue = queue.Queue()
@@ -61,19 +123,66 @@ class IBWrapper(EWrapper):
                 return None
         return None
 
+    def init_events(self):
+        self.connection_ready = Event()
+        self.request_events = RequestEvents()
+        # market data request id -> symbol
+        self.router = RequestRouter()
+        # request id -> last trade waiting for its size
+        self.pending_trades = {}
+
+    def wait_until_ready(self, timeout=10):
+        """
+        Blocks until the server has acknowledged the connection
+
+        Return
+            False if it did not within timeout seconds
+        """
+        return self.connection_ready.wait(timeout)
+
 
 class IBClient(EClient):
 
     def __init__(self, wrapper):
         EClient.__init__(self, wrapper)
 
-    def stream(self, contract: Contract, data_id):
+    def stream(self, contract: Contract, data_id=None, wait=True):
+        """
+        Requests market data for a contract
+
+        data_id: request id to use, allocated by the router if not given
+        wait: block until the server acknowledges the request or reports
+          an error for it, see wait_for_stream
+
+        Return
+            the request id
+        """
+        if data_id is None:
+            data_id = self.wrapper.router.allocate(contract.symbol)
+        else:
+            self.wrapper.router.register(data_id, contract.symbol)
+
         # Request Market Data
         logger.debug("Sending request to the server")
+        self.wrapper.request_events.expect(data_id)
         self.reqMktData(data_id, contract, "", False, False, [])
 
+        if wait:
+            self.wait_for_stream(data_id)
+        return data_id
+
+    def cancel_stream(self, data_id):
+        self.cancelMktData(data_id)
+        self.wrapper.router.release(data_id)
+
+    def wait_for_stream(self, data_id, timeout=5):
         logger.debug("Waiting for error response if there is any")
-        time.sleep(5)
+        answered, error = self.wrapper.request_events.wait(data_id, timeout)
+        if not answered:
+            logger.debug("No answer for request %s", data_id)
+        elif error:
+            logger.debug("Error:")
+            logger.debug(error)
 
         while self.wrapper.is_error():
             logger.debug("Error:")
@@ -81,14 +190,21 @@ class IBClient(EClient):
 
 
 class IBApp(IBWrapper, IBClient):
+    """
+    log_ticks: log every tick at DEBUG level, which costs throughput on
+      busy streams
+    """
 
-    def __init__(self, ipaddress, portid, clientid):
+    def __init__(self, ipaddress, portid, clientid, sink=None,
+                 log_ticks=True):
         self.init_error()
+        self.init_events()
+        self.sink = sink if sink is not None else default_sink()
+        self.log_ticks = log_ticks
 
         IBWrapper.__init__(self)
         IBClient.__init__(self, wrapper=self)
 
-
         self.connect(ipaddress, portid, clientid)
 
         self.reqMarketDataType(3)
@@ -98,27 +214,83 @@ class IBApp(IBWrapper, IBClient):
         setattr(self, "_thread", thread)
 
 
-def stream(details: list):
+def get_table(name=table_name):
+    """
+    A DynamoDB table resource, created on first use so that importing
+    this module needs neither boto3 nor AWS credentials. Point
+    AWS_ENDPOINT_URL_DYNAMODB at DynamoDB Local to run without AWS.
+    """
+    table = _tables.get(name)
+    if table is None:
+        import boto3
+        table = _tables[name] = boto3.resource("dynamodb").Table(name)
+    return table
+
+
+def __getattr__(name):
+    # common.stream.table used to be created at import time
+    if name == "table":
+        return get_table()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def default_sink(interval=1.0, mode="last", schema=None):
+    """
+    Buffered sink writing ticks to the DynamoDB table in batches, after
+    conflating them per symbol and tick type, see IngestPipeline
+
+    interval: conflation interval in seconds, 0 to store every tick
+    mode: "last" or "ohlc"
+    schema: table layout, common.schema.LegacySchema (the "stock"
+      table) by default, or a BucketedSchema
+    """
+    schema = schema if schema is not None else LegacySchema(table_name)
+    writer = DynamoDBWriter(get_table(schema.table_name), schema=schema)
+    return IngestPipeline(BufferedSink(writer), interval, mode)
+
+
+def tickstore_sink(root=TICK_STORE_DIR):
+    """
+    Buffered sink appending ticks to the local TickStore
+    """
+    return BufferedSink(TickStore(root))
+
+
+def stream(details: list, sink=None, log_ticks=True, app_cls=IBApp):
     """
     details: a list of dictionary
       [item1, item2, item3]
 
     item = {
         "contract": contract,
-        "data_id": data_id,
+        "data_id": data_id,  # optional, allocated when missing
     }
+
+    sink: where the ticks go, any object with put(tick) and close().
+      Defaults to a buffered DynamoDB sink, use tickstore_sink() to
+      keep the ticks on local disk instead, and common.sink.FanoutSink to
+      also feed live consumers such as common.indicators.IndicatorEngine.
+
+    log_ticks: False to stop logging every tick
+
+    app_cls: the app class to connect with, e.g. one mixing in
+      common.recorder.Recording or common.fakeib.FakeIB
     """
-    global mapping
-    mapping = {
-        detail["data_id"]: detail["contract"].symbol for detail in details
-    }
     logger.debug("Connecting to the server...")
-    app = IBApp("127.0.0.1", 7497, 0)
+    sink = sink if sink is not None else default_sink()
+    app = app_cls("127.0.0.1", 7497, 0, sink=sink, log_ticks=log_ticks)
 
-    time.sleep(5)
+    if not app.wait_until_ready(timeout=5):
+        logger.debug("Server did not confirm the connection")
     logger.debug("Inputting contract information")
-    for item in details:
-        app.stream(**item)
+    # send every request first, then wait for the answers together
+    data_ids = [app.stream(**item, wait=False) for item in details]
+    for data_id in data_ids:
+        app.wait_for_stream(data_id)
 
     logger.debug("Starting app to stream data")
-    app.run()
+    try:
+        app.run()
+    finally:
+        logger.debug("Draining buffered ticks")
+        sink.close()
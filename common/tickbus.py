@@ -0,0 +1,234 @@
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .utils import setup_log
+
+
+BUS_NAME = "ib_ticks"
+CAPACITY = 1 << 16
+MAGIC = 0x5449434B42555331
+
+# header: magic, capacity, head (number of ticks published), closed
+HEADER = struct.Struct("<QQQQ")
+HEADER_SIZE = 64
+HEAD_OFFSET = 16
+CLOSED_OFFSET = 24
+
+# slot: sequence word of the seqlock, then the tick. Sequence and head
+# words use the native format, which struct stores with one 8 byte
+# copy, the standard sizes ("<Q") are written byte by byte and could be
+# read half written. The layout is little-endian like the hosts it
+# targets.
+SEQ = struct.Struct("Q")
+TICK = struct.Struct("<qdqi16s")
+SLOT_DTYPE = np.dtype({
+    "names": ["seq", "ns", "price", "size", "tick_type", "symbol"],
+    "formats": ["<u8", "<i8", "<f8", "<i8", "<i4", "S16"],
+    "offsets": [0, 8, 16, 24, 32, 36],
+    "itemsize": 56,
+})
+
+logger = setup_log(__name__, "local")
+
+
+def _attach(name):
+    """
+    Maps an existing block without handing it to this process'
+    resource tracker, which would unlink it when a reader exits
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # before Python 3.13 attaching always registers the block, and
+    # unregistering it would also drop the creator's registration when
+    # the tracker is shared with a parent process
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class TickBus:
+    """
+    Publishing side of a shared memory tick bus: a ring of capacity
+    slots written by this process only, read by any number of
+    TickBusReader in other processes without locks or copies on the
+    writer side.
+
+    Every slot is guarded by a sequence word (a seqlock): it is odd
+    while the slot is written and 2 * ticket + 2 once the tick with
+    that ticket is complete, so a reader can tell a valid slot from one
+    being or already overwritten. The ring never blocks the writer, a
+    reader falling more than capacity ticks behind loses the oldest
+    ones and counts them.
+
+    The bus is a sink for common.stream, e.g. next to the storage sink:
+
+        bus = TickBus()
+        stream(details, sink=FanoutSink([default_sink(), bus]))
+
+    The ordering of the plain stores relies on the store order of the
+    x86-64 memory model.
+    """
+
+    def __init__(self, name=BUS_NAME, capacity=CAPACITY):
+        size = HEADER_SIZE + capacity * SLOT_DTYPE.itemsize
+        self.memory = shared_memory.SharedMemory(
+            name=name, create=True, size=size
+        )
+        self.name = self.memory.name
+        self.capacity = capacity
+        self._buf = self.memory.buf
+        self._head = 0
+        HEADER.pack_into(self._buf, 0, MAGIC, capacity, 0, 0)
+
+    def put(self, tick):
+        ticket = self._head
+        offset = HEADER_SIZE + (ticket % self.capacity) * SLOT_DTYPE.itemsize
+        buf = self._buf
+        SEQ.pack_into(buf, offset, 2 * ticket + 1)
+        TICK.pack_into(
+            buf, offset + SEQ.size,
+            tick.get("ns") or tick["timestamp"] * 1000000000,
+            float(tick["price"]),
+            tick.get("size", 0),
+            tick.get("tick_type", 0),
+            tick["symbol"].encode(),
+        )
+        SEQ.pack_into(buf, offset, 2 * ticket + 2)
+        self._head = ticket + 1
+        SEQ.pack_into(buf, HEAD_OFFSET, self._head)
+        return True
+
+    def close(self, timeout=None):
+        if self._buf is None:
+            return
+        SEQ.pack_into(self._buf, CLOSED_OFFSET, 1)
+        self._buf = None
+        self.memory.close()
+        self.memory.unlink()
+        logger.debug("Tick bus %s closed after %d ticks",
+                     self.name, self._head)
+
+
+class TickBusReader:
+    """
+    Reads the ticks of a TickBus at its own pace
+
+        reader = TickBusReader()
+        while not reader.closed:
+            for tick in reader.ticks(timeout=1):
+                ...
+
+    Params:
+        from_start: begin with the oldest tick still in the ring rather
+            than with the next one published
+
+    Attributes:
+        lost: ticks overwritten before this reader got to them
+    """
+
+    def __init__(self, name=BUS_NAME, from_start=False):
+        self.memory = _attach(name)
+        magic, capacity, head, _ = HEADER.unpack_from(self.memory.buf, 0)
+        if magic != MAGIC:
+            self.memory.close()
+            raise ValueError(f"{name} is not a tick bus")
+        self.capacity = capacity
+        self._header = np.ndarray(
+            (4,), dtype="<u8", buffer=self.memory.buf
+        )
+        self._ring = np.ndarray(
+            (capacity,), dtype=SLOT_DTYPE, buffer=self.memory.buf,
+            offset=HEADER_SIZE,
+        )
+        self.position = max(head - capacity, 0) if from_start else head
+        self.lost = 0
+
+    @property
+    def closed(self):
+        return bool(self._header[3])
+
+    def pending(self):
+        return int(self._header[2]) - self.position
+
+    def read(self, max_ticks=None):
+        """
+        Copies the ticks published since the previous read
+
+        Return
+            structured array of SLOT_DTYPE, possibly empty
+        """
+        head = int(self._header[2])
+        if head - self.position > self.capacity:
+            self.lost += head - self.capacity - self.position
+            self.position = head - self.capacity
+        if max_ticks is not None:
+            head = min(head, self.position + max_ticks)
+
+        if head <= self.position:
+            return self._ring[:0].copy()
+
+        tickets = np.arange(self.position, head, dtype=np.uint64)
+        index = tickets % self.capacity
+        expected = 2 * tickets + 2
+        before = self._ring["seq"][index]
+        slots = self._ring[index]
+        after = self._ring["seq"][index]
+        valid = (before == expected) & (after == expected)
+
+        self.lost += int(len(valid) - np.count_nonzero(valid))
+        self.position = head
+        return slots[valid]
+
+    def ticks(self, max_ticks=None, timeout=0.0, poll_interval=0.001):
+        """
+        Same as read but as tick dicts like the ones of
+        IBWrapper.tickPrice, waiting up to timeout seconds for the
+        first one
+        """
+        deadline = time.monotonic() + timeout
+        while not self.pending() and time.monotonic() < deadline \
+                and not self.closed:
+            time.sleep(poll_interval)
+
+        slots = self.read(max_ticks)
+        return [
+            {
+                "symbol": symbol.decode(),
+                "timestamp": ns // 1000000000,
+                "ns": ns,
+                "price": price,
+                "size": size,
+                "tick_type": tick_type,
+            }
+            for symbol, ns, price, size, tick_type in zip(
+                slots["symbol"].tolist(), slots["ns"].tolist(),
+                slots["price"].tolist(), slots["size"].tolist(),
+                slots["tick_type"].tolist(),
+            )
+        ]
+
+    def pump(self, sink, poll_interval=0.001):
+        """
+        Hands every tick to a sink (e.g. an IndicatorEngine) until the
+        bus is closed, then closes the sink
+        """
+        try:
+            while not self.closed:
+                for tick in self.ticks(timeout=1, poll_interval=poll_interval):
+                    sink.put(tick)
+            for tick in self.ticks():
+                sink.put(tick)
+        finally:
+            sink.close()
+
+    def close(self):
+        self._header = self._ring = None
+        self.memory.close()
@@ -0,0 +1,143 @@
+import os
+
+import numpy as np
+
+from .utils import setup_log
+
+
+TICK_STORE_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(os.path.dirname(__file__))), "ticks"
+)
+
+# one append-only file of fixed-width values per column
+COLUMNS = {
+    "timestamp": np.dtype("<i8"),
+    "price": np.dtype("<f8"),
+    "size": np.dtype("<i8"),
+    "tick_type": np.dtype("<i4"),
+}
+
+logger = setup_log(__name__, "local")
+
+
+class TickStore:
+    """
+    Local on-disk tick store, an alternative to the DynamoDB "stock"
+    table.
+
+    Every symbol gets a directory holding one append-only file per
+    column (see COLUMNS). Reads memory-map the column files, so slicing
+    a time range returns views on the page cache rather than copies.
+    Ticks are expected to be appended in timestamp order, which is what
+    the stream produces, so that time ranges can be found by binary
+    search on the timestamp column.
+
+    The store is also a writer for common.sink.BufferedSink:
+
+        sink = BufferedSink(TickStore(root))
+    """
+
+    def __init__(self, root=TICK_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _column_path(self, symbol, column):
+        return os.path.join(self.root, symbol, f"{column}.bin")
+
+    def symbols(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def append(self, symbol, timestamp, price, size=0, tick_type=0):
+        """
+        Appends ticks for one symbol. Every argument is either a scalar
+        or a sequence of the same length as timestamp.
+        """
+        timestamp = np.atleast_1d(
+            np.asarray(timestamp, dtype=COLUMNS["timestamp"])
+        )
+        values = {"timestamp": timestamp}
+        for column, value in (("price", price), ("size", size),
+                              ("tick_type", tick_type)):
+            values[column] = np.broadcast_to(
+                np.asarray(value, dtype=COLUMNS[column]), timestamp.shape
+            )
+
+        os.makedirs(os.path.join(self.root, symbol), exist_ok=True)
+        # timestamp goes last so that a partially written append is
+        # never visible to readers, see count
+        for column in ("price", "size", "tick_type", "timestamp"):
+            with open(self._column_path(symbol, column), "ab") as fout:
+                fout.write(np.ascontiguousarray(values[column]).tobytes())
+
+    def __call__(self, ticks):
+        """
+        Writes a batch of tick dicts as produced by IBWrapper.tickPrice
+        """
+        by_symbol = {}
+        for tick in ticks:
+            by_symbol.setdefault(tick["symbol"], []).append(tick)
+
+        for symbol, records in by_symbol.items():
+            self.append(
+                symbol,
+                [record["timestamp"] for record in records],
+                [float(record["price"]) for record in records],
+                [record.get("size", 0) for record in records],
+                [record.get("tick_type", 0) for record in records],
+            )
+
+    def count(self, symbol):
+        """
+        Number of complete ticks stored for a symbol
+        """
+        counts = []
+        for column, dtype in COLUMNS.items():
+            path = self._column_path(symbol, column)
+            if not os.path.exists(path):
+                return 0
+            counts.append(os.path.getsize(path) // dtype.itemsize)
+        return min(counts)
+
+    def columns(self, symbol, start=None, end=None):
+        """
+        Returns the ticks of a symbol between start and end (inclusive)
+        as a dict of read-only NumPy arrays backed by the column files
+
+        Params:
+            start, end: timestamps bounding the slice, None for open ended
+        """
+        length = self.count(symbol)
+        if length == 0:
+            return {
+                column: np.empty(0, dtype=dtype)
+                for column, dtype in COLUMNS.items()
+            }
+
+        arrays = {
+            column: np.memmap(
+                self._column_path(symbol, column), dtype=dtype,
+                mode="r", shape=(length,),
+            )
+            for column, dtype in COLUMNS.items()
+        }
+
+        timestamps = arrays["timestamp"]
+        lo, hi = 0, length
+        if start is not None:
+            lo = np.searchsorted(timestamps, start, side="left")
+        if end is not None:
+            hi = np.searchsorted(timestamps, end, side="right")
+        return {column: array[lo:hi] for column, array in arrays.items()}
+
+    def to_frame(self, symbol, start=None, end=None):
+        """
+        Same as columns but wrapped in a DataFrame without copying the
+        column arrays
+        """
+        import pandas as pd
+
+        data = self.columns(symbol, start, end)
+        return pd.DataFrame(data, copy=False)
@@ -1,6 +1,6 @@
 import queue
 import time
-from threading import Thread
+from threading import Event, Thread
 
 from ibapi.wrapper import EWrapper
 from ibapi.client import EClient
@@ -8,11 +8,20 @@ from ibapi.contract import Contract
 from ibapi.order import Order
 from ibapi.utils import iswrapper
 
+from . import metrics
+from .events import RequestEvents, is_notice
 from .utils import setup_log
 
 
 logger = setup_log(__name__, "local")
 
+order_ack_seconds = metrics.histogram(
+    "order_ack_seconds", "Time from placeOrder to the first orderStatus"
+)
+order_fill_seconds = metrics.histogram(
+    "order_fill_seconds", "Time from placeOrder to the Filled status"
+)
+
 
 class IBWrapper(EWrapper):
 
@@ -24,6 +33,8 @@ class IBWrapper(EWrapper):
             f"that says {errorString}"
         )
         self.my_errors_queue.put(errormessage)
+        if not is_notice(errorCode):
+            self.order_events.fail(id, errormessage)
 
     @iswrapper
     def currentTime(self, server_time):
@@ -33,6 +44,7 @@ class IBWrapper(EWrapper):
     def nextValidId(self, orderId: int):
         super().nextValidId(orderId)
         self.nextOrderId = orderId
+        self.connection_ready.set()
 
     @iswrapper
     def orderStatus(
@@ -55,6 +67,7 @@ class IBWrapper(EWrapper):
             "MktCapPrice": mktCapPrice
         }
         logger.debug(data)
+        self.order_events.set(orderId)
 
     def init_error(self):
         error_queue = queue.Queue()
@@ -77,6 +90,20 @@ class IBWrapper(EWrapper):
         self.my_time_queue = time_queue
         return time_queue
 
+    def init_events(self):
+        # set by nextValidId, which the server sends once connected
+        self.connection_ready = Event()
+        self.order_events = RequestEvents()
+
+    def wait_until_ready(self, timeout=10):
+        """
+        Blocks until the connection is up and nextOrderId is known
+
+        Return
+            False if the server did not answer within timeout seconds
+        """
+        return self.connection_ready.wait(timeout)
+
 
 class IBClient(EClient):
 
@@ -112,6 +139,7 @@ class IBApp(IBWrapper, IBClient):
 
     def __init__(self, ipaddress, portid, clientid):
         self.init_error()
+        self.init_events()
 
         IBWrapper.__init__(self)
         IBClient.__init__(self, wrapper=self)
@@ -159,15 +187,21 @@ def orderCreate(action: str, quantity: int):
     return order
 
 
-def orderExecution(symbol: str, action: str, quantity: int):
+def orderExecution(symbol: str, action: str, quantity: int, app_cls=IBApp):
     """
     Places the order with the returned contract and order objects
+
+    app_cls: the app class to connect with, e.g. one mixing in
+      common.fakeib.FakeIB to run without a server
     """
     logger.debug("Connecting to the server...")
-    app = IBApp("127.0.0.1", 7497, 0)
+    app = app_cls("127.0.0.1", 7497, 0)
 
     logger.debug("Waiting to initializing next order ID")
-    time.sleep(3)
+    if not app.wait_until_ready(timeout=3):
+        logger.debug("No order ID received, disconnecting")
+        app.disconnect()
+        return
 
     logger.debug("Constructing contract")
     contractObject = create_contract(symbol)
@@ -176,10 +210,19 @@ def orderExecution(symbol: str, action: str, quantity: int):
     orderObject = orderCreate(action, quantity)
 
     logger.debug("Placing order")
-    app.placeOrder(app.nextOrderId, contractObject, orderObject)
+    orderId = app.nextOrderId
+    app.order_events.expect(orderId)
+    started = time.perf_counter_ns()
+    app.placeOrder(orderId, contractObject, orderObject)
 
     logger.debug("Waiting for response")
-    time.sleep(5)
+    answered, error = app.order_events.wait(orderId, timeout=5)
+    if answered and not error:
+        order_ack_seconds.record_ns(time.perf_counter_ns() - started)
+    if not answered:
+        logger.debug("No response for order %s", orderId)
+    elif error:
+        logger.debug(error)
 
     logger.debug("Disconnecting from the server...")
     app.disconnect()
@@ -0,0 +1,187 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from .utils import setup_log
+
+
+TRADING_DAYS = 252
+
+logger = setup_log(__name__, "local")
+
+
+def rolling_means(close, windows):
+    """
+    Simple moving averages of close for every window, computed from a
+    single cumulative sum
+
+    Return
+        array of shape (len(windows), len(close)), NaN until a window
+        is filled
+    """
+    close = np.asarray(close, dtype=np.float64)
+    csum = np.concatenate(([0.0], np.cumsum(close)))
+    means = np.full((len(windows), len(close)), np.nan)
+    for row, window in enumerate(windows):
+        if window <= len(close):
+            sums = csum[window:] - csum[:-window]
+            means[row, window - 1:] = sums / window
+    return means
+
+
+def _ffill_nonzero(values):
+    """
+    Replaces zeros (and NaNs) by the last non-zero value along axis 1,
+    zero before the first one
+    """
+    valid = (values != 0) & ~np.isnan(values)
+    index = np.where(valid, np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = np.take_along_axis(values, index, axis=1)
+    seen = np.maximum.accumulate(valid, axis=1)
+    return np.where(seen, filled, 0.0)
+
+
+def crossover(fast, slow):
+    """
+    Crossover signal matching backtrader's CrossOver indicator: +1 when
+    fast crosses slow upwards, -1 downwards, 0 otherwise. Rows are
+    independent series.
+    """
+    diff = fast - slow
+    nonzero = _ffill_nonzero(diff)
+    signal = np.zeros(diff.shape, dtype=np.int8)
+    with np.errstate(invalid="ignore"):
+        up = (nonzero[:, :-1] < 0) & (diff[:, 1:] > 0)
+        down = (nonzero[:, :-1] > 0) & (diff[:, 1:] < 0)
+    signal[:, 1:] = up.astype(np.int8) - down.astype(np.int8)
+    return signal
+
+
+def positions(signal):
+    """
+    Long/flat position decided at each bar close: long after an upward
+    cross until the next downward cross, like SmaCross
+    """
+    state = _ffill_nonzero(signal.astype(np.float64))
+    return (state > 0).astype(np.float64)
+
+
+def bar_pnl(open_, close, position, stake=1):
+    """
+    Per bar profit of positions decided on the close and filled at the
+    next bar's open, as backtrader fills market orders
+    """
+    held = np.zeros(position.shape)
+    held[:, 1:] = position[:, :-1]
+    before = np.zeros(position.shape)
+    before[:, 1:] = held[:, :-1]
+
+    gap = np.zeros(len(close))
+    gap[1:] = open_[1:] - close[:-1]
+    return stake * (before * gap + held * (close - open_))
+
+
+def sweep(data, fast_windows, slow_windows, cash=10000.0, stake=1):
+    """
+    Runs the SmaCross strategy for every (pfast, pslow) pair with
+    pfast < pslow in one vectorized pass
+
+    Params:
+        data: mapping with "open" and "close" arrays, e.g. from
+            common.bar_store.read_bars or a DataFrame
+        fast_windows, slow_windows: candidate pfast and pslow values
+        cash: starting cash used for returns and drawdown
+        stake: number of shares per trade
+
+    Return
+        DataFrame with pfast, pslow, pnl, sharpe, max_drawdown and
+        trades per pair, sorted by pnl
+    """
+    open_ = np.asarray(data["open"], dtype=np.float64)
+    close = np.asarray(data["close"], dtype=np.float64)
+
+    windows = sorted(set(fast_windows) | set(slow_windows))
+    means = rolling_means(close, windows)
+    row = {window: i for i, window in enumerate(windows)}
+    pairs = [
+        (fast, slow) for fast in sorted(set(fast_windows))
+        for slow in sorted(set(slow_windows)) if fast < slow
+    ]
+    if not pairs:
+        raise ValueError("No pair with pfast < pslow in the grid")
+
+    fast = means[[row[pair[0]] for pair in pairs]]
+    slow = means[[row[pair[1]] for pair in pairs]]
+    signal = crossover(fast, slow)
+    position = positions(signal)
+    pnl = bar_pnl(open_, close, position, stake)
+
+    equity = cash + np.cumsum(pnl, axis=1)
+    previous = np.concatenate(
+        (np.full((len(pairs), 1), cash), equity[:, :-1]), axis=1
+    )
+    returns = pnl / previous
+    std = returns.std(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(
+            std > 0, returns.mean(axis=1) / std * math.sqrt(TRADING_DAYS),
+            np.nan,
+        )
+    peak = np.maximum.accumulate(np.maximum(equity, cash), axis=1)
+    drawdown = ((peak - equity) / peak).max(axis=1)
+    entries = np.diff(position, axis=1, prepend=0) > 0
+    # an entry decided on the last bar is never filled
+    entries[:, -1] = False
+
+    results = pd.DataFrame({
+        "pfast": [pair[0] for pair in pairs],
+        "pslow": [pair[1] for pair in pairs],
+        "pnl": equity[:, -1] - cash,
+        "sharpe": sharpe,
+        "max_drawdown": drawdown,
+        "trades": entries.sum(axis=1),
+    })
+    return results.sort_values("pnl", ascending=False, ignore_index=True)
+
+
+def crosscheck(data, pfast, pslow, cash=10000.0, stake=1, rtol=1e-6):
+    """
+    Runs SmaCross through backtrader for one parameter pair and asserts
+    that its final profit matches the vectorized engine
+
+    Params:
+        data: mapping with "date" (epoch seconds), "open", "high",
+            "low", "close" and "volume" arrays
+
+    Return
+        (vectorized pnl, backtrader pnl)
+    """
+    # backtrader is only needed for the cross check
+    import backtrader as bt
+    from .backtesting import SmaCross
+
+    frame = pd.DataFrame({
+        name: np.asarray(data[name])
+        for name in ("open", "high", "low", "close", "volume")
+    }, index=pd.to_datetime(np.asarray(data["date"]), unit="s"))
+
+    cerebro = bt.Cerebro()
+    cerebro.adddata(bt.feeds.PandasData(dataname=frame, openinterest=None))
+    cerebro.addstrategy(SmaCross, pfast=pfast, pslow=pslow)
+    cerebro.addsizer(bt.sizers.FixedSize, stake=stake)
+    cerebro.broker.setcash(cash)
+    cerebro.run()
+    expected = cerebro.broker.getvalue() - cash
+
+    result = sweep(data, [pfast], [pslow], cash=cash, stake=stake)
+    actual = float(result["pnl"].iloc[0])
+    logger.debug(
+        "SmaCross(%s, %s) pnl vectorized %s backtrader %s",
+        pfast, pslow, actual, expected,
+    )
+    assert math.isclose(actual, expected, rel_tol=rtol, abs_tol=1e-6), (
+        f"Vectorized pnl {actual} differs from backtrader pnl {expected}"
+    )
+    return actual, expected
@@ -0,0 +1,99 @@
+"""
+Compares the per-record Decimal helpers of common.utils with the batch
+codec of common.codec, on decoding table items into columns and on
+encoding columns into items for writes.
+
+Items of ticks are not encoded in batches: copying each item costs as
+much as converting its floats, so common.codec.encode_item converts
+them one at a time.
+
+    python -m script.bench_codec --records 1000000
+"""
+import argparse
+import random
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from common.codec import columns_to_items, items_to_columns
+from common.ingest import SortKeys
+from common.utils import convert_decimal_to_float
+
+
+# sort keys are fractional seconds, see common.ingest.SortKeys
+DTYPES = {"timestamp": "<f8", "price": "<f8", "tick_type": "<i4"}
+
+
+def make_items(records):
+    keys = SortKeys()
+    start = 1600000000 * 10 ** 9
+    return [
+        {
+            "symbol": "AAPL",
+            # about a thousand ticks per second
+            "timestamp": keys.next("AAPL", start + index * 10 ** 6),
+            "price": Decimal(str(round(random.uniform(100, 200), 2))),
+            "tick_type": Decimal(random.choice((1, 2, 4))),
+        }
+        for index in range(records)
+    ]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def decode_per_record(items):
+    records = [convert_decimal_to_float(dict(item)) for item in items]
+    return pd.DataFrame(records)
+
+
+def decode_columns(items):
+    return pd.DataFrame(items_to_columns(items, DTYPES), copy=False)
+
+
+def columns_per_record(columns):
+    return [
+        {
+            "timestamp": Decimal(str(timestamp)),
+            "price": Decimal(str(price)),
+            "tick_type": Decimal(str(tick_type)),
+        }
+        for timestamp, price, tick_type in zip(
+            columns["timestamp"], columns["price"], columns["tick_type"]
+        )
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+
+    items = make_items(args.records)
+    columns = items_to_columns(items, DTYPES)
+
+    for name, baseline, batch, data in (
+            ("decode", decode_per_record, decode_columns, items),
+            ("encode columns", columns_per_record, columns_to_items,
+             columns),
+    ):
+        before = timed(baseline, data)
+        after = timed(batch, data)
+        print(
+            f"{name}: {args.records} records, per record {before:.3f}s, "
+            f"batch {after:.3f}s, speedup {before / after:.1f}x"
+        )
+
+    expected = decode_per_record(items)
+    assert np.array_equal(columns["price"], expected["price"].to_numpy())
+    # ticks of the same second keep distinct keys
+    assert len(np.unique(columns["timestamp"])) == args.records
+
+
+if __name__ == "__main__":
+    main()
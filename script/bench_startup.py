@@ -0,0 +1,89 @@
+"""
+Startup time of the CLI commands and of the common modules, each run
+in a fresh interpreter without AWS credentials or region, which also
+checks that nothing talks to AWS at import time.
+
+    python -m script.bench_startup
+    python -m script.bench_startup --limit-ms 150
+
+With --limit-ms, the script exits with status 1 when placing an order
+against the fake gateway takes longer than that on top of the bare
+interpreter start.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+CASES = {
+    "interpreter": ["-c", "pass"],
+    "cli_help": ["cli.py", "--help"],
+    "order": ["cli.py", "order", "AAPL", "BUY", "1", "--fake"],
+    "import_common.trade": ["-c", "import common.trade"],
+    "import_common.stream": ["-c", "import common.stream"],
+    "import_common.query": ["-c", "import common.query"],
+    "import_common.historical_data": [
+        "-c", "import common.historical_data"
+    ],
+}
+
+
+def clean_env():
+    env = {
+        key: value for key, value in os.environ.items()
+        if not key.startswith("AWS_")
+    }
+    env["AWS_CONFIG_FILE"] = os.devnull
+    env["AWS_SHARED_CREDENTIALS_FILE"] = os.devnull
+    return env
+
+
+def run(args, repeat, env):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args], cwd=ROOT_DIR, env=env, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument(
+        "--limit-ms", type=float,
+        help="largest accepted order startup over the interpreter's",
+    )
+    args = parser.parse_args()
+
+    env = clean_env()
+    results = {}
+    for name, case in CASES.items():
+        results[name] = {"median_ms": run(case, args.repeat, env)}
+    base = results["interpreter"]["median_ms"]
+    for name, result in results.items():
+        result["over_interpreter_ms"] = result["median_ms"] - base
+        print(f"{name:32} {result['median_ms']:8.1f} ms "
+              f"(+{result['over_interpreter_ms']:.1f})")
+
+    if args.output:
+        with open(args.output, "w") as fout:
+            json.dump(results, fout, indent=2)
+
+    if args.limit_ms is not None and \
+            results["order"]["over_interpreter_ms"] > args.limit_ms:
+        print(f"order startup over the limit of {args.limit_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
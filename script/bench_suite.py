@@ -0,0 +1,265 @@
+"""
+Benchmarks the hot paths of the project against the fake IB gateway of
+common.fakeib, so no TWS is needed, and writes a JSON report.
+
+    python -m script.bench_suite --output bench_report.json
+    python -m script.bench_suite --compare bench_report.json
+
+With --compare, the run is checked against a previous report and the
+script exits with status 1 when a benchmark got slower than the
+tolerance allows.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from common.backtesting import SmaCross
+from common.fakeib import FakeGateway, FakeIB
+from common.feeds import IBBarData
+from common.historical_data import TestApp
+from common.sink import BufferedSink
+from common.stream import IBApp as StreamApp
+from common.tickstore import TickStore
+from common.trade import IBApp as TradeApp, create_contract, orderExecution
+
+
+SYMBOLS = ("AAPL", "TSLA", "MSFT", "AMZN")
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silences the per-message logging and prints of the apps, which
+    would otherwise be what gets measured
+    """
+    loggers = [
+        logging.getLogger(name) for name in
+        ("common.stream", "common.trade", "common.sink")
+    ]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.WARNING)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p99_ms": samples[min(int(len(samples) * 0.99),
+                              len(samples) - 1)] * 1000,
+    }
+
+
+def bench_tick_ingest(ticks):
+    """
+    Ticks per second from IBWrapper.tickPrice through a BufferedSink
+    into a TickStore
+    """
+    per_symbol = ticks // len(SYMBOLS)
+
+    class FakeStreamApp(FakeIB, StreamApp):
+        gateway = FakeGateway(tick_rate=None, ticks=per_symbol)
+
+    with tempfile.TemporaryDirectory() as root, quiet():
+        sink = BufferedSink(TickStore(root), batch_size=1000,
+                            maxsize=ticks)
+        app = FakeStreamApp("127.0.0.1", 7497, 0, sink=sink,
+                            log_ticks=False)
+        app.wait_until_ready()
+        start = time.perf_counter()
+        for symbol in SYMBOLS:
+            app.stream(create_contract(symbol), wait=False)
+        while sink.accepted + sink.dropped < per_symbol * len(SYMBOLS):
+            time.sleep(0.001)
+        app.disconnect()
+        sink.close()
+        elapsed = time.perf_counter() - start
+
+    return {
+        "metric": "ticks_per_second",
+        "value": sink.written / elapsed,
+        "higher_is_better": True,
+        "ticks": sink.written,
+        "dropped": sink.dropped,
+        "seconds": elapsed,
+    }
+
+
+def bench_historical(requests, bars):
+    """
+    Latency of get_IB_historical_data, resolving the contract first
+    """
+
+    class FakeHistApp(FakeIB, TestApp):
+        gateway = FakeGateway(bars=bars)
+
+    samples = []
+    with quiet():
+        app = FakeHistApp("127.0.0.1", 7497, 1)
+        try:
+            contract = app.resolve_ib_contract(create_contract("AAPL"))
+            for _ in range(requests):
+                start = time.perf_counter()
+                app.get_IB_historical_data(contract)
+                samples.append(time.perf_counter() - start)
+        finally:
+            app.disconnect()
+
+    result = summary(samples)
+    result.update({
+        "metric": "p50_ms",
+        "value": result["p50_ms"],
+        "higher_is_better": False,
+        "bars": bars,
+    })
+    return result
+
+
+def bench_orders(orders, ack_delay):
+    """
+    Round trip of orderExecution: connect, place, first status,
+    disconnect
+    """
+
+    class FakeTradeApp(FakeIB, TradeApp):
+        gateway = FakeGateway(ack_delay=ack_delay, fill_delay=ack_delay)
+
+    samples = []
+    with quiet():
+        for _ in range(orders):
+            start = time.perf_counter()
+            orderExecution("AAPL", "BUY", 1, app_cls=FakeTradeApp)
+            samples.append(time.perf_counter() - start)
+
+    result = summary(samples)
+    result.update({
+        "metric": "p50_ms",
+        "value": result["p50_ms"],
+        "higher_is_better": False,
+        "ack_delay_ms": ack_delay * 1000,
+    })
+    return result
+
+
+def bench_backtest(bars):
+    """
+    Bars per second of a SmaCross backtest over a random walk
+    """
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, bars))
+    close = np.maximum(close, 1)
+    frame = pd.DataFrame(
+        {
+            "open": close,
+            "high": close + 0.5,
+            "low": np.maximum(close - 0.5, 0.01),
+            "close": close,
+            "volume": rng.integers(1000, 100000, bars),
+        },
+        index=pd.date_range("2000-01-01", periods=bars, freq="D"),
+    )
+
+    cerebro = bt.Cerebro()
+    cerebro.adddata(IBBarData(dataname=frame))
+    cerebro.addstrategy(SmaCross)
+    start = time.perf_counter()
+    cerebro.run()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "metric": "bars_per_second",
+        "value": bars / elapsed,
+        "higher_is_better": True,
+        "bars": bars,
+        "seconds": elapsed,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return
+        names of the benchmarks slower than baseline by more than
+        tolerance (a fraction)
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or previous["metric"] != result["metric"]:
+            continue
+        ratio = result["value"] / previous["value"]
+        if not result["higher_is_better"]:
+            ratio = 1 / ratio
+        print(f"{name}: {ratio:.2f}x of baseline")
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--compare", help="previous report to check")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--ticks", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--bars", type=int, default=2500)
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--ack-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    # read first, the output may overwrite the baseline
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fin:
+            baseline = json.load(fin)
+
+    results = {}
+    for name, bench, bench_args in (
+            ("tick_ingest", bench_tick_ingest, (args.ticks,)),
+            ("historical", bench_historical, (args.requests, args.bars)),
+            ("orders", bench_orders, (args.orders, args.ack_delay)),
+            ("backtest", bench_backtest, (args.bars,)),
+    ):
+        results[name] = bench(*bench_args)
+        print(f"{name}: {results[name]['metric']} "
+              f"{results[name]['value']:.1f}")
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc)
+        .isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as fout:
+        json.dump(report, fout, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,20 @@
-import boto3
+import argparse
 
+import boto3
 
-# main index
-table_name = "stock"
-partition_key = "symbol"
-sort_key = "timestamp"
+from common.schema import SCHEMAS, TTL_DAYS, make_schema
 
 
-def create_table():
-    dynamodb = boto3.resource("dynamodb")
-    dynamodb.create_table(
-        AttributeDefinitions=[
-            {"AttributeName": partition_key, "AttributeType": "S"},
-            {"AttributeName": sort_key,      "AttributeType": "N"},
-        ],
-        TableName=table_name,
-        KeySchema=[
-            {"AttributeName": partition_key, "KeyType": "HASH"},
-            {"AttributeName": sort_key,      "KeyType": "RANGE"},
-        ],
-        BillingMode="PAY_PER_REQUEST",
+def create_table(schema=None, endpoint_url=None):
+    """
+    schema: layout from common.schema, the legacy "stock" table by
+      default
+    endpoint_url: e.g. http://localhost:8000 for DynamoDB Local
+    """
+    schema = schema if schema is not None else make_schema()
+    dynamodb = boto3.resource("dynamodb", endpoint_url=endpoint_url)
+    return schema.create_table(
+        dynamodb,
         SSESpecification={
             "Enabled": False,
         },
@@ -37,4 +32,18 @@ def create_table():
 
 
 if __name__ == "__main__":
-    create_table()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--schema", choices=SCHEMAS, default="legacy")
+    parser.add_argument("--table")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument(
+        "--ttl-days", type=int, default=TTL_DAYS,
+        help="days raw ticks are kept in a bucketed table, 0 for ever",
+    )
+    parser.add_argument("--endpoint-url")
+    args = parser.parse_args()
+
+    create_table(
+        make_schema(args.schema, args.table, args.shards, args.ttl_days),
+        args.endpoint_url,
+    )
@@ -0,0 +1,111 @@
+"""
+Copies the ticks of the legacy "stock" table (one partition per symbol)
+into a bucketed table (one partition per symbol and day, optionally
+sharded, with a TTL attribute), see common.schema.BucketedSchema.
+
+    python -m script.migrate_ticks --create --shards 4
+    python -m script.migrate_ticks --endpoint-url http://localhost:8000
+
+The source is read with a parallel scan, one thread and boto3 session
+per segment, and written with batch writes. Keys are derived from the
+ticks only, so the copy can be interrupted and run again, and keeps
+going while the stream writes new ticks to the bucketed table. Ticks
+whose TTL has already passed are skipped.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from common.schema import TTL_DAYS, LegacySchema, make_schema
+from common.sink import DynamoDBWriter
+from common.utils import setup_log
+
+
+SEGMENTS = 8
+BATCH_SIZE = 500
+
+logger = setup_log(__name__, "local")
+
+
+def migrate_segment(segment, segments, source, target, endpoint_url):
+    """
+    Return
+        (ticks copied, ticks skipped as expired)
+    """
+    dynamodb = boto3.session.Session().resource(
+        "dynamodb", endpoint_url=endpoint_url
+    )
+    source_table = dynamodb.Table(source.table_name)
+    writer = DynamoDBWriter(dynamodb.Table(target.table_name),
+                            schema=target)
+    now = time.time()
+    ttl_days = getattr(target, "ttl_days", None)
+
+    copied = skipped = 0
+    kwargs = {"Segment": segment, "TotalSegments": segments}
+    while True:
+        response = source_table.scan(**kwargs)
+        items = response["Items"]
+        if ttl_days is not None:
+            live = [
+                item for item in items
+                if target.expires_at(item[source.sort_attribute]) > now
+            ]
+            skipped += len(items) - len(live)
+            items = live
+        for lo in range(0, len(items), BATCH_SIZE):
+            writer(items[lo:lo + BATCH_SIZE])
+        copied += len(items)
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return copied, skipped
+        kwargs["ExclusiveStartKey"] = last_key
+
+
+def migrate(source, target, segments=SEGMENTS, endpoint_url=None):
+    """
+    Return
+        (ticks copied, ticks skipped as expired)
+    """
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        results = list(pool.map(
+            lambda segment: migrate_segment(
+                segment, segments, source, target, endpoint_url
+            ),
+            range(segments),
+        ))
+    copied = sum(result[0] for result in results)
+    skipped = sum(result[1] for result in results)
+    logger.debug("Copied %d ticks from %s to %s, %d expired", copied,
+                 source.table_name, target.table_name, skipped)
+    return copied, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source-table", default="stock")
+    parser.add_argument("--target-table", default="stock_ticks")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument(
+        "--ttl-days", type=int, default=TTL_DAYS,
+        help="days raw ticks are kept, 0 for ever",
+    )
+    parser.add_argument("--segments", type=int, default=SEGMENTS)
+    parser.add_argument(
+        "--create", action="store_true",
+        help="create the target table first",
+    )
+    parser.add_argument("--endpoint-url",
+                        help="e.g. http://localhost:8000 for DynamoDB Local")
+    args = parser.parse_args()
+
+    source = LegacySchema(args.source_table)
+    target = make_schema("bucketed", args.target_table, args.shards,
+                         args.ttl_days)
+    if args.create:
+        from script.create_dynamo_db import create_table
+
+        create_table(target, args.endpoint_url)
+    migrate(source, target, args.segments, args.endpoint_url)
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from common.aio import AsyncIBApp
+from common.fakeib import FakeGateway, FakeIB
+from common.trade import create_contract
+
+
+class FakeAsyncApp(FakeIB, AsyncIBApp):
+    gateway = FakeGateway(tick_rate=1000, ack_delay=0.5)
+
+
+def test_leaving_a_subscription_cancels_it():
+
+    async def main():
+        app = await FakeAsyncApp.create("127.0.0.1", 7497, 2)
+        try:
+            async with app.subscribe(create_contract("AAPL")) as ticks:
+                async for tick in ticks:
+                    assert tick["symbol"] == "AAPL"
+                    break
+                reqId = ticks.reqId
+            assert not app.router.active()
+            assert reqId not in app._streams
+            assert reqId not in app._fake_streams
+        finally:
+            app.disconnect()
+
+    asyncio.run(main())
+
+
+def test_order_timeout_forgets_the_order():
+
+    async def main():
+        app = await FakeAsyncApp.create("127.0.0.1", 7497, 2)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await app.place_order(create_contract("AAPL"), "BUY", 1,
+                                      timeout=0.05)
+            assert not app._orders
+        finally:
+            app.disconnect()
+
+    asyncio.run(main())
+
+
+class WarnedAsyncApp(FakeIB, AsyncIBApp):
+    gateway = FakeGateway(tick_rate=1000, ack_delay=0.05, fill_delay=0.1)
+
+    def placeOrder(self, orderId, contract, order):
+        self._fake_schedule(
+            0, self.error, orderId, 399,
+            "Order will not be placed until the market opens",
+        )
+        super().placeOrder(orderId, contract, order)
+
+
+def test_order_warning_waits_for_the_fill():
+
+    async def main():
+        app = await WarnedAsyncApp.create("127.0.0.1", 7497, 2)
+        try:
+            status = await app.place_order(
+                create_contract("AAPL"), "BUY", 1, wait_for_fill=True,
+                timeout=5,
+            )
+            assert status["Status"] == "Filled"
+            assert not app._orders
+        finally:
+            app.disconnect()
+
+    asyncio.run(main())
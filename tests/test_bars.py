@@ -0,0 +1,44 @@
+import time
+
+from common.bars import BarAggregator
+
+
+def trade(symbol, timestamp, price, size=100):
+    return {"symbol": symbol, "timestamp": timestamp, "price": price,
+            "tick_type": 4, "size": size}
+
+
+def test_flush_closes_quiet_symbols_and_drops_late_ticks():
+    closed = []
+    aggregator = BarAggregator(
+        interval=60, on_bar=lambda bar: closed.append(bar.to_tuple())
+    )
+    aggregator.put(trade("AAPL", 120.5, 10.0))
+    aggregator.put(trade("AAPL", 150.0, 11.0, size=200))
+    aggregator.flush(179.9)
+    assert closed == []
+
+    aggregator.flush(180.0)
+    assert closed == [(120, 10.0, 11.0, 10.0, 11.0, 300)]
+
+    aggregator.put(trade("AAPL", 170.0, 12.0))
+    assert aggregator.late == 1
+    aggregator.close()
+    assert len(closed) == 1
+
+
+def test_timer_closes_bars_on_the_boundary():
+    closed = []
+    aggregator = BarAggregator(
+        interval=1, on_bar=closed.append, timer=True, grace=0.01
+    )
+    try:
+        aggregator.put(trade("AAPL", time.time(), 10.0))
+        deadline = time.monotonic() + 3
+        while not closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(closed) == 1
+        assert closed[0].start + 1 <= time.time()
+    finally:
+        aggregator.close()
+    assert not aggregator._timer.is_alive()
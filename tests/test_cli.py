@@ -0,0 +1,37 @@
+import cli
+from common import stream
+from common.recorder import Recorder
+
+
+class ListSink:
+
+    def __init__(self):
+        self.ticks = []
+
+    def put(self, tick):
+        self.ticks.append(tick)
+        return True
+
+    def close(self, timeout=None):
+        pass
+
+
+def test_replay_does_not_build_contracts(tmp_path, monkeypatch):
+    path = str(tmp_path / "session.ibrec")
+    recorder = Recorder(path)
+    recorder.write("reqMktData", 1, "AAPL", ns=1)
+    recorder.write("tickPrice", 1, 4, 101.5, 0, ns=2)
+    recorder.write("tickSize", 1, 5, 300.0, ns=2)
+    recorder.close()
+
+    sink = ListSink()
+    monkeypatch.setattr(stream, "tickstore_sink", lambda: sink)
+
+    def contracts(*args):
+        raise AssertionError("a replay needs no contracts")
+
+    monkeypatch.setattr(cli, "_contracts", contracts)
+    cli.main(["stream", "--sink", "local", "--replay", path,
+              "--speed", "0"])
+    assert [(tick["symbol"], tick["price"]) for tick in sink.ticks] == \
+        [("AAPL", 101.5)]
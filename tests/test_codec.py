@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from common.codec import columns_to_items, items_to_columns, parse_numbers
+from common.ingest import SortKeys
+from common.query import decode_items
+
+
+def test_sort_keys_of_one_second_stay_distinct():
+    keys = SortKeys()
+    start = 1_700_000_000 * 10 ** 9
+    items = [
+        {"timestamp": keys.next("AAPL", start + index * 1000),
+         "price": Decimal("101.5"), "tick_type": Decimal(4)}
+        for index in range(3)
+    ]
+    columns = items_to_columns(
+        items, {"timestamp": "<f8", "price": "<f8", "tick_type": "<i4"}
+    )
+    assert len(np.unique(columns["timestamp"])) == 3
+    assert list(columns["tick_type"]) == [4, 4, 4]
+
+    wire = [
+        {field: {"N": str(value)} for field, value in item.items()}
+        for item in items
+    ]
+    assert np.array_equal(decode_items(wire)["timestamp"],
+                          columns["timestamp"])
+
+
+def test_integer_columns_refuse_to_truncate():
+    assert parse_numbers(["1700000000123456789"], "<i8")[0] == \
+        1_700_000_000_123_456_789
+    with pytest.raises(ValueError):
+        parse_numbers(["1700000000.000001"], "<i8")
+
+
+def test_columns_round_trip_to_items():
+    columns = {"price": np.array([101.5, 0.1]), "count": np.array([1, 2])}
+    items = columns_to_items(columns)
+    assert items == [
+        {"price": Decimal("101.5"), "count": Decimal(1)},
+        {"price": Decimal("0.1"), "count": Decimal(2)},
+    ]
+    assert items_to_columns(items, {"price": "<f8", "count": "<i8"})[
+        "count"].tolist() == [1, 2]
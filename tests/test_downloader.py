@@ -0,0 +1,89 @@
+from common import downloader
+from common.downloader import (
+    SMALL_BAR_PACING, BulkDownloader, SlidingWindow, csv_writer, pacing_for,
+)
+from common.fakeib import FakeGateway, FakeIB
+from common import historical_data
+from common.trade import create_contract
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_sliding_window_never_exceeds_the_ib_limit():
+    clock = FakeClock()
+    window = SlidingWindow(*SMALL_BAR_PACING, clock=clock,
+                           sleep=clock.sleep)
+    times = []
+    for _ in range(200):
+        window.acquire()
+        times.append(clock.now)
+
+    # the first 60 go out at once, then one as each leaves the window
+    assert times[59] == 0
+    assert times[60] == 600
+    for index, start in enumerate(times):
+        in_window = [t for t in times[index:] if t < start + 600]
+        assert len(in_window) <= 60
+
+
+def test_pacing_for_bar_sizes():
+    assert pacing_for("5 secs") == (60, 600)
+    assert pacing_for("1 day") != SMALL_BAR_PACING
+
+
+class CountingWindow:
+
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+
+
+class FakeHistApp(FakeIB, historical_data.TestApp):
+    gateway = FakeGateway(bars=30)
+
+
+def test_bulk_downloader_against_fake_gateway():
+    written = {}
+    window = CountingWindow()
+    app = FakeHistApp("127.0.0.1", 7497, 1)
+    try:
+        downloader = BulkDownloader(
+            app,
+            writer=lambda contract, bars: written.update(
+                {contract.symbol: bars}
+            ),
+            max_in_flight=4,
+            bucket=window,
+        )
+        symbols = ["AAPL", "TSLA", "MSFT", "AMZN", "NVDA", "META"]
+        results = downloader.run(create_contract(s) for s in symbols)
+    finally:
+        app.disconnect()
+
+    assert results == {symbol: 30 for symbol in symbols}
+    assert sorted(written) == sorted(symbols)
+    assert window.acquired == len(symbols)
+    # every lookup and historical request got its own id back
+    assert not app.router.active()
+
+
+def test_csv_writer_creates_the_data_directory(tmp_path, monkeypatch):
+    directory = str(tmp_path / "historical_data")
+    monkeypatch.setattr(downloader, "HISTORICAL_DATA_DIR", directory)
+    monkeypatch.setattr(historical_data, "HISTORICAL_DATA_DIR", directory)
+    csv_writer(create_contract("AAPL"),
+               [("20240102", 1.0, 2.0, 0.5, 1.5, 100)])
+    with open(tmp_path / "historical_data" / "AAPL.csv") as fin:
+        assert fin.read().splitlines()[1] == "20240102,1.0,2.0,0.5,1.5,100"
@@ -0,0 +1,79 @@
+from common.ingest import IngestPipeline
+
+
+class ListSink:
+
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+        return True
+
+    def close(self, timeout=None):
+        pass
+
+
+def tick(ns, price, size=None, tick_type=4):
+    tick = {"symbol": "AAPL", "ns": ns, "price": price,
+            "tick_type": tick_type, "timestamp": ns // 10 ** 9}
+    if size is not None:
+        tick["size"] = size
+    return tick
+
+
+def test_unchanged_price_is_kept_in_every_interval():
+    sink = ListSink()
+    pipeline = IngestPipeline(sink, interval=1.0)
+    for second in range(3):
+        pipeline.put(tick(second * 10 ** 9, 10.0))
+    pipeline.close()
+    assert [item["price"] for item in sink.items] == [10.0] * 3
+    assert pipeline.duplicates == 0
+
+
+def test_redelivered_tick_is_dropped_within_an_interval():
+    sink = ListSink()
+    pipeline = IngestPipeline(sink, interval=1.0, mode="ohlc")
+    pipeline.put(tick(100, 10.0, size=200))
+    # the same trade again, received later in the same interval
+    pipeline.put(tick(500_000_000, 10.0, size=200))
+    pipeline.put(tick(600_000_000, 10.5, size=100))
+    pipeline.close()
+    assert pipeline.duplicates == 1
+    assert len(sink.items) == 1
+    assert sink.items[0]["count"] == 2
+    assert sink.items[0]["volume"] == 300
+
+
+def test_redelivered_tick_is_dropped_without_conflation():
+    sink = ListSink()
+    pipeline = IngestPipeline(sink, interval=0)
+    for ns, price in [(1, 10.0), (900, 10.0), (10 ** 9, 10.0),
+                      (10 ** 9 + 1, 11.0)]:
+        pipeline.put(tick(ns, price, size=100))
+    pipeline.close()
+    assert [item["price"] for item in sink.items] == [10.0, 10.0, 11.0]
+    assert pipeline.duplicates == 1
+
+
+def test_items_carry_trade_sizes():
+    sink = ListSink()
+    pipeline = IngestPipeline(sink, interval=1.0)
+    pipeline.put(tick(1, 10.0, size=100))
+    pipeline.put(tick(2, 10.5, size=300))
+    pipeline.put(tick(3, 10.4, tick_type=1))
+    pipeline.close()
+    items = {item["tick_type"]: item for item in sink.items}
+    assert items[4]["size"] == 300
+    assert "size" not in items[1]
+
+
+def test_drop_repeats_suppresses_across_intervals():
+    sink = ListSink()
+    pipeline = IngestPipeline(sink, interval=1.0, drop_repeats=True)
+    for second, price in enumerate([10.0, 10.0, 11.0]):
+        pipeline.put(tick(second * 10 ** 9, price))
+    pipeline.close()
+    assert [item["price"] for item in sink.items] == [10.0, 11.0]
+    assert pipeline.duplicates == 1
@@ -0,0 +1,46 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from common.backtesting import SmaCross
+from common.optimize import Optimizer, rank, walk_forward_windows
+
+
+def random_bars(symbol, length=300):
+    generator = np.random.default_rng(sum(map(ord, symbol)))
+    close = 100 + np.cumsum(generator.normal(0, 1, length))
+    return {
+        "date": 1_500_000_000 + 86400 * np.arange(length, dtype="int64"),
+        "open": close,
+        "high": close + 1,
+        "low": close - 1,
+        "close": close,
+        "volume": np.full(length, 1000, dtype="int64"),
+    }
+
+
+def test_rank_follows_the_direction_of_the_metric():
+    results = pd.DataFrame({
+        "sharpe": [0.5, math.nan, 1.5],
+        "max_drawdown": [10.0, 5.0, 20.0],
+    })
+    assert list(rank(results, "sharpe")["sharpe"][:2]) == [1.5, 0.5]
+    assert list(rank(results, "max_drawdown")["max_drawdown"]) == \
+        [5.0, 10.0, 20.0]
+    assert list(rank(results, "max_drawdown", minimize=False)[
+        "max_drawdown"]) == [20.0, 10.0, 5.0]
+
+
+def test_walk_forward_picks_the_lowest_drawdown():
+    grid = {"pfast": [5, 10], "pslow": [20, 40]}
+    with Optimizer(SmaCross, ["AAPL"], loader=random_bars,
+                   max_workers=2) as optimizer:
+        folds = optimizer.walk_forward(grid, train=200, test=100,
+                                       metric="max_drawdown")
+        train_window, _ = walk_forward_windows(300, 200, 100)[0]
+        in_sample = optimizer.grid(grid, window=train_window,
+                                   metric="max_drawdown")
+    assert folds["in_sample_max_drawdown"][0] == \
+        in_sample["max_drawdown"].min()
+    assert in_sample["max_drawdown"].is_monotonic_increasing
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from common.recorder import MAGIC, Recorder, Replayer
+
+
+def test_ticks_round_trip_at_their_documented_size(tmp_path):
+    path = str(tmp_path / "session.ibrec")
+    recorder = Recorder(path)
+    recorder.write("tickPrice", 1, 4, 101.5, 0, ns=10)
+    recorder.write("tickSize", 1, 5, 300.0, ns=11)
+    recorder.close()
+    assert os.path.getsize(path) == len(MAGIC) + 33 + 29
+
+    records = list(Replayer(path))
+    assert records == [
+        (10, "tickPrice", [1, 4, 101.5, 0]),
+        (11, "tickSize", [1, 5, 300.0]),
+    ]
+    # the mapping is released after every pass
+    assert list(Replayer(path)) == records
+
+
+def test_replayer_rejects_other_files(tmp_path):
+    path = tmp_path / "ticks.csv"
+    path.write_bytes(b"symbol,price\n")
+    with pytest.raises(ValueError):
+        Replayer(str(path))
@@ -0,0 +1,47 @@
+from common.fakeib import FakeGateway, FakeIB
+from common.session import TradingApp, TradingSession
+
+
+class WarnedTradingApp(FakeIB, TradingApp):
+    """
+    Sends a 399 warning right after every order, as IB does for an
+    order placed outside regular hours
+    """
+
+    gateway = FakeGateway(ack_delay=0.05, fill_delay=0.1)
+
+    def placeOrder(self, orderId, contract, order):
+        self._fake_schedule(
+            0, self.error, orderId, 399,
+            "Order will not be placed until the market opens",
+        )
+        super().placeOrder(orderId, contract, order)
+
+
+class RejectingTradingApp(FakeIB, TradingApp):
+    gateway = FakeGateway(ack_delay=0.05, fill_delay=0.1)
+
+    def placeOrder(self, orderId, contract, order):
+        self._fake_schedule(0, self.error, orderId, 201, "Order rejected")
+        super().placeOrder(orderId, contract, order)
+
+
+def test_warning_leaves_the_order_live_until_filled():
+    with TradingSession(clientid=3, app_cls=WarnedTradingApp) as session:
+        handle = session.place_order("AAPL", "BUY", 1)
+        assert handle.wait(timeout=5)
+        assert handle.status == "Filled"
+        assert handle.error is None
+        assert len(handle.warnings) == 1
+        assert "399" in handle.warnings[0]
+        assert not session.app.handles
+        assert session.app.my_errors_queue.empty()
+
+
+def test_rejection_fails_the_order():
+    with TradingSession(clientid=3, app_cls=RejectingTradingApp) as session:
+        handle = session.place_order("AAPL", "BUY", 1)
+        assert handle.wait(timeout=5)
+        assert "201" in handle.error
+        assert handle.status is None
+        assert not session.app.handles
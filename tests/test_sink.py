@@ -0,0 +1,20 @@
+from common.bars import BarAggregator
+from common.sink import FanoutSink
+
+
+class ClosingSink:
+
+    def __init__(self):
+        self.timeouts = []
+
+    def put(self, tick):
+        return True
+
+    def close(self, timeout=None):
+        self.timeouts.append(timeout)
+
+
+def test_fanout_passes_the_close_timeout_on():
+    sinks = [ClosingSink(), ClosingSink()]
+    FanoutSink(sinks + [BarAggregator()]).close(2.5)
+    assert [sink.timeouts for sink in sinks] == [[2.5], [2.5]]
@@ -0,0 +1,60 @@
+import time
+
+from common.bars import BarAggregator
+from common.fakeib import FakeGateway, FakeIB
+from common.stream import IBApp
+from common.trade import create_contract
+
+
+class ListSink:
+
+    def __init__(self):
+        self.ticks = []
+
+    def put(self, tick):
+        self.ticks.append(tick)
+        return True
+
+    def close(self, timeout=None):
+        pass
+
+
+class FakeStreamApp(FakeIB, IBApp):
+    gateway = FakeGateway(tick_rate=None, ticks=300)
+
+
+def stream_ticks():
+    sink = ListSink()
+    app = FakeStreamApp("127.0.0.1", 7497, 0, sink=sink, log_ticks=False)
+    try:
+        app.wait_until_ready()
+        app.stream(create_contract("AAPL"), wait=False)
+        deadline = time.monotonic() + 5
+        while len(sink.ticks) < 300 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        app.disconnect()
+    return sink.ticks
+
+
+def test_trades_carry_their_size():
+    ticks = stream_ticks()
+    assert len(ticks) == 300
+    trades = [tick for tick in ticks if tick["tick_type"] == 4]
+    assert trades
+    assert all(tick["size"] > 0 for tick in trades)
+    assert all("size" not in tick for tick in ticks
+               if tick["tick_type"] != 4)
+
+
+def test_bars_get_volume_from_trade_sizes():
+    ticks = stream_ticks()
+    aggregator = BarAggregator(interval=3600)
+    for tick in ticks:
+        aggregator.put(tick)
+    buffer = aggregator.buffers["AAPL"]
+    volume = buffer.volume[buffer.position]
+    assert volume == sum(
+        tick["size"] for tick in ticks if tick["tick_type"] == 4
+    )
+    assert volume > 0